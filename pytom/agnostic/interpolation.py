@@ -1,12 +1,12 @@
-from numba import njit
+from numba import njit, prange
 
 
-@njit
+@njit(parallel=True)
 def fill_values_real_spline(src, dst, mtx):
     # dont need to pass the shape (dims_src, dims) numba works with numpy
     dims = dst.shape
 
-    for dx in range(dims[0]):
+    for dx in prange(dims[0]):
         for dy in range(dims[1]):
             for dz in range(dims[2]):
 
@@ -10,7 +10,8 @@ import pytom.lib as pytom_lib
 from typing import Union
 from pytom.gpu.initialize import xpt
 
-def read(filename, ndarray=True, order='F', keepnumpy=False, deviceID=None, dtype=None, read_optics_group=False) -> Union[xpt.NDArray[float], pytom_lib.pytom_volume.vol]:
+def read(filename, ndarray=True, order='F', keepnumpy=False, deviceID=None, dtype=None, read_optics_group=False,
+         subregion=None, mmap=False) -> Union[xpt.NDArray[float], pytom_lib.pytom_volume.vol]:
     """General reading function. Can read em, mrc, st, rec, txt, log and star file. For EM and MRC files: only support read the type float32 on little-endian machines.
 
     @param filename: file name to read.
@@ -19,6 +20,10 @@ def read(filename, ndarray=True, order='F', keepnumpy=False, deviceID=None, dtyp
     @param keepnumpy: return numpy.ndarray if True, else class depends on the init off pytom. Could be cupy.ndarray as well. Default = False
     @param deviceID: optional kw: GPU_ID of device to which the data is copied if requested. Default = None
     @param dtype: optional kw, used for reading log, star and txt files. Default = None
+    @param subregion: optional kw, [startX, startY, startZ, size_x, size_y, size_z] for em and mrc files. Only the
+    requested box is read from disk. A size of 0 extends the box to the end of the dimension. Default = None
+    @param mmap: optional kw, memory-map em and mrc files. For float32 data that stays in numpy, a lazy read-only
+    view on the file (or the subregion of it) is returned instead of a copy. Default = False
 
     @return The data from the EM file in ndarray
     """
@@ -34,10 +39,19 @@ def read(filename, ndarray=True, order='F', keepnumpy=False, deviceID=None, dtyp
     ext = ext.lower()[1:]
 
     assert filename
-    assert os.path.exists(filename)
     assert ext in allowed_formats.keys()
 
-    data = allowed_formats[ext](filename, order, keepnumpy, deviceID, dtype)
+    if not os.path.exists(filename) and ext in ('em', 'mrc', 'rec', 'st'):
+        # particles can be packed in a subtomogram stack next to their filename
+        from pytom.agnostic.subtomogram_stack import find_in_stack
+        stack = find_in_stack(filename)
+        assert stack is not None, f'{filename} does not exist'
+        data = _finish_volume(stack.read(filename), subregion, mmap, keepnumpy, deviceID)
+    elif ext in ('em', 'mrc', 'rec', 'st'):
+        data = allowed_formats[ext](filename, order, keepnumpy, deviceID, dtype, subregion=subregion, mmap=mmap)
+    else:
+        assert subregion is None and not mmap, f'subregion and mmap reading are not supported for {ext} files'
+        data = allowed_formats[ext](filename, order, keepnumpy, deviceID, dtype)
 
     if ndarray:
         return data
@@ -1690,117 +1704,168 @@ def read_txt(filename, order='F', keepnumpy=False, deviceID=None, dtype=None):
     if not success: raise Exception(f'No valid interpreter found for {filename}')
 
 
-def read_mrc(filename, order='F', keepnumpy=False, deviceID=None, dtype=None):
-    import numpy as np
-    f = open(filename, 'r')
-    try:
-        dt_header = np.dtype('int32')
-        header = np.fromfile(f, dt_header, 256)
-        x = header[0]
-        y = header[1]
-        z = header[2]
-
-        if header[23]:
-            extended_header = np.fromfile(f, np.float32, header[23] // 4)
-
-        # read the data type
-        dt = header[3]
-        default_type = False
-        if dt == 0:  # byte
-            dt_data = np.dtype('int8')
-        elif dt == 1:  # short
-            dt_data = np.dtype('int16')
-        elif dt == 2:  # long
-            dt_data = np.dtype('float32')  # little-endian, float32
-            default_type = True
-        elif dt == 4:  # float32
-            dt_data = np.dtype('complex32')
-        elif dt == 6:  # float complex
-            dt_data = np.dtype('uint16')
-        else:
-            raise Exception("Data type not supported yet!")
-
-        v = np.fromfile(f, dt_data, x * y * z)
-    finally:
-        f.close()
+def read_mrc(filename, order='F', keepnumpy=False, deviceID=None, dtype=None, subregion=None, mmap=False):
+    """Read MRC file. Data is converted to float32.
 
-    if keepnumpy:
-        volume = np.array(v.reshape((x, y, z), order=order), dtype='float32').copy()  # fortran-order array
-    else:
-        if not deviceID == None:
-            id = int(deviceID.split(":")[1])
-            xp.cuda.Device(id).use()
-        volume = xp.array(v.reshape((x, y, z), order=order), dtype=xp.float32).copy()  # fortran-order array
+    @param filename: file name to read.
+    @param subregion: optional [startX, startY, startZ, size_x, size_y, size_z], only this box is read from disk
+    @param mmap: if True the file is memory-mapped, see L{pytom.agnostic.io.read}
 
-    return volume
+    @return The data from the MRC file in ndarray
+    """
+    return _read_volume(filename, order, keepnumpy, deviceID, subregion, mmap)
 
 
-def read_em(filename, order='F', keepnumpy=False, deviceID=None, dtype=None):
+def read_em(filename, order='F', keepnumpy=False, deviceID=None, dtype=None, subregion=None, mmap=False):
     """Read EM file. Now only support read the type float32 on little-endian machines.
 
     @param filename: file name to read.
+    @param subregion: optional [startX, startY, startZ, size_x, size_y, size_z], only this box is read from disk
+    @param mmap: if True the file is memory-mapped, see L{pytom.agnostic.io.read}
 
     @return The data from the EM file in ndarray
     """
-    f = open(filename, 'r')
+    return _read_volume(filename, order, keepnumpy, deviceID, subregion, mmap)
 
-    try:
-        dt_header = np.dtype('int32')
-        header = np.fromfile(f, dt_header, 128)
-        x = header[1]
-        y = header[2]
-        z = header[3]
-
-        # read the data type
-        dt = int(hex(header[0])[2])
-        default_type = False
-
-        if dt == 1:  # byte
-            raise Exception("Data type not supported yet!")
-        elif dt == 2:  # short
-            dt_data = np.dtype('<i2')
-        elif dt == 4:  # long
-            dt_data = np.dtype('<i4')
-        elif dt == 5:  # float32
-            dt_data = np.dtype('<f4')  # little-endian, float32
-            default_type = True
-        elif dt == 8:  # float complex
-            raise Exception("Data type not supported yet!")
-        elif dt == 9:  # double
-            dt_data = np.dtype('<f8')
-        elif dt == 10:  # double complex
-            raise Exception("Data type not supported yet!")
+
+def _read_volume_header(filename):
+    """Parse the header of an EM or MRC file without touching the voxel data.
+
+    @param filename: EM or MRC file
+    @return: shape [x, y, z], numpy dtype of the voxel data and byte offset of the first voxel
+    """
+    emfile = filename.lower().endswith('.em')
+
+    with open(filename, 'rb') as f:
+        if emfile:
+            header = np.fromfile(f, np.dtype('int32'), 128)
+            shape = [int(header[1]), int(header[2]), int(header[3])]
+            offset = 512
+
+            # read the data type
+            dt = int(hex(header[0])[2])
+
+            if dt == 1:  # byte
+                raise Exception("Data type not supported yet!")
+            elif dt == 2:  # short
+                dt_data = np.dtype('<i2')
+            elif dt == 4:  # long
+                dt_data = np.dtype('<i4')
+            elif dt == 5:  # float32
+                dt_data = np.dtype('<f4')  # little-endian, float32
+            elif dt == 8:  # float complex
+                raise Exception("Data type not supported yet!")
+            elif dt == 9:  # double
+                dt_data = np.dtype('<f8')
+            elif dt == 10:  # double complex
+                raise Exception("Data type not supported yet!")
+            else:
+                raise Exception("Data type not supported yet!")
         else:
-            raise Exception("Data type not supported yet!")
+            header = np.fromfile(f, np.dtype('int32'), 256)
+            shape = [int(header[0]), int(header[1]), int(header[2])]
+            # the extended header is skipped in whole float32 words
+            offset = 1024 + (int(header[23]) // 4) * 4
+
+            # read the data type
+            dt = header[3]
+            if dt == 0:  # byte
+                dt_data = np.dtype('int8')
+            elif dt == 1:  # short
+                dt_data = np.dtype('int16')
+            elif dt == 2:  # float32
+                dt_data = np.dtype('float32')
+            elif dt == 4:  # complex
+                dt_data = np.dtype('complex64')
+            elif dt == 6:  # unsigned short
+                dt_data = np.dtype('uint16')
+            else:
+                raise Exception("Data type not supported yet!")
+
+    return shape, dt_data, offset
+
+
+def _subregion_slices(subregion, shape):
+    """Convert a pytom subregion [startX, startY, startZ, size_x, size_y, size_z] to a tuple of slices.
+    A size of 0 extends the region to the end of that dimension, as in L{pytom.lib.pytom_volume.read}.
+    """
+    if len(subregion) != 6:
+        raise ValueError('subregion must be [startX, startY, startZ, size_x, size_y, size_z]')
 
-        v = np.fromfile(f, dt_data, x * y * z)
-    finally:
-        f.close()
+    slices = []
+    for start, size, dim in zip(subregion[:3], subregion[3:], shape):
+        start, size = int(start), int(size)
+        end = dim if size == 0 else start + size
+        if start < 0 or end > dim:
+            raise ValueError(f'subregion {list(subregion)} is out of bounds for a volume of size {list(shape)}')
+        slices.append(slice(start, end))
+    return tuple(slices)
+
+
+def _read_volume(filename, order='F', keepnumpy=False, deviceID=None, subregion=None, mmap=False):
+    """Shared reader for EM and MRC volumes, see L{pytom.agnostic.io.read} for the parameters."""
+    shape, dt_data, offset = _read_volume_header(filename)
+
+    if subregion is not None and not any(subregion[3:]):
+        subregion = None  # pytom convention: [0,0,0,0,0,0] is the full volume
+
+    if mmap or subregion is not None:
+        # map the file so that only the pages of the requested box are actually read
+        v = np.memmap(filename, dtype=dt_data, mode='r', offset=offset, shape=tuple(shape), order=order)
+    else:
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            v = np.fromfile(f, dt_data, shape[0] * shape[1] * shape[2]).reshape(shape, order=order)
+
+    return _finish_volume(v, subregion, mmap, keepnumpy, deviceID)
+
+
+def _finish_volume(v, subregion=None, mmap=False, keepnumpy=False, deviceID=None):
+    """Cut the subregion from a (memory mapped) volume and convert it like L{pytom.agnostic.io.read}."""
+    if subregion is not None and not any(subregion[3:]):
+        subregion = None
+
+    if subregion is not None:
+        v = v[_subregion_slices(subregion, v.shape)]
+
+    if mmap and v.dtype == np.float32 and (keepnumpy or xp is np):
+        # lazy read-only view, voxels are only loaded when accessed
+        return v
+
+    # single conversion into a new contiguous float32 array
+    volume = np.ascontiguousarray(v, dtype=np.float32)
 
     if keepnumpy:
-        volume = np.array(v.reshape((x, y, z), order=order), dtype='float32').copy()  # fortran-order array
-    else:  # if the input data is not the default type, convert
-        if not deviceID == None:
-            id = int(deviceID.split(":")[1])
-            xp.cuda.Device(id).use()
-        volume = xp.array(v.reshape((x, y, z), order=order), dtype='float32').copy()  # fortran-order array
+        return volume
 
-    return volume
+    if not deviceID == None:
+        id = int(deviceID.split(":")[1])
+        xp.cuda.Device(id).use()
+    return xp.asarray(volume)
 
 
 def read_size(filename, dim=''):
-    emfile = filename.endswith('.em') * 1
-    f = open(filename, 'r')
-    try:
-        dt_header = np.dtype('int32')
-        header = np.fromfile(f, dt_header, 4)
-        x = header[0 + emfile]
-        y = header[1 + emfile]
-        z = header[2 + emfile]
-    except:
-        raise Exception("reading of MRC file failed")
+    import os
 
-    f.close()
+    if not os.path.exists(filename):
+        # particles can be packed in a subtomogram stack next to their filename
+        from pytom.agnostic.subtomogram_stack import find_in_stack
+        stack = find_in_stack(filename)
+        assert stack is not None, f'{filename} does not exist'
+        x, y, z = stack.shape(filename)
+    else:
+        emfile = filename.endswith('.em') * 1
+        f = open(filename, 'r')
+        try:
+            dt_header = np.dtype('int32')
+            header = np.fromfile(f, dt_header, 4)
+            x = header[0 + emfile]
+            y = header[1 + emfile]
+            z = header[2 + emfile]
+        except:
+            raise Exception("reading of MRC file failed")
+
+        f.close()
 
     if dim == 'x':
         return x
@@ -2088,10 +2153,34 @@ def write_mrc(filename, data, tilt_angle=0, pixel_size=1, inplanerot=0, magnific
     size = np.ones((3), dtype=np.int32)
     size[:len(data.shape)] = data.shape
 
+    header = _mrc_header(size, pixel_size, (data.min(), data.max(), data.mean(), data.std()), tilt_angle=tilt_angle,
+                         inplanerot=inplanerot, magnification=magnification, dx=dx, dy=dy,
+                         current_tilt_angle=current_tilt_angle, rotation_angles=rotation_angles)
+
+    f = open(filename, 'wb')
+    try:
+        f.write(header)
+        f.write(data.tobytes(order=order))  # fortran-order array
+    finally:
+        f.close()
+
+
+def _mrc_header(size, pixel_size, statistics, tilt_angle=0, inplanerot=0, magnification=1., dx=0., dy=0.,
+                current_tilt_angle=999, rotation_angles=None):
+    """Build the 1024 byte header of a float32 MRC file.
+
+    @param size: [nx, ny, nz]
+    @param pixel_size: size of pixels/voxels in Angstrom
+    @param statistics: (min, max, mean, rms) of the data
+    @return: header
+    @rtype: L{bytes}
+    """
+    size = np.array(size, dtype=np.int32)
+    dmin, dmax, dmean, rms = statistics
+
     mode = 2
     cell_angles = (0, 0, 0)
     cell_size = pixel_size * size
-    dmin, dmax, dmean = data.min(), data.max(), data.mean()
 
     if current_tilt_angle == 999:
         current_tilt_angle = tilt_angle
@@ -2107,8 +2196,6 @@ def write_mrc(filename, data, tilt_angle=0, pixel_size=1, inplanerot=0, magnific
     else:
         machst = 0x11110000
 
-    rms = data.std()
-
     strings = [
         binary_string(size, np.int32),  # nx, ny, nz
         binary_string(mode, np.int32),  # mode
@@ -2129,14 +2216,79 @@ def write_mrc(filename, data, tilt_angle=0, pixel_size=1, inplanerot=0, magnific
         binary_string([0] * 200, np.int32),
     ]
 
-    header = b"".join(strings)
+    return b"".join(strings)
 
-    f = open(filename, 'wb')
-    try:
-        f.write(header)
-        f.write(data.tobytes(order=order))  # fortran-order array
-    finally:
-        f.close()
+
+class MRCStackWriter:
+    """
+    Write a stack of images into a preallocated MRC file, one section at a time. The file is memory mapped, so
+    only the sections that are being written occupy memory. The header statistics are written on L{close}.
+    """
+    def __init__(self, filename, shape, pixel_size=1):
+        """
+        @param filename: MRC file, overwritten if it exists
+        @type filename: L{str}
+        @param shape: (nx, ny, nz) of the stack, sections are indexed along z
+        @type shape: L{tuple}
+        @param pixel_size: size of pixels in Angstrom
+        @type pixel_size: L{float}
+        """
+        self.filename = filename
+        self.shape = tuple(int(s) for s in shape)
+        self.pixel_size = pixel_size
+
+        with open(filename, 'wb') as f:
+            f.write(_mrc_header(self.shape, pixel_size, (0, 0, 0, 0)))
+            # sparse allocation of the data block
+            f.truncate(1024 + 4 * self.shape[0] * self.shape[1] * self.shape[2])
+        self._stack = np.memmap(filename, dtype=np.float32, mode='r+', offset=1024, shape=self.shape, order='F')
+
+        self._written = set()
+        self._min, self._max, self._sum, self._sum2 = np.inf, -np.inf, 0., 0.
+
+    def write(self, index, image):
+        """
+        Write a section of the stack.
+
+        @param index: z index of the section
+        @type index: L{int}
+        @param image: section data (nx, ny)
+        @type image: L{numpy.ndarray} or cupy array
+        """
+        if hasattr(image, 'get'):
+            image = image.get()
+        image = np.asarray(image, dtype=np.float32)
+
+        if index in self._written:
+            raise ValueError(f'Section {index} of {self.filename} has already been written.')
+        self._written.add(index)
+
+        self._stack[:, :, index] = image
+        self._min, self._max = min(self._min, image.min()), max(self._max, image.max())
+        self._sum += image.sum(dtype=np.float64)
+        self._sum2 += (image.astype(np.float64) ** 2).sum()
+
+    def close(self):
+        if self._stack is None:
+            return
+        self._stack.flush()
+        self._stack = None
+
+        # sections that were not written are zero
+        if len(self._written) < self.shape[2]:
+            self._min, self._max = min(self._min, 0.), max(self._max, 0.)
+        n = self.shape[0] * self.shape[1] * self.shape[2]
+        mean = self._sum / n
+        rms = np.sqrt(max(self._sum2 / n - mean ** 2, 0.))
+
+        with open(self.filename, 'r+b') as f:
+            f.write(_mrc_header(self.shape, self.pixel_size, (self._min, self._max, mean, rms)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 def write_em(filename, data, tilt_angle=0, pixel_size=1, inplanerot=0, magnification=1., dx=0., dy=0.,
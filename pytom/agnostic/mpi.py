@@ -4,6 +4,24 @@
 
 import signal
 import sys
+from collections import deque
+
+# message tags of the dynamic scheduling
+_TASK_TAG = 11
+_RESULT_TAG = 12
+
+
+class _Dynamic:
+    """Marker sent instead of data to switch the workers to dynamic scheduling."""
+    pass
+
+
+def _call(func, d):
+    if d.__class__ == tuple: # multi args
+        return func(*d)
+    else:
+        return func(d)
+
 
 class MPI:
     """docstring for MPI"""
@@ -18,6 +36,8 @@ class MPI:
         self.rank = self.comm.Get_rank()
         self.DOUBLE = MPI.DOUBLE
         self.Win = MPI.Win
+        self.ANY_SOURCE = MPI.ANY_SOURCE
+        self.Status = MPI.Status
         self._begun = False
 
         #User termination on Ctrl-C will be caught and send to workers.
@@ -103,6 +123,9 @@ class MPI:
                 assert len(msg) == 2
                 func = msg[0]
                 data = msg[1]
+                if isinstance(data, _Dynamic):
+                    self._work_dynamic(func)
+                    continue
                 if data is None: # no job to do
                     res = None
                 elif data.__class__ == list:
@@ -130,8 +153,103 @@ class MPI:
         sys.exit()
 
 
-    def parfor(self, func, data, verbose=False):
+    def _work_dynamic(self, func):
+        """For worker only. Process chunks sent by the master until it sends None.
+        """
+        while True:
+            chunk = self.comm.recv(source=0, tag=_TASK_TAG)
+            if chunk is None:
+                break
+            self.comm.send([(i, _call(func, d)) for i, d in chunk], dest=0, tag=_RESULT_TAG)
+
+    def parfor_unordered(self, func, data, chunksize=1, master_works=True):
+        """For master only. Dynamic scheduling: the workers get the next chunk of data as soon as they return \
+        a result, so ranks that get cheap items take over more of the work.
+
+        @param func: function to apply to every item, an item that is a tuple is passed as arguments
+        @param data: list of items
+        @param chunksize: number of items sent at once, larger chunks reduce the messaging overhead
+        @param master_works: let the master process chunks between handing out work
+        @return: generator of (index, result) in order of completion, has to be consumed completely
+        """
+        if not self._begun:
+            raise Exception("MPI has not been initialized!")
+
+        if not self.is_master():
+            return
+
+        assert func
+        assert data.__class__ == list
+        assert chunksize > 0
+
+        items = list(enumerate(data))
+        chunks = deque(items[i:i + chunksize] for i in range(0, len(items), chunksize))
+
+        try:
+            # switch the workers to dynamic scheduling, the master ignores its own part
+            self.comm.scatter([(func, _Dynamic())] * self.size, root=0)
+
+            busy = 0
+            for worker in range(1, self.size):
+                if chunks:
+                    self.comm.send(chunks.popleft(), dest=worker, tag=_TASK_TAG)
+                    busy += 1
+                else:
+                    self.comm.send(None, dest=worker, tag=_TASK_TAG)
+
+            status = self.Status()
+            while busy or chunks:
+                # the master takes a chunk itself unless a result is waiting, or if no worker is busy
+                master_turn = chunks and (master_works or not busy)
+                if busy and (not master_turn or self.comm.Iprobe(source=self.ANY_SOURCE, tag=_RESULT_TAG)):
+                    results = self.comm.recv(source=self.ANY_SOURCE, tag=_RESULT_TAG, status=status)
+                    worker = status.Get_source()
+                    if chunks:
+                        self.comm.send(chunks.popleft(), dest=worker, tag=_TASK_TAG)
+                    else:
+                        self.comm.send(None, dest=worker, tag=_TASK_TAG)
+                        busy -= 1
+                    for res in results:
+                        yield res
+                else:
+                    for i, d in chunks.popleft():
+                        yield i, _call(func, d)
+
+        except Exception as e:
+            tb = sys.exc_info()[2]
+            print(e.with_traceback(tb))
+            self.comm.Abort()
+
+    def parfor_async(self, func, data, chunksize=1):
+        """For master only. Run L{parfor} with dynamic scheduling in a background thread, the master only hands out \
+        work. MPI must not be used otherwise on the master until the future is done.
+
+        @return: future with the list of results in the order of data
+        @rtype: L{concurrent.futures.Future}
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self._collect, func, data, chunksize, False)
+        executor.shutdown(wait=False)
+        return future
+
+    def _collect(self, func, data, chunksize, master_works):
+        all_res = [None] * len(data)
+        for i, res in self.parfor_unordered(func, data, chunksize, master_works):
+            all_res[i] = res
+        return all_res
+
+    def parfor(self, func, data, verbose=False, schedule='dynamic', chunksize=1):
         """For master only.
+
+        @param func: function to apply to every item, an item that is a tuple is passed as arguments
+        @param data: list of items
+        @param schedule: 'dynamic' hands out chunks of items to the ranks as they become free, 'static' splits the \
+        items once into one part per rank. Use 'static' if func relies on running once on every rank at the same \
+        time, e.g. for collective communication.
+        @param chunksize: number of items per chunk for dynamic scheduling
+        @return: list of results in the order of data
         """
         import sys
         if not self._begun:
@@ -144,6 +262,10 @@ class MPI:
         assert data.__class__ == list
         assert len(data)
 
+        if schedule == 'dynamic':
+            return self._collect(func, data, chunksize, True)
+        assert schedule == 'static', 'schedule should be dynamic or static'
+
         ddata = self._split_seq(data, self.size)
         msg = [(func, d) for d in ddata]
 
@@ -0,0 +1,192 @@
+'''
+Packed storage of many subtomograms.
+
+A subtomogram stack is a directory next to the particle files (default name 'subtomograms.substack'). It holds
+chunk files of raw float32 volumes (chunk_<n>.raw) together with an offset table per chunk (chunk_<n>.idx). Every
+line of an offset table reads 'basename offset size_x size_y size_z'. Each writing process uses its own chunk, so
+particles can be written in parallel without locking. Volumes are stored in fortran order, i.e. with the same
+[x, y, z] indexing that L{pytom.agnostic.io.read} returns, and are read back memory-mapped.
+
+A particle 'dir/particle_1.em' that is not on disk is looked up in 'dir/subtomograms.substack', which is what
+L{pytom.agnostic.io.read} and L{pytom.basic.structures.Particle.getVolume} do.
+'''
+import os
+import numpy as np
+
+STACK_NAME = 'subtomograms.substack'
+
+# opened stacks by path: (mtime of the directory, mtimes of the offset tables, stack)
+_stacks = {}
+
+
+def stack_path(filename):
+    """
+    Path of the stack that would hold filename.
+
+    @param filename: particle filename
+    @type filename: L{str}
+    @return: path of the stack directory
+    @rtype: L{str}
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), STACK_NAME)
+
+
+class SubtomogramStackWriter:
+    """
+    Append subtomograms to one chunk of a stack.
+    """
+    def __init__(self, path, chunk=0):
+        """
+        @param path: stack directory, created if needed
+        @type path: L{str}
+        @param chunk: chunk number, has to be unique among the processes writing at the same time
+        @type chunk: L{int}
+        """
+        os.makedirs(path, exist_ok=True)
+        self._data = open(os.path.join(path, f'chunk_{chunk}.raw'), 'ab')
+        self._index = open(os.path.join(path, f'chunk_{chunk}.idx'), 'a')
+
+    def write(self, filename, volume):
+        """
+        Append a volume under the basename of filename.
+
+        @param filename: particle filename
+        @type filename: L{str}
+        @param volume: subtomogram
+        @type volume: L{numpy.ndarray}, cupy array or L{pytom.lib.pytom_volume.vol}
+        """
+        if not isinstance(volume, np.ndarray):
+            if hasattr(volume, 'get'):
+                volume = volume.get()
+            else:
+                from pytom.lib.pytom_numpy import vol2npy
+                volume = vol2npy(volume)
+        volume = np.asfortranarray(volume, dtype=np.float32)
+
+        offset = self._data.seek(0, os.SEEK_END)
+        self._data.write(volume.tobytes(order='F'))
+        self._data.flush()
+        # only list the volume once its data is complete
+        self._index.write('{} {} {} {} {}\n'.format(os.path.basename(filename), offset, *volume.shape))
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SubtomogramStack:
+    """
+    Read access to a stack. Volumes are memory mapped, so only the requested particles are read from disk.
+    """
+    def __init__(self, path):
+        """
+        @param path: stack directory
+        @type path: L{str}
+        """
+        self.path = path
+        self._index = {}
+        self._maps = {}
+        for chunk in sorted(f[:-4] for f in os.listdir(path) if f.endswith('.idx')):
+            with open(os.path.join(path, chunk + '.idx')) as f:
+                for line in f:
+                    name, offset, x, y, z = line.split()
+                    self._index[name] = (chunk, int(offset), (int(x), int(y), int(z)))
+
+    def __contains__(self, filename):
+        return os.path.basename(filename) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def names(self):
+        """
+        @return: basenames of the stored particles
+        @rtype: L{list}
+        """
+        return list(self._index.keys())
+
+    def shape(self, filename):
+        """
+        @param filename: particle filename
+        @type filename: L{str}
+        @return: dimensions of the particle
+        @rtype: L{tuple}
+        """
+        return self._index[os.path.basename(filename)][2]
+
+    def read(self, filename):
+        """
+        Get a particle as read-only memory mapped view.
+
+        @param filename: particle filename
+        @type filename: L{str}
+        @return: volume with [x, y, z] indexing
+        @rtype: L{numpy.ndarray}
+        """
+        chunk, offset, shape = self._index[os.path.basename(filename)]
+        if chunk not in self._maps:
+            self._maps[chunk] = np.memmap(os.path.join(self.path, chunk + '.raw'), dtype=np.float32, mode='r')
+        start = offset // 4
+        return self._maps[chunk][start: start + shape[0] * shape[1] * shape[2]].reshape(shape, order='F')
+
+
+def find_in_stack(filename):
+    """
+    Find the stack that holds filename.
+
+    @param filename: particle filename
+    @type filename: L{str}
+    @return: the stack or None if the particle is not stored in a stack
+    @rtype: L{SubtomogramStack}
+    """
+    path = stack_path(filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    # a hit only costs the stat of the directory, which changes when chunks are created or removed
+    cached = _stacks.get(path)
+    if cached is not None and cached[0] == mtime and filename in cached[2]:
+        return cached[2]
+
+    # on a miss the offset tables are checked, particles can have been appended to existing chunks
+    version = tuple(sorted((f, os.path.getmtime(os.path.join(path, f))) for f in os.listdir(path)
+                           if f.endswith('.idx')))
+    if cached is None or cached[0] != mtime or cached[1] != version:
+        cached = (mtime, version, SubtomogramStack(path))
+        _stacks[path] = cached
+    stack = cached[2]
+    return stack if filename in stack else None
+
+
+def particle_exists(filename):
+    """
+    Check whether a particle is on disk, as file or packed in a stack.
+
+    @param filename: particle filename
+    @type filename: L{str}
+    @rtype: L{bool}
+    """
+    return os.path.exists(filename) or find_in_stack(filename) is not None
+
+
+def clear_stack(path):
+    """
+    Remove all chunks of a stack.
+
+    @param path: stack directory
+    @type path: L{str}
+    """
+    if os.path.isdir(path):
+        for f in os.listdir(path):
+            if f.startswith('chunk_'):
+                os.remove(os.path.join(path, f))
+    _stacks.pop(path, None)
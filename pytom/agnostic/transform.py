@@ -182,12 +182,15 @@ def resize_scipy(data, x, y, z):
     d = map_coordinates(data, grid, order=2)
     return d
 
-def cut_from_projection(proj, center, size, device=2):
+def cut_from_projection(proj, center, size, device=2, prefiltered=False):
     """Cut out a subregion out from a 2D projection.
 
     @param proj: 2D projection.
     @param center: cutting center.
     @param size: cutting size.
+    @param prefiltered: proj already holds the spline coefficients of the projection, \
+    i.e. scipy.ndimage.spline_filter(proj, order=2, mode='constant'). Cutting many patches from the same projection \
+    then does not filter the whole projection again for every patch.
 
     @return: subprojection.
     """
@@ -208,7 +211,7 @@ def cut_from_projection(proj, center, size, device=2):
                     center[1]-size[1]//2:center[1]+size[1]-size[1]//2-1:size[1]*1j]
 
 
-    v = map_coordinates(proj, grid, order=2)
+    v = map_coordinates(proj, grid, order=2, prefilter=not prefiltered)
 
     return xp.array(v)
 
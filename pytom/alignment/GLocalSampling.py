@@ -11,12 +11,15 @@ from pytom.agnostic.mpi import MPI
 mpi = MPI()
 
 
-def mainAlignmentLoop(alignmentJob, verbose=False):
+def mainAlignmentLoop(alignmentJob, verbose=False, batchSize=0):
     """
     @param alignmentJob: alignment job
     @type alignmentJob: L{pytom.alignment.GLocalSampling.GLocalSamplingJob}
     @param verbose: verbose mode
     @type verbose: L{bool}
+    @param batchSize: align up to this many particles that scan the same rotations together on the cpu, see \
+    L{pytom.alignment.alignmentFunctions.bestAlignmentBatch}. 0 aligns particle by particle.
+    @type batchSize: L{int}
 
     @author: FF
     """
@@ -210,9 +213,12 @@ def mainAlignmentLoop(alignmentJob, verbose=False):
         alignmentJob.scoringParameters.score.toXMLFile(filename=alignmentJob.destination+"/"+'CurrentScore.xml')
         alignmentJob.samplingParameters.rotations.toXMLFile(filename=alignmentJob.destination+"/"+'CurrentRotations.xml')
         alignmentJob.scoringParameters.mask.toXMLFile(filename=alignmentJob.destination+"/"+'CurrentMask.xml')
-        # split particle lists
-        evenSplitList = splitParticleList(particleList=even, setParticleNodesRatio=setParticleNodesRatio)
-        oddSplitList  = splitParticleList(particleList=odd, setParticleNodesRatio=setParticleNodesRatio)
+        # split particle lists, on the cpu in several parts per node that are balanced by the dynamic parfor
+        chunksPerNode = 4 if alignmentJob.gpu is None or alignmentJob.gpu == [] else 1
+        evenSplitList = splitParticleList(particleList=even, setParticleNodesRatio=setParticleNodesRatio,
+                                          chunksPerNode=chunksPerNode)
+        oddSplitList  = splitParticleList(particleList=odd, setParticleNodesRatio=setParticleNodesRatio,
+                                          chunksPerNode=chunksPerNode)
 
         if alignmentJob.gpu is None or alignmentJob.gpu == []:
             print(">>>>>>>>> Aligning Even ....")
@@ -224,7 +230,7 @@ def mainAlignmentLoop(alignmentJob, verbose=False):
                                         [alignmentJob.destination+"/"+'CurrentMask.xml']*len(evenSplitList),
                                         [alignmentJob.scoringParameters.preprocessing]*len(evenSplitList),
                                         [progressBar]*neven, [alignmentJob.samplingParameters.binning]*len(evenSplitList),
-                                        [verbose]*len(evenSplitList))))
+                                        [verbose]*len(evenSplitList), [batchSize]*len(evenSplitList))))
             print(">>>>>>>>> Aligning Odd  ....")
             bestPeaksOddSplit = mpi.parfor( alignParticleList,
                                     list(zip(oddSplitList, [currentReferenceOdd]*len(oddSplitList),
@@ -234,7 +240,7 @@ def mainAlignmentLoop(alignmentJob, verbose=False):
                                         [alignmentJob.destination+"/"+'CurrentMask.xml']*len(oddSplitList),
                                         [alignmentJob.scoringParameters.preprocessing]*len(oddSplitList),
                                         [progressBar]*nodd, [alignmentJob.samplingParameters.binning]*len(oddSplitList),
-                                        [verbose]*len(oddSplitList))))
+                                        [verbose]*len(oddSplitList), [batchSize]*len(oddSplitList))))
             # merge peak lists
             bestPeaksEven = mergeLists(bestPeaksEvenSplit)
             bestPeaksOdd = mergeLists(bestPeaksOddSplit)
@@ -327,7 +333,7 @@ def mainAlignmentLoop(alignmentJob, verbose=False):
                                         [alignmentJob.scoringParameters.preprocessing] * len(evenSplitList),
                                         [progressBar] * neven,
                                         [alignmentJob.samplingParameters.binning] * len(evenSplitList),
-                                        [verbose] * len(evenSplitList),alignmentJob.gpu)))
+                                        [verbose] * len(evenSplitList),alignmentJob.gpu)), schedule='static')
             print(">>>>>>>>> Aligning Odd  ....")
             resultsOdd = mpi.parfor(alignParticleListGPU, list(zip(oddSplitList,
                                         [currentReferenceOdd]*len(oddSplitList),
@@ -337,7 +343,7 @@ def mainAlignmentLoop(alignmentJob, verbose=False):
                                         [alignmentJob.destination+"/"+'CurrentMask.xml']*len(oddSplitList),
                                         [alignmentJob.scoringParameters.preprocessing]*len(oddSplitList),
                                         [progressBar]*nodd, [alignmentJob.samplingParameters.binning]*len(oddSplitList),
-                                        [verbose]*len(oddSplitList), alignmentJob.gpu)))
+                                        [verbose]*len(oddSplitList), alignmentJob.gpu)), schedule='static')
 
             xp.cuda.Device(alignmentJob.gpu[0]).use()
             bestPeaksEvenSplit, plansEven = zip(*resultsEven)
@@ -484,9 +490,107 @@ def alignParticleListWrapper(plFilename, reference, referenceWeighting, rotation
     wrapper to prevent to much parsing - caused MPI freeze :(
     """
 
+# per-rank store of parsed alignment inputs, keyed by (kind, filename, mtime, ...)
+_alignmentSetupStore = {}
+
+
+class AlignmentSetup(object):
+    """
+    AlignmentSetup: Inputs of alignParticleList that are the same for every particle of an iteration. The score, \
+    rotations, mask and reference weighting are parsed once per rank and reused across iterations as long as \
+    their files are unchanged. The preprocessed reference is computed once unless it has to be corrected for \
+    the autocorrelation of each particle.
+    """
+    def __init__(self, reference, referenceWeightingFile, rotationsFilename, scoreXMLFilename, maskFilename,
+                 preprocessing, maskCacheBytes=2**30):
+        """
+        @param reference: reference
+        @type reference: L{pytom.basic.structures.Reference}
+        @param referenceWeightingFile: File for Fourier weighting of the reference
+        @type referenceWeightingFile: str
+        @param rotationsFilename: name of rotations xml file
+        @type rotationsFilename: L{str}
+        @param scoreXMLFilename: name of XML File of score object
+        @type scoreXMLFilename: L{str}
+        @param maskFilename: name of real-space mask xml file for correlation function
+        @type maskFilename: L{str}
+        @param preprocessing: Class storing preprocessing of particle and reference such as bandpass
+        @type preprocessing: L{pytom.alignment.preprocessing.Preprocessing}
+        @param maskCacheBytes: memory that may be spent on rotated versions of a non-spherical mask
+        @type maskCacheBytes: L{int}
+        """
+        from pytom.basic.score import fromXMLFile
+        from pytom.angles.angle import AngleObject
+        from pytom.basic.structures import Mask
+        from pytom.alignment.preprocessing import Preprocessing
+
+        self.scoreObject = self._cached('score', scoreXMLFilename, lambda: fromXMLFile(filename=scoreXMLFilename))
+        self.rotations = self._cached('rotations', rotationsFilename,
+                                      lambda: AngleObject().fromXMLFile(filename=rotationsFilename))
+
+        def loadMask():
+            mask = Mask()
+            mask.fromXMLFile(filename=maskFilename)
+            if not mask.isSphere():
+                v = mask.getVolume()
+                mask.setRotationCacheSize(int(maskCacheBytes // (4 * v.size_x() * v.size_y() * v.size_z())))
+            return mask
+        self.mask = self._cached('mask', maskFilename, loadMask)
+
+        if referenceWeightingFile:
+            from pytom.lib.pytom_volume import read
+            self.referenceWeighting = self._cached('weighting', referenceWeightingFile,
+                                                   lambda: read(referenceWeightingFile))
+        else:
+            self.referenceWeighting = None
+
+        self.reference = reference
+        self.preprocessing = preprocessing if preprocessing is not None else Preprocessing()
+        self._referenceVolume = None
+
+    @staticmethod
+    def _cached(kind, filename, load, *key):
+        """
+        _cached: Return the object stored for filename in its current version, load it if needed.
+        """
+        import os
+        storeKey = (kind, os.path.abspath(filename), os.path.getmtime(filename)) + key
+        if storeKey not in _alignmentSetupStore:
+            # drop outdated versions of the same file
+            for k in [k for k in _alignmentSetupStore if k[:2] == storeKey[:2]]:
+                del _alignmentSetupStore[k]
+            _alignmentSetupStore[storeKey] = load()
+        return _alignmentSetupStore[storeKey]
+
+    def getReferenceVolume(self, particle, scoreObject, verbose=False):
+        """
+        getReferenceVolume: Get the preprocessed reference for particle
+        @param particle: particle
+        @type particle: L{pytom.basic.structures.Particle}
+        @param scoreObject: score, decides whether the autocorrelation is removed
+        @type scoreObject: L{pytom.basic.score.Score}
+        @return: preprocessed reference volume
+        @rtype: L{pytom.lib.pytom_volume.vol}
+        """
+        if scoreObject.getRemoveAutocorrelation() and self.reference._generatedByParticleList:
+            refVol = self.reference.subtractParticle(particle=particle, binning=1, verbose=verbose)[0]
+            self.preprocessing.setTaper(taper=refVol.size_x()/10.)
+            return self.preprocessing.apply(volume=refVol, bypassFlag=True)
+
+        if self._referenceVolume is None:
+            refFile = self.reference.getReferenceFilename()
+
+            def prepare():
+                refVol = self.reference.getVolume()
+                self.preprocessing.setTaper(taper=refVol.size_x()/10.)
+                return self.preprocessing.apply(volume=refVol, bypassFlag=True)
+            self._referenceVolume = self._cached('reference', refFile, prepare, str(self.preprocessing))
+        return self._referenceVolume
+
+
 def alignParticleList(pl, reference, referenceWeightingFile, rotationsFilename,
                       scoreXMLFilename, maskFilename, preprocessing,
-                      progressBar=True, binning=1, verbose=False):
+                      progressBar=True, binning=1, verbose=False, batchSize=0):
     """
     align a ParticleList
 
@@ -508,29 +612,22 @@ def alignParticleList(pl, reference, referenceWeightingFile, rotationsFilename,
     @param progressBar: Display progress bar of alignment. False by default.
     @param binning: Is binning applied (currently not properly functioning)
     @param verbose: Print out infos. Writes CC volume to disk!!! Default is False
+    @param batchSize: align up to this many particles that scan the same rotations together \
+    (L{alignParticleBatch}), 0 aligns particle by particle. Not used with binning or if the reference depends on \
+    the particle.
+    @type batchSize: L{int}
 
     @return: Returns the peak list for particle list.
     @author: FF
     """
-    from pytom.basic.score import fromXMLFile
-    from pytom.angles.angle import AngleObject
-    from pytom.basic.structures import Mask, ParticleList
+    from pytom.basic.structures import ParticleList
 
     assert type(pl) == ParticleList, "pl is supposed to be a particleList"
 
-    scoreObject = fromXMLFile(filename=scoreXMLFilename)
-
-    rot = AngleObject()
-    rotations = rot.fromXMLFile(filename=rotationsFilename)
-
-    mask = Mask()
-    mask.fromXMLFile(filename=maskFilename)
-
-    if referenceWeightingFile:
-        from pytom.lib.pytom_volume import read
-        referenceWeighting = read(referenceWeightingFile)
-    else:
-        referenceWeighting = None
+    setup = AlignmentSetup(reference, referenceWeightingFile, rotationsFilename, scoreXMLFilename, maskFilename,
+                           preprocessing)
+    scoreObject, rotations, mask = setup.scoreObject, setup.rotations, setup.mask
+    referenceWeighting = setup.referenceWeighting
 
     if verbose:
         print("alignParticleList: rank "+str(mpi.rank))
@@ -538,13 +635,33 @@ def alignParticleList(pl, reference, referenceWeightingFile, rotationsFilename,
         print("alignParticleList: scoreObject: "+str(scoreObject))
         print("alignParticleList: mask:        "+str(mask))
 
-    bestPeaks = []
-    for particle in pl:
-        bestPeak = alignOneParticle(particle=particle, reference=reference, referenceWeighting=referenceWeighting,
-                                    rotations=rotations, scoreObject=scoreObject, mask=mask,
-                                    preprocessing=preprocessing, progressBar=progressBar, binning=binning,
-                                    verbose=verbose)
-        bestPeaks.append(bestPeak)
+    bestPeaks = [None] * len(pl)
+    if batchSize and binning == 1 and \
+            not (scoreObject.getRemoveAutocorrelation() and reference._generatedByParticleList):
+        # particles that scan the same rotations, e.g. because they share the start rotation, are aligned together
+        groups = {}
+        for i, particle in enumerate(pl):
+            rotations.setStartRotation(particle.getRotation())
+            angles = rotations.getAllRotations()[:-1]
+            groups.setdefault(tuple(tuple(angle) for angle in angles), (angles, []))[1].append(i)
+
+        for angles, indices in groups.values():
+            if len(indices) == 1:
+                continue
+            for start in range(0, len(indices), batchSize):
+                batch = indices[start:start + batchSize]
+                peaks = alignParticleBatch(particles=[pl[i] for i in batch], reference=reference,
+                                           referenceWeighting=referenceWeighting, rotations=angles,
+                                           scoreObject=scoreObject, mask=mask, setup=setup, verbose=verbose)
+                for i, bestPeak in zip(batch, peaks):
+                    bestPeaks[i] = bestPeak
+
+    for i, particle in enumerate(pl):
+        if bestPeaks[i] is None:
+            bestPeaks[i] = alignOneParticle(particle=particle, reference=reference,
+                                            referenceWeighting=referenceWeighting, rotations=rotations,
+                                            scoreObject=scoreObject, mask=mask, preprocessing=preprocessing,
+                                            progressBar=progressBar, binning=binning, verbose=verbose, setup=setup)
 
     return bestPeaks
 
@@ -695,7 +812,7 @@ def alignOneParticleWrapper(particle, reference, referenceWeighting=None, rotati
 
 
 def alignOneParticle( particle, reference, referenceWeighting, rotations,
-                      scoreObject, mask, preprocessing, progressBar=True, binning=1, verbose=False):
+                      scoreObject, mask, preprocessing, progressBar=True, binning=1, verbose=False, setup=None):
     """
     @param particle: particle
     @type particle: L{pytom.basic.Particle}
@@ -715,6 +832,8 @@ def alignOneParticle( particle, reference, referenceWeighting, rotations,
     @param progressBar: Display progress bar of alignment. False by default.
     @param binning: Is binning applied (currently not properly functioning)
     @param verbose: Print out infos. Writes CC volume to disk!!! Default is False
+    @param setup: Prepared inputs of the iteration, provides the preprocessed reference if set
+    @type setup: L{pytom.alignment.GLocalSampling.AlignmentSetup}
     @return: Returns the best rotation for particle and the corresponding scoring result.
     @author: FF
     """
@@ -733,17 +852,20 @@ def alignOneParticle( particle, reference, referenceWeighting, rotations,
 
     # prepare reference
     assert type(reference) == Reference, "alignOneParticle: reference not of type Reference"
-    if scoreObject.getRemoveAutocorrelation() and reference._generatedByParticleList:
-        refVol = reference.subtractParticle( particle=particle, binning=1, verbose=verbose)[0]
+    if setup is not None:
+        refVol = setup.getReferenceVolume(particle, scoreObject, verbose=verbose)
     else:
-        refVol = reference.getVolume()
+        if scoreObject.getRemoveAutocorrelation() and reference._generatedByParticleList:
+            refVol = reference.subtractParticle( particle=particle, binning=1, verbose=verbose)[0]
+        else:
+            refVol = reference.getVolume()
 
-    # apply pre-processing to reference, no pre-processing to particles
-    if preprocessing is None:
-        preprocessing = Preprocessing()
-    assert type(preprocessing) == Preprocessing, "alignOneParticle: preprocessing not of type Proprocessing"
-    preprocessing.setTaper( taper=refVol.size_x()/10.)
-    refVol = preprocessing.apply(volume=refVol, bypassFlag=True)
+        # apply pre-processing to reference, no pre-processing to particles
+        if preprocessing is None:
+            preprocessing = Preprocessing()
+        assert type(preprocessing) == Preprocessing, "alignOneParticle: preprocessing not of type Proprocessing"
+        preprocessing.setTaper( taper=refVol.size_x()/10.)
+        refVol = preprocessing.apply(volume=refVol, bypassFlag=True)
 
     wedge = particle.getWedge()
     assert isinstance(scoreObject, Score), "alignOneParticle: score not of type Score"
@@ -779,9 +901,94 @@ def alignOneParticle( particle, reference, referenceWeighting, rotations,
     return bestPeak
 
 
+def alignParticleBatch(particles, reference, referenceWeighting, rotations, scoreObject, mask, setup, verbose=False):
+    """
+    alignParticleBatch: L{alignOneParticle} for several particles that scan the same rotations, the rotated \
+    reference is shared by all of them (L{pytom.alignment.alignmentFunctions.bestAlignmentBatch})
+
+    @param particles: particles
+    @type particles: L{list} of L{pytom.basic.structures.Particle}
+    @param reference: reference
+    @type reference: L{pytom.basic.Reference}
+    @param referenceWeighting: Fourier weighting of the reference - if 'False' not performed
+    @type referenceWeighting: L{pytom.basic.structures.vol} or str
+    @param rotations: rotations to be scanned
+    @type rotations: L{list} of [z1, z2, x]
+    @param scoreObject: score
+    @type scoreObject: L{pytom.score.score.Score}
+    @param mask: real-space mask for correlation function
+    @type mask: L{pytom.basic.structures.Mask}
+    @param setup: Prepared inputs of the iteration, provides the preprocessed reference
+    @type setup: L{pytom.alignment.GLocalSampling.AlignmentSetup}
+    @param verbose: Print out infos
+    @return: Returns the best rotation and translation of every particle and the corresponding scoring result.
+    @rtype: L{list} of L{pytom.alignment.structures.Peak}
+    """
+    from pytom.alignment.alignmentFunctions import bestAlignmentBatch
+    from pytom.angles.angleFnc import differenceAngleOfTwoRotations
+    from time import time
+
+    t1 = time()
+    refVol = setup.getReferenceVolume(particles[0], scoreObject, verbose=verbose)
+
+    bestPeaks = bestAlignmentBatch(particles=[particle.getVolume() for particle in particles], reference=refVol,
+                                   referenceWeighting=referenceWeighting if referenceWeighting else 'False',
+                                   wedgeInfos=[particle.getWedge() for particle in particles], rotations=rotations,
+                                   scoreObject=scoreObject, mask=mask, preprocessing=None, verbose=verbose)
+    t2 = time()
+
+    for particle, bestPeak in zip(particles, bestPeaks):
+        if verbose:
+            angDiff = differenceAngleOfTwoRotations(rotation1=bestPeak.getRotation(), rotation2=particle.getRotation())
+            shifts_print = bestPeak.getShift().toVector()
+            print(f"{particle.getFilename()}: Angular diff before and after alignment {angDiff:2.2f} and shift "
+                  f"{shifts_print[0]:.4f}, {shifts_print[1]:.4f}, {shifts_print[2]:.4f}... "
+                  f"took {(t2-t1)/len(particles):3.1f} seconds...")
+        particle.setRotation(bestPeak.getRotation())
+        particle.setShift(bestPeak.getShift())
+    return bestPeaks
+
+
+def averagePartialSums(particleList, shape, showProgressBar=False, verbose=False, weighting=None, norm=False,
+                       debugName=None):
+    """
+    average the particles of this rank and sum the partial results of all ranks on the master with MPI Reduce. \
+    Every rank has to call this function exactly once per reduction, ranks without particles contribute zeros.
+
+    @param particleList: The particles of this rank or None
+    @param shape: dimensions of the particles
+    @type shape: L{list}
+    @param weighting: weight particles by exp CC in average
+    @param norm: apply normalization for each particle
+    @param debugName: write the partial sums of this rank to debugName-PreWedge.mrc and \
+        debugName-WedgeSumUnscaled.mrc if set
+    @return: [unweighted sum, unscaled wedge sum] as numpy arrays on the master, None on the other ranks
+    @author: FF
+    """
+    import numpy as np
+    from mpi4py.MPI import SUM
+    from pytom.lib.pytom_numpy import vol2npy
+    from pytom.bin.average import average
+
+    sums = [np.zeros((shape[0], shape[1], shape[2]), dtype=np.float32),
+            np.zeros((shape[0], shape[1], shape[2]//2+1), dtype=np.float32)]
+    if particleList is not None and len(particleList):
+        partial = average(particleList, '', showProgressBar, verbose, False, weighting, norm, returnSums=True)
+        for buffer, v in zip(sums, partial):
+            buffer[:] = vol2npy(v)
+            if debugName:
+                v.write(f'{debugName}-{"PreWedge" if buffer is sums[0] else "WedgeSumUnscaled"}.mrc')
+
+    result = [np.zeros_like(a) for a in sums] if mpi.is_master() else [None, None]
+    for buffer, reduced in zip(sums, result):
+        mpi.comm.Reduce(buffer, reduced, op=SUM, root=0)
+
+    return result if mpi.is_master() else None
+
+
 def averageParallel(particleList,averageName, showProgressBar=False, verbose=False,
                     createInfoVolumes=False, weighting=None, norm=False,
-                    setParticleNodesRatio=3, gpuIDs=None):
+                    setParticleNodesRatio=3, gpuIDs=None, inMemory=True, keepPartialFiles=False):
     """
     compute average using parfor
     @param particleList: The particles
@@ -792,6 +999,10 @@ def averageParallel(particleList,averageName, showProgressBar=False, verbose=Fal
     @type weighting: bool
     @param setParticleNodesRatio: minimum number of particles per node
     @type setParticleNodesRatio: L{int}
+    @param inMemory: sum the partial averages with MPI Reduce instead of exchanging files (CPU only)
+    @type inMemory: bool
+    @param keepPartialFiles: keep the partial averages of each rank on disk for debugging
+    @type keepPartialFiles: bool
     @return: A new Reference object
     @rtype: L{pytom.basic.structures.Reference}
     @author: FF
@@ -830,26 +1041,43 @@ def averageParallel(particleList,averageName, showProgressBar=False, verbose=Fal
     #reference = average(particleList=plist, averageName=xxx, showProgressBar=True, verbose=False,
     # createInfoVolumes=False, weighting=weighting, norm=False)
 
-    averageList = mpi.parfor( average, list(zip(splitLists, avgNameList, [showProgressBar]*splitFactor,
-                                           [verbose]*splitFactor, [createInfoVolumes]*splitFactor,
-                                           [weighting]*splitFactor, [norm]*splitFactor, gpuIDs)))
-    if 'gpu' in device:
-        xp.cuda.Device(gpuIDs[0]).use()
-
-    #collect results from files
-    unweiAv = read(preList[0])
-    wedgeSum = read(wedgeList[0])
-    os.system('rm ' + wedgeList[0])
-    os.system('rm ' + avgNameList[0])
-    os.system('rm ' + preList[0])
-    for ii in range(1,splitFactor):
-        av = read(preList[ii])
-        unweiAv += av
-        os.system('rm ' + preList[ii])
-        w = read(wedgeList[ii])
-        wedgeSum += w
-        os.system('rm ' + wedgeList[ii])
-        os.system('rm ' + avgNameList[ii])
+    if inMemory and not 'gpu' in device:
+        import numpy as np
+        from pytom.lib.pytom_volume import vol
+        from pytom.lib.pytom_numpy import npy2vol
+        from pytom.agnostic.io import read_size
+        from pytom.agnostic.subtomogram_stack import particle_exists
+
+        # every rank takes part in the reduction, also the ones without particles
+        shape = read_size([p for p in particleList if particle_exists(p.getFilename())][0].getFilename())
+        debugNames = [averageName + '_dist' + str(ii) if keepPartialFiles else None for ii in range(splitFactor)]
+        data = list(zip(splitLists, [shape]*splitFactor, [showProgressBar]*splitFactor, [verbose]*splitFactor,
+                        [weighting]*splitFactor, [norm]*splitFactor, debugNames))
+        data += [(None, shape, False, False, weighting, norm, None)] * (mpi.size - splitFactor)
+        # the reduction needs every rank to run exactly once at the same time
+        sums = mpi.parfor(averagePartialSums, data, schedule='static')[0]
+
+        unweiAv, wedgeSum = [vol(*a.shape) for a in sums]
+        for v, a in zip((unweiAv, wedgeSum), sums):
+            # npy2vol shares the memory, copy into a volume that owns its data
+            v.copyVolume(npy2vol(np.asfortranarray(a), 3))
+    else:
+        averageList = mpi.parfor( average, list(zip(splitLists, avgNameList, [showProgressBar]*splitFactor,
+                                               [verbose]*splitFactor, [createInfoVolumes]*splitFactor,
+                                               [weighting]*splitFactor, [norm]*splitFactor, gpuIDs)))
+        if 'gpu' in device:
+            xp.cuda.Device(gpuIDs[0]).use()
+
+        #collect results from files
+        unweiAv = read(preList[0])
+        wedgeSum = read(wedgeList[0])
+        for ii in range(1,splitFactor):
+            unweiAv += read(preList[ii])
+            wedgeSum += read(wedgeList[ii])
+        if not keepPartialFiles:
+            for fname in avgNameList + preList + wedgeList:
+                if os.path.exists(fname):
+                    os.remove(fname)
 
     root, ext = os.path.splitext(averageName)
 
@@ -883,16 +1111,18 @@ def averageParallel(particleList,averageName, showProgressBar=False, verbose=Fal
     return Reference(averageName,particleList)
 
 
-def splitParticleList(particleList, setParticleNodesRatio=3):
+def splitParticleList(particleList, setParticleNodesRatio=3, chunksPerNode=1):
     """
     @param particleList: The particle list
     @param setParticleNodesRatio: minimum number of particles per node
     @type setParticleNodesRatio: L{int}
+    @param chunksPerNode: number of sublists per node, more sublists let a dynamic parfor balance the load
+    @type chunksPerNode: L{int}
     @return: list of particle lists, splitFactor (number of processors or smaller for few particles)
     @rtype: list, L{int}
     @author: FF
     """
-    numberOfNodes = mpi.size
+    numberOfNodes = mpi.size * chunksPerNode
     particleNodesRatio = float(len(particleList)) / float(numberOfNodes)
     splitFactor = numberOfNodes
     #make sure each node gets at least setParticleNodesRatio particles.
@@ -918,11 +1148,14 @@ def mergeLists(lists):
             outlist.append(listmember)
     return outlist
 
-def writeParticleListToUniqueFile(pl, dirName=None):
+def writeParticleListToUniqueFile(pl, dirName=None, binary=True):
     """
     write particle list to random filename
     @param pl: particleList
     @type pl: L{pytom.basic.ParticleList}
+    @param binary: write the binary particle list format (L{pytom.basic.structures.ParticleList.toBinaryFile}), \
+    ParticleList.fromXMLFile reads both formats
+    @type binary: bool
     @return: filename
     @rtype: str
     """
@@ -933,5 +1166,8 @@ def writeParticleListToUniqueFile(pl, dirName=None):
     fname = str(uuid4())
     if dirName:
         fname = dirName + '/'+fname
-    pl.toXMLFile(filename=fname)
+    if binary:
+        pl.toBinaryFile(filename=fname)
+    else:
+        pl.toXMLFile(filename=fname)
     return fname
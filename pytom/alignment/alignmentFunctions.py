@@ -330,8 +330,103 @@ def distributeAverage(particleList,averageName,showProgressBar = False,verbose=F
         return average(particleList,averageName,showProgressBar,verbose,createInfoVolumes)
 
 
+class _WedgeTemplates(object):
+    """
+    _WedgeTemplates: Unrotated, full size and centered wedge weightings, one per distinct wedge definition. \
+    Rotating a template gives the same result as L{pytom.basic.filter.rotateWeighting} on the reduced complex \
+    wedge volume, without rebuilding and expanding the wedge for every particle. Only the maxTemplates most \
+    recently used templates are kept, wedges with a CTF differ from particle to particle.
+    """
+    def __init__(self, size_x, size_y, size_z, maxTemplates=8):
+        from collections import OrderedDict
+        self._size = (size_x, size_y, size_z)
+        self._templates = OrderedDict()
+        self._maxTemplates = maxTemplates
+        self._buffer = None
+
+    def rotated(self, wedgeInfo, rotation):
+        """
+        rotated: Get the wedge weighting of wedgeInfo rotated by rotation
+        @param wedgeInfo: wedge of the particle
+        @type wedgeInfo: L{pytom.basic.structures.Wedge}
+        @param rotation: rotation [z1, z2, x]
+        @return: rotated weighting as reduced complex volume
+        @rtype: L{pytom.lib.pytom_volume.vol}
+        """
+        from pytom.lib.pytom_volume import vol, rotate, reducedToFull, fullToReduced
+        from pytom.lib.pytom_fftplan import fftShift
+
+        key = str(wedgeInfo)
+        template = self._templates.get(key)
+        if template is None:
+            template = reducedToFull(wedgeInfo.returnWedgeVolume(self._size[0], self._size[1], self._size[2], False))
+            fftShift(template, True)
+            self._templates[key] = template
+            if len(self._templates) > self._maxTemplates:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(key)
+
+        if self._buffer is None:
+            self._buffer = vol(template.size_x(), template.size_y(), template.size_z())
+        rotate(template, self._buffer, rotation[0], rotation[1], rotation[2])
+        fftShift(self._buffer, True)
+        return fullToReduced(self._buffer)
+
+
+def _readParticleVolume(filename):
+    """
+    _readParticleVolume: Read a particle for averaging. EM and MRC files, also packed in a subtomogram stack, are \
+    read with numpy, which releases the GIL during I/O and lets a background thread read ahead.
+    @return: volume or None if the file does not exist
+    @rtype: L{pytom.lib.pytom_volume.vol} or L{numpy.ndarray}
+    """
+    import os
+    from pytom.agnostic.subtomogram_stack import find_in_stack
+
+    if not os.path.exists(filename) and find_in_stack(filename) is None:
+        return None
+    if filename.split('.')[-1].lower() in ('em', 'mrc', 'rec', 'st'):
+        from pytom.agnostic.io import read
+        return read(filename, keepnumpy=True)
+    else:
+        from pytom.lib.pytom_volume import read
+        return read(filename)
+
+
+def _prefetchParticles(particleList, depth=2):
+    """
+    _prefetchParticles: Iterate over particleList while the next depth particle files are read on a background thread
+    @param particleList: The particles
+    @param depth: number of particles read ahead
+    @return: generator of (particle, volume), volume is None if the file does not exist
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+    from pytom.lib.pytom_volume import vol
+    from pytom.lib.pytom_numpy import vol2npy
+
+    def toVol(data):
+        if data is None or data.__class__ == vol:
+            return data
+        v = vol(*data.shape)
+        vol2npy(v)[:] = data
+        return v
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = deque()
+        for particleObject in particleList:
+            pending.append((particleObject, pool.submit(_readParticleVolume, particleObject.getFilename())))
+            if len(pending) > depth:
+                particleObject, future = pending.popleft()
+                yield particleObject, toVol(future.result())
+        while pending:
+            particleObject, future = pending.popleft()
+            yield particleObject, toVol(future.result())
+
+
 def average( particleList, averageName, showProgressBar=False, verbose=False,
-        createInfoVolumes=False, weighting=False, norm=False, gpuID=None):
+        createInfoVolumes=False, weighting=False, norm=False, gpuID=None, prefetch=2):
     """
     average : Creates new average from a particleList
     @param particleList: The particles
@@ -340,20 +435,22 @@ def average( particleList, averageName, showProgressBar=False, verbose=False,
     @param createInfoVolumes: Create info data (wedge sum, inverted density) too? False by default.
     @param weighting: apply weighting to each average according to its correlation score
     @param norm: apply normalization for each particle
+    @param prefetch: number of particle files read ahead on a background thread
     @return: A new Reference object
     @rtype: L{pytom.basic.structures.Reference}
     @author: Thomas Hrabe
     @change: limit for wedgeSum set to 1% or particles to avoid division by small numbers - FF
+    @change: particles are prefetched, wedges are rotated from cached templates and summed in place
     """
-    from pytom.lib.pytom_volume import read,vol,reducedToFull,limit, complexRealMult
-    from pytom.basic.filter import lowpassFilter, rotateWeighting
+    from pytom.lib.pytom_volume import vol
+    from pytom.lib.pytom_numpy import vol2npy
+    from pytom.basic.filter import lowpassFilter
     from pytom.lib.pytom_volume import transformSpline as transform
     from pytom.basic.fourier import convolute
     from pytom.basic.structures import Reference
     from pytom.basic.normalise import mean0std1
     from pytom.tools.ProgressBar import FixedProgBar
     from math import exp
-    import os
 
     if len(particleList) == 0:
         raise RuntimeError('The particle list is empty. Aborting!')
@@ -376,13 +473,12 @@ def average( particleList, averageName, showProgressBar=False, verbose=False,
             weighting = False
             print("Warning: all scores have been zero - weighting not applied")
 
-    for particleObject in particleList:
+    for particleObject, particle in _prefetchParticles(particleList, prefetch):
         
         if verbose:
             print(particleObject)
 
-        if not os.path.exists(particleObject.getFilename()): continue
-        particle = read(particleObject.getFilename())
+        if particle is None: continue
         if norm: # normalize the particle
             mean0std1(particle) # happen inplace
         
@@ -404,20 +500,15 @@ def average( particleList, averageName, showProgressBar=False, verbose=False,
             
             result = vol(size_x,size_y,size_z)
             result.setAll(0.0)
-            if analytWedge:
-                wedgeSum = wedgeInfo.returnWedgeVolume(wedgeSizeX=size_x, wedgeSizeY=size_y, wedgeSizeZ=size_z)
-            else:
-                # > FF bugfix
-                wedgeSum = wedgeInfo.returnWedgeVolume(size_x,size_y,size_z)
-                # < FF
-                # > TH bugfix
-                #wedgeSum = vol(size_x,size_y,size_z)
-                # < TH
-                #wedgeSum.setAll(0)
-            assert wedgeSum.size_x() == size_x and wedgeSum.size_y() == size_y and wedgeSum.size_z() == size_z/2+1, \
-                    "wedge initialization result in wrong dims :("
+            wedgeSum = vol(size_x, size_y, size_z//2+1)
             wedgeSum.setAll(0)
 
+            # accumulate in place through numpy views on the volumes
+            resultView = vol2npy(result)
+            wedgeSumView = vol2npy(wedgeSum)
+            newParticleView = vol2npy(newParticle)
+            wedgeTemplates = _WedgeTemplates(size_x, size_y, size_z)
+
         ### create spectral wedge weighting
         rotation = particleObject.getRotation()
         rotinvert = rotation.invert()
@@ -426,18 +517,12 @@ def average( particleList, averageName, showProgressBar=False, verbose=False,
             wedge = wedgeInfo.returnWedgeVolume(size_x,size_y,size_z,False, rotinvert)
         else:
             # > FF: interpol bugfix
-            wedge = rotateWeighting( weighting=wedgeInfo.returnWedgeVolume(size_x,size_y,size_z,False),
-                                     z1=rotinvert[0], z2=rotinvert[1], x=rotinvert[2], mask=None,
-                                     isReducedComplex=True, returnReducedComplex=True)
+            wedge = wedgeTemplates.rotated(wedgeInfo, rotinvert)
             # < FF
-            # > TH bugfix
-            #wedgeVolume = wedgeInfo.returnWedgeVolume(wedgeSizeX=size_x, wedgeSizeY=size_y, wedgeSizeZ=size_z,
-            #                                    humanUnderstandable=True, rotation=rotinvert)
-            #wedge = rotate(volume=wedgeVolume, rotation=rotinvert, imethod='linear')
-            # < TH
+        wedgeView = vol2npy(wedge)
 
         if wedgeInfo._type == 'Wedge3dCTF':
-            wedge = wedge * wedge
+            wedgeView *= wedgeView
 
         ### shift and rotate particle
         shiftV = particleObject.getShift()
@@ -450,11 +535,10 @@ def average( particleList, averageName, showProgressBar=False, verbose=False,
             weight = 1.-particleObject.getScore().getValue()
             #weight = weight**2
             weight = exp(-1.*weight)
-            result = result + newParticle * weight
-            wedgeSum = wedgeSum + wedge * weight
-        else:
-            result = result + newParticle
-            wedgeSum = wedgeSum + wedge
+            newParticleView *= weight
+            wedgeView *= weight
+        resultView += newParticleView
+        wedgeSumView += wedgeView
         
         if showProgressBar:
             numberAlignedParticles = numberAlignedParticles + 1
@@ -498,6 +582,7 @@ def average2(particleList, weighting=False, norm=False, determine_resolution=Fal
     from pytom.tools.ProgressBar import FixedProgBar
     from pytom.basic.filter import lowpassFilter, rotateWeighting
     from math import exp
+    import os
     
     if len(particleList) == 0:
         raise RuntimeError('The particlelist provided is empty. Aborting!')
@@ -515,7 +600,11 @@ def average2(particleList, weighting=False, norm=False, determine_resolution=Fal
     
     is_odd = True
     for particleObject in particleList:
-        particle = read(particleObject.getFilename(), 0,0,0,0,0,0,0,0,0, binning,binning,binning)
+        if os.path.exists(particleObject.getFilename()):
+            particle = read(particleObject.getFilename(), 0,0,0,0,0,0,0,0,0, binning,binning,binning)
+        else:
+            # packed in a subtomogram stack
+            particle = particleObject.getVolume(binning)
         if norm:
             mean0std1(particle)
         wedgeInfo = particleObject.getWedge()
@@ -876,6 +965,208 @@ def bestAlignment(particle, reference, referenceWeighting, wedgeInfo, rotations,
     return bestPeak
 
 
+def _wedgeWeighting(wedgeInfo, size_x, size_y, size_z):
+    """
+    _wedgeWeighting: Reduced complex weighting that wedgeInfo.apply multiplies the Fourier transform of a volume with
+    @param wedgeInfo: wedge
+    @type wedgeInfo: L{pytom.basic.structures.Wedge}
+    @return: the weighting or None if wedgeInfo.apply returns the volume unchanged
+    @rtype: L{pytom.lib.pytom_volume.vol}
+    """
+    from pytom.basic.structures import Wedge, SingleTiltWedge, WedgeInfo, Wedge3dCTF
+    from pytom.basic.fourier import ftshift
+    from pytom.lib.pytom_volume import fullToReduced
+
+    wedgeObject = wedgeInfo.getWedgeObject() if wedgeInfo.__class__ == Wedge else wedgeInfo
+
+    if wedgeObject.__class__ in (SingleTiltWedge, WedgeInfo) and \
+            not (wedgeObject._wedge_angle1 > 0 or wedgeObject._wedge_angle2 > 0):
+        return None
+    if wedgeObject.__class__ == Wedge3dCTF:
+        weighting = wedgeObject.returnWedgeVolume()
+        if weighting.size_z() == weighting.size_x():
+            weighting = fullToReduced(ftshift(weighting, inplace=False))
+        return weighting
+    return wedgeObject.returnWedgeVolume(size_x, size_y, size_z, False)
+
+
+def _flcfFourier(fParticle, template, mask, p, std_v):
+    """
+    _flcfFourier: L{pytom.basic.correlation.flcf} of a particle given by its Fourier transform
+    @param fParticle: Fourier transform of the particle
+    @type fParticle: L{pytom.lib.pytom_volume.vol_comp}
+    @param template: template, same size as the particle
+    @param mask: template mask
+    @param p: sum of the mask
+    @param std_v: standard deviation of the particle under the mask
+    @return: the local correlation function
+    @rtype: L{pytom.lib.pytom_volume.vol}
+    """
+    from pytom.basic.correlation import meanValueUnderMask, stdValueUnderMask
+    from pytom.basic.fourier import fft, ifft, iftshift
+    from pytom.lib.pytom_volume import conjugate
+
+    meanT = meanValueUnderMask(template, mask, p)
+    stdT = stdValueUnderMask(template, mask, meanT, p)
+    temp = (template - meanT)/stdT
+    temp = temp * mask
+
+    fT = fft(temp)
+    conjugate(fT)
+    result = iftshift(ifft(fT*fParticle))/std_v
+    result.shiftscale(0, 1/(template.numelem()*p))
+
+    return result
+
+
+def bestAlignmentBatch(particles, reference, referenceWeighting, wedgeInfos, rotations, scoreObject=0, mask=None,
+                       preprocessing=None, verbose=False):
+    """
+    bestAlignmentBatch: Determines the best alignment of several particles relative to the same reference for the \
+    same rotations. Gives the result of L{bestAlignment} (without binning) for every particle, but the rotations \
+    are the outer loop: the rotated reference and its Fourier transform, the rotated mask and the rotated reference \
+    weighting are computed once per rotation for all particles. Only the wedge of each particle is applied per \
+    particle, in Fourier space. For FLCF scoring the Fourier transforms of the particles are kept in memory.
+    @param particles: particles
+    @type particles: L{list} of L{pytom.lib.pytom_volume.vol}
+    @param reference: A reference
+    @type reference: L{pytom.lib.pytom_volume.vol}
+    @param referenceWeighting: Fourier weighting of the reference (sum of wedges for instance) or 'False'
+    @type referenceWeighting: L{pytom.basic.structures.vol} or str
+    @param wedgeInfos: wedge of each particle
+    @type wedgeInfos: L{list} of L{pytom.basic.structures.Wedge}
+    @param rotations: All rotations to be scanned
+    @type rotations: L{list} of [z1, z2, x]
+    @param scoreObject:
+    @type scoreObject: L{pytom.score.score.Score}
+    @param mask: real-space mask for correlation function
+    @type mask: L{pytom.basic.structures.Mask}
+    @param preprocessing: Class storing preprocessing of particle and reference such as bandpass
+    @type preprocessing: L{pytom.alignment.preprocessing.Preprocessing}
+    @param verbose: Print out infos
+    @return: Returns the best peak of every particle
+    @rtype: L{list} of L{pytom.alignment.structures.Peak}
+    """
+    from pytom.basic.correlation import sub_pixel_peak, meanUnderMask, stdUnderMask
+    from pytom.basic.fourier import fft, ifft
+    from pytom.basic.filter import rotateWeighting
+    from pytom.basic.structures import Rotation, Shift, Mask
+    from pytom.alignment.structures import Peak
+    from pytom.alignment.preprocessing import Preprocessing
+    from pytom.lib.pytom_volume import peak, vol, vol_comp, transform, complexRealMult, initSphere, sum
+
+    assert len(particles) == len(wedgeInfos), "bestAlignmentBatch: one wedge per particle needed"
+    if len(rotations) == 0:
+        raise Exception('bestAlignmentBatch: No rotations are sampled! Something is wrong with input rotations')
+    assert reference.__class__ == vol, "reference not of type vol"
+    assert (referenceWeighting.__class__ == vol or referenceWeighting.__class__ == str), \
+        "referenceWeighting not volume or str"
+
+    if scoreObject == 0 or not scoreObject:
+        from pytom.basic.score import xcfScore
+        scoreObject = xcfScore()
+    flcfScore = scoreObject._type == 'FLCFScore'
+    if preprocessing is None:
+        preprocessing = Preprocessing()
+
+    size_x, size_y, size_z = reference.size_x(), reference.size_y(), reference.size_z()
+    centerX, centerY, centerZ = int(size_x/2), int(size_y/2), int(size_z/2)
+
+    m, p = None, None
+    if mask:
+        assert mask.__class__ == Mask, "Mask not of type Mask"
+        m = mask.getVolume()
+    elif flcfScore:
+        # the default mask of flcf
+        m = vol(size_x, size_y, size_z)
+        m.setAll(0)
+        initSphere(m, size_x/2, 0, 0, size_x/2, size_y/2, size_z/2)
+    if m is not None:
+        p = sum(m)
+
+    # particles with their wedge applied, their wedge weighting and for FLCF their Fourier transform
+    prepared, weightings, fourier, std_v = [], [], [], []
+    for particle, wedgeInfo in zip(particles, wedgeInfos):
+        assert particle.__class__ == vol, "particle not of type vol"
+        particle = wedgeInfo.apply(particle)
+        preprocessing.setTaper(taper=particle.size_x()/10.)
+        particle = preprocessing.apply(volume=particle, bypassFlag=True)
+        prepared.append(particle)
+        weightings.append(_wedgeWeighting(wedgeInfo, size_x, size_y, size_z))
+        if flcfScore:
+            fourier.append(fft(particle))
+        std_v.append(stdUnderMask(particle, m, p, meanUnderMask(particle, m, p)) if m is not None else None)
+
+    bestPeaks = [None] * len(particles)
+    for currentRotation in rotations:
+        if mask:
+            m = mask.getVolume(currentRotation)
+            if (not mask.isSphere()) and flcfScore:
+                std_v = [stdUnderMask(v, m, p, meanUnderMask(v, m, p)) for v in prepared]
+
+        rotatedVolume = vol(size_x, size_y, size_z)
+        transform(reference, rotatedVolume, currentRotation[0], currentRotation[1], currentRotation[2],
+                  centerX, centerY, centerZ, 0, 0, 0, 0, 0, 0)
+        fRotated = fft(rotatedVolume)
+
+        if not referenceWeighting.__class__ == str:
+            from pytom.lib.pytom_freqweight import weight
+            weightingRotated = weight(rotateWeighting(weighting=referenceWeighting, z1=currentRotation[0],
+                                                      z2=currentRotation[1], x=currentRotation[2],
+                                                      isReducedComplex=True, returnReducedComplex=True,
+                                                      binarize=False))
+        else:
+            weightingRotated = None
+
+        for i in range(len(particles)):
+            if weightings[i] is None:
+                simulatedVol = rotatedVolume
+            else:
+                simulatedVol = ifft(complexRealMult(fRotated, weightings[i]))
+                simulatedVol.shiftscale(0.0, 1/float(size_x*size_y*size_z))
+            if mask:
+                simulatedVol = simulatedVol * m
+            simulatedVol = preprocessing.apply(volume=simulatedVol, bypassFlag=True)
+
+            if flcfScore:
+                fParticle, particleStd = fourier[i], std_v[i]
+                if weightingRotated is not None:
+                    fParticle = vol_comp(fParticle.size_x(), fParticle.size_y(), fParticle.size_z())
+                    fParticle.copyVolume(fourier[i])
+                    weightingRotated.apply(fParticle)
+                    if not mask:
+                        # without a mask bestAlignment normalizes by the weighted particle
+                        weighted = ifft(fParticle)
+                        weighted.shiftscale(0.0, 1/float(size_x*size_y*size_z))
+                        particleStd = stdUnderMask(weighted, m, p, meanUnderMask(weighted, m, p))
+                scoringResult = scoreObject._peakPrior.apply(_flcfFourier(fParticle, simulatedVol, m, p, particleStd))
+            else:
+                particleCopy = prepared[i]
+                if weightingRotated is not None:
+                    from pytom.basic.filter import filter
+                    particleCopy = list(filter(prepared[i], weightingRotated))[0]
+                scoringResult = scoreObject.score(particleCopy, simulatedVol, m, std_v[i])
+
+            pk = peak(scoringResult)
+            [peakValue, peakPosition] = sub_pixel_peak(score_volume=scoringResult, coordinates=pk,
+                                                       interpolation='Quadratic', verbose=False)
+            assert peakValue == peakValue, "peakValue seems to be NaN"
+
+            newPeak = Peak(peakValue, Rotation(currentRotation), Shift(peakPosition[0] - centerX,
+                                                                       peakPosition[1] - centerY,
+                                                                       peakPosition[2] - centerZ))
+            if bestPeaks[i] is None or bestPeaks[i] < newPeak:
+                bestPeaks[i] = newPeak
+
+    if verbose:
+        for i, bestPeak in enumerate(bestPeaks):
+            print('BestAlignment %d: z1=%3.1f, z2=%3.1f, x=%3.1f; Dx=%2.2f, Dy=%2.2f, Dz=%2.2f, CC=%2.3f' % \
+                  (i, bestPeak.getRotation()[0], bestPeak.getRotation()[1], bestPeak.getRotation()[2],
+                   bestPeak.getShift()[0], bestPeak.getShift()[1], bestPeak.getShift()[2], bestPeak.getScoreValue()))
+    scoreObject._peakPrior.reset_weight()
+    return bestPeaks
+
+
 def bestAlignmentGPU(particle, rotations, plan, preprocessing=None, wedgeInfo=None, isSphere=True,
                      rotation_order='rzxz', max_shift=40, profile=False, interpolation_factor=0.1):
     """
@@ -1212,6 +1212,64 @@ def star2xml(filename, target, prefix='', pixelsize=1., binningPyTom=1., binning
 
 def star2pl(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
             angle_file='', sorted_folder='', rln_voltage=None, rln_spherical_aberration=None):
+    pl = star_to_particle_list(filename, binningPyTom, binningWarpM, wedge_angles)
+
+    newFilename = name_to_format(filename if outname == '' else outname, target, "xml")
+
+    pl.toXMLFile(newFilename)
+
+
+def star2plb(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
+             angle_file='', sorted_folder='', rln_voltage=None, rln_spherical_aberration=None):
+    """
+    Conversion of a relion star file to a binary particle list, see L{pytom.basic.structures.ParticleList.toBinaryFile}.
+    """
+    pl = star_to_particle_list(filename, binningPyTom, binningWarpM, wedge_angles)
+
+    pl.toBinaryFile(name_to_format(filename if outname == '' else outname, target, "plb"))
+
+
+def plb2star(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
+             angle_file='', sorted_folder='', rln_voltage=None, rln_spherical_aberration=None):
+    # pl2star reads binary particle lists as well
+    pl2star(filename, target, prefix, pixelsize, binningPyTom, binningWarpM, outname, wedge_angles, angle_file,
+            sorted_folder, rln_voltage, rln_spherical_aberration)
+
+
+def pl2plb(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
+           angle_file='', sorted_folder='', rln_voltage=None, rln_spherical_aberration=None):
+    """
+    Conversion of a particle list XML file to the binary particle list format.
+    """
+    from pytom.basic.particle_list_io import convertXMLToBinary
+    convertXMLToBinary(filename, name_to_format(filename if outname == '' else outname, target, "plb"))
+
+
+def plb2pl(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
+           angle_file='', sorted_folder='', rln_voltage=None, rln_spherical_aberration=None):
+    """
+    Conversion of a binary particle list to a particle list XML file.
+    """
+    from pytom.basic.particle_list_io import convertBinaryToXML
+    convertBinaryToXML(filename, name_to_format(filename if outname == '' else outname, target, "xml"))
+
+
+def plb2xml(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
+            angle_file='', sorted_folder='', rln_voltage=None, rln_spherical_aberration=None):
+    plb2pl(filename, target, prefix, pixelsize, binningPyTom, binningWarpM, outname, wedge_angles, angle_file,
+           sorted_folder, rln_voltage, rln_spherical_aberration)
+
+
+def star_to_particle_list(filename, binningPyTom=1., binningWarpM=1., wedge_angles=None):
+    """
+    Read a relion star file into a particle list.
+
+    @param filename: star file
+    @param binningPyTom: (linear) binning factor of the pytom tomogram
+    @param binningWarpM: (linear) binning factor of the warp/m volumes
+    @param wedge_angles: wedge angles of the particles, they override the 3d ctf volumes of the star file
+    @rtype: L{pytom.basic.structures.ParticleList}
+    """
     from pytom.agnostic.tools import convert_angles
     from pytom.agnostic.io import read_star
     from pytom.basic.structures import ParticleList, Particle, PickPosition, Rotation, Shift, Wedge
@@ -1270,9 +1328,7 @@ def star2pl(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningW
 
         pl.append(p)
 
-    newFilename = name_to_format(filename if outname == '' else outname, target, "xml")
-
-    pl.toXMLFile(newFilename)
+    return pl
 
 
 def xf2txt(filename, target, prefix='', pixelsize=1., binningPyTom=1., binningWarpM=1., outname='', wedge_angles=None,
@@ -0,0 +1,271 @@
+'''
+Streaming reader and writer of particle list XML files.
+
+L{pytom.basic.structures.PyTomClass.fromXMLFile} reads a whole file into a string, parses it into one lxml tree and
+L{pytom.basic.structures.ParticleList.fromXML} then queries every particle element, so the string, the tree and the
+particles are in memory at the same time. The reader here parses the file incrementally (lxml iterparse), creates
+each particle as soon as its element is complete and frees the element right after. The writer serialises one
+particle at a time instead of building the XML of the whole list first. Both produce and accept the same files as
+the tree based functions.
+
+For job files and messages that are only read by other pytom processes, particle lists can be exchanged in the
+binary format of L{pytom.basic.particle_table.ParticleTable} instead, as file (L{isBinaryParticleListFile},
+L{convertXMLToBinary}, L{convertBinaryToXML}) or embedded into XML (L{toBinaryXML}, L{particleListFromXML}).
+'''
+
+# first bytes of a zip archive, i.e. of a binary particle list
+_BINARY_MAGIC = b'PK\x03\x04'
+
+
+def iterParticlesXML(filename):
+    """
+    iterParticlesXML: Iterate over the particles of a particle list XML file, only the element of the current \
+    particle is kept in memory
+    @param filename: particle list file
+    @type filename: L{str}
+    @rtype: generator of L{pytom.basic.structures.Particle}
+    """
+    from lxml import etree
+    from pytom.basic.structures import Particle
+    from pytom.tools.files import checkFileExists
+
+    if not checkFileExists(filename):
+        raise IOError('File ' + filename + ' not found!')
+
+    for _, element in etree.iterparse(filename, events=('end',), tag='Particle', remove_comments=True):
+        parent = element.getparent()
+        if parent is None or parent.tag != 'ParticleList':
+            continue
+
+        particle = Particle('')
+        particle.fromXML(element)
+        yield particle
+
+        # free the element and the already processed siblings, the parent keeps references to them
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def readParticleListXML(filename, particleList=None):
+    """
+    readParticleListXML: Load a particle list XML file incrementally
+    @param filename: particle list file
+    @type filename: L{str}
+    @param particleList: list to fill, its current particles are replaced. A new list if None.
+    @type particleList: L{pytom.basic.structures.ParticleList}
+    @rtype: L{pytom.basic.structures.ParticleList}
+    """
+    from pytom.basic.structures import ParticleList
+
+    if particleList is None:
+        particleList = ParticleList()
+    particleList._particleList = list(iterParticlesXML(filename))
+    particleList._XMLfilename = filename
+    return particleList
+
+
+def writeParticleListXML(particleList, filename):
+    """
+    writeParticleListXML: Write a particle list XML file one particle at a time. The file is identical to the one \
+    written by L{pytom.basic.structures.PyTomClass.toXMLFile}.
+    @param particleList: the particles
+    @type particleList: L{pytom.basic.structures.ParticleList} or any iterable of particles
+    @param filename: particle list file
+    @type filename: L{str}
+    """
+    from lxml import etree
+    import pytom
+
+    with open(filename, 'w') as file:
+        file.write('<!-- PyTom Version: ' + pytom.__version__ + ' -->\n')
+
+        empty = True
+        for particle in getattr(particleList, '_particleList', particleList):
+            if empty:
+                file.write('<ParticleList>\n')
+                empty = False
+            # same indentation as the pretty printed tree of the whole list
+            lines = etree.tostring(particle.toXML(), pretty_print=True).decode('utf-8').splitlines(True)
+            file.write(''.join('  ' + line for line in lines))
+
+        file.write('<ParticleList/>' if empty else '</ParticleList>')
+
+
+def isBinaryParticleListFile(filename):
+    """
+    isBinaryParticleListFile: Check whether a file is a binary particle list \
+    (L{pytom.basic.structures.ParticleList.toBinaryFile}) rather than XML
+    @param filename: particle list file
+    @type filename: L{str}
+    @rtype: L{bool}
+    """
+    with open(filename, 'rb') as file:
+        return file.read(len(_BINARY_MAGIC)) == _BINARY_MAGIC
+
+
+def convertXMLToBinary(xmlFilename, binaryFilename):
+    """
+    convertXMLToBinary: Convert a particle list XML file to the binary format
+    @param xmlFilename: particle list XML file
+    @type xmlFilename: L{str}
+    @param binaryFilename: binary particle list file
+    @type binaryFilename: L{str}
+    """
+    readParticleListXML(xmlFilename).toTable().toBinaryFile(binaryFilename)
+
+
+def convertBinaryToXML(binaryFilename, xmlFilename):
+    """
+    convertBinaryToXML: Convert a binary particle list to XML, one particle at a time
+    @param binaryFilename: binary particle list file
+    @type binaryFilename: L{str}
+    @param xmlFilename: particle list XML file
+    @type xmlFilename: L{str}
+    """
+    from pytom.basic.particle_table import ParticleTable
+    writeParticleListXML(ParticleTable.fromBinaryFile(binaryFilename).particles(), xmlFilename)
+
+
+def toBinaryXML(particleList):
+    """
+    toBinaryXML: Element with the base64 encoded binary particle list, to replace the ParticleList element in job \
+    files and messages between pytom processes. Read with L{particleListFromXML}.
+    @param particleList: the particles
+    @type particleList: L{pytom.basic.structures.ParticleList}
+    @rtype: L{lxml.etree._Element}
+    """
+    import base64
+    import io
+    from lxml import etree
+
+    buffer = io.BytesIO()
+    particleList.toTable().toBinaryFile(buffer)
+    element = etree.Element('BinaryParticleList')
+    element.text = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return element
+
+
+def particleListFromXML(xmlObj, directory=None):
+    """
+    particleListFromXML: Particle list of the first ParticleList or BinaryParticleList (L{toBinaryXML}) child of an \
+    element
+    @param xmlObj: parent element
+    @type xmlObj: L{lxml.etree._Element}
+    @param directory: directory of the particle list
+    @type directory: L{str}
+    @rtype: L{pytom.basic.structures.ParticleList}
+    """
+    import base64
+    import io
+    from pytom.basic.structures import ParticleList
+    from pytom.basic.particle_table import ParticleTable
+
+    particleList = ParticleList(directory)
+    binary = xmlObj.find('BinaryParticleList')
+    if binary is not None:
+        table = ParticleTable.fromBinaryFile(io.BytesIO(base64.b64decode(binary.text or '')))
+        particleList._particleList = list(table.particles())
+    else:
+        particleList.fromXML(xmlObj.xpath('ParticleList')[0])
+    return particleList
+
+
+def _syntheticParticleList(numberOfParticles):
+    """
+    Particle list with distinct rotations, shifts, scores and classes in a few tomograms.
+    """
+    import numpy as np
+    from pytom.basic.structures import Particle, ParticleList, Rotation, Shift, PickPosition, SingleTiltWedge
+    from pytom.basic.score import FLCFScore
+
+    rng = np.random.default_rng(0)
+    wedge = SingleTiltWedge(30)
+    particleList = ParticleList('./')
+    for i, (angles, shift, position, value) in enumerate(zip(rng.uniform(0, 360, (numberOfParticles, 3)).tolist(),
+                                                             rng.normal(0, 2, (numberOfParticles, 3)).tolist(),
+                                                             rng.uniform(0, 1000, (numberOfParticles, 3)).tolist(),
+                                                             rng.random(numberOfParticles).tolist())):
+        score = FLCFScore()
+        score.setValue(value)
+        particleList.append(Particle(f'particles/particle_{i}.mrc', rotation=Rotation(*angles), shift=Shift(*shift),
+                                     wedge=wedge, className=i % 5, score=score,
+                                     pickPosition=PickPosition(*position, originFilename=f'tomogram_{i % 20}.mrc')))
+    return particleList
+
+
+def _measure(function, *args):
+    """
+    Run function in a child process, return its run time and the peak resident memory of the child.
+    """
+    import multiprocessing
+    import resource
+    import time
+
+    def run(queue):
+        t = time.time()
+        function(*args)
+        queue.put((time.time() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.))
+
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=run, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _benchmark(sizes=(10000, 100000, 1000000), directory=None):
+    """
+    _benchmark: Time and peak memory of the tree based and the streaming XML reader and writer and of the binary \
+    format on synthetic particle lists. Every measurement runs in its own process (the writers include building the \
+    synthetic list).
+    @param sizes: numbers of particles
+    @param directory: directory of the temporary files, the system default if None
+    """
+    import os
+    import tempfile
+    from pytom.basic.structures import ParticleList, PyTomClass
+
+    def treeWrite(n, filename):
+        PyTomClass.toXMLFile(_syntheticParticleList(n), filename)
+
+    def streamWrite(n, filename):
+        writeParticleListXML(_syntheticParticleList(n), filename)
+
+    def treeRead(filename):
+        PyTomClass.fromXMLFile(ParticleList(), filename)
+
+    def streamRead(filename):
+        readParticleListXML(filename)
+
+    def binaryWrite(n, filename):
+        _syntheticParticleList(n).toBinaryFile(filename)
+
+    def binaryRead(filename):
+        ParticleList().fromBinaryFile(filename)
+
+    print(f'{"particles":>10} {"operation":>12} {"engine":>8} {"time [s]":>10} {"peak RSS [MB]":>14}')
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for n in sizes:
+            treeFile, streamFile = os.path.join(tmp, 'tree.xml'), os.path.join(tmp, 'stream.xml')
+            binaryFile = os.path.join(tmp, 'binary.plb')
+            for operation, engine, function, args in (('write', 'tree', treeWrite, (n, treeFile)),
+                                                      ('write', 'stream', streamWrite, (n, streamFile)),
+                                                      ('write', 'binary', binaryWrite, (n, binaryFile)),
+                                                      ('read', 'tree', treeRead, (treeFile,)),
+                                                      ('read', 'stream', streamRead, (treeFile,)),
+                                                      ('read', 'binary', binaryRead, (binaryFile,))):
+                elapsed, memory = _measure(function, *args)
+                print(f'{n:10d} {operation:>12} {engine:>8} {elapsed:10.2f} {memory:14.1f}')
+            print(f'{n:10d} {"file size":>12} {"xml":>8} {os.path.getsize(treeFile) / 1024 ** 2:10.1f} MB')
+            print(f'{n:10d} {"file size":>12} {"binary":>8} {os.path.getsize(binaryFile) / 1024 ** 2:10.1f} MB')
+
+            with open(treeFile) as a, open(streamFile) as b:
+                if a.read() != b.read():
+                    raise RuntimeError('The streaming writer does not reproduce the particle list file!')
+
+
+if __name__ == '__main__':
+    _benchmark()
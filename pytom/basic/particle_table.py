@@ -0,0 +1,469 @@
+'''
+Columnar storage of particle lists.
+
+A L{pytom.basic.structures.ParticleList} is a python list of L{pytom.basic.structures.Particle} objects, so every
+query on it (select a class, split by tomogram, find a filename) walks over all objects or even serialises the
+whole list to XML. A L{ParticleTable} holds the same information as a numpy structured array with one row per
+particle. Strings (filenames, class names, tomograms, project directories, rotation paradigms) and objects (wedges,
+score types) are stored once in per column tables and the rows keep indices into them. Selections, group-by splits and
+sorting are vectorized and L{Particle} objects are only created for the rows that are accessed.
+
+Tables are stored as uncompressed npz archives (L{ParticleTable.toBinaryFile}): the rows as one structured array and
+every string column as its NUL terminated utf-8 strings, wedges and score types as their XML. The rows can be memory
+mapped straight from the archive, so a worker that only needs a few particles does not read the whole list.
+'''
+import copy
+import numpy as np
+
+# columns that index a table of strings or objects, the index -1 stands for None
+STRING_COLUMNS = ('filename', 'origin', 'paradigm', 'class', 'projectDir', 'wedge', 'scoreType')
+
+PARTICLE_DTYPE = np.dtype([('filename', np.int64),
+                           ('position', np.float64, (3,)),
+                           ('origin', np.int32),
+                           ('binning', np.float64),
+                           ('refmarker', np.int32),
+                           ('rotation', np.float64, (3,)),
+                           ('paradigm', np.int32),
+                           ('shift', np.float64, (3,)),
+                           ('score', np.float64),
+                           ('scoreType', np.int32),
+                           ('class', np.int32),
+                           ('wedge', np.int32),
+                           ('projectDir', np.int32)])
+
+# version of the binary format, stored in every file
+BINARY_VERSION = 1
+
+
+class _Table(object):
+    """
+    Deduplicating table of the values of a string or object column.
+    """
+    def __init__(self, values=None):
+        self.values = []
+        self._lookup = {}
+        for value in values or []:
+            self.add(value)
+
+    def add(self, value, key=None):
+        """
+        @param value: the value
+        @param key: hashable key of the value, the value itself by default
+        @return: index of the value
+        @rtype: L{int}
+        """
+        if value is None:
+            return -1
+        key = value if key is None else key
+        index = self._lookup.get(key)
+        if index is None:
+            index = len(self.values)
+            self._lookup[key] = index
+            self.values.append(value)
+        return index
+
+    def __getitem__(self, index):
+        return None if index < 0 else self.values[index]
+
+
+def _encodeStrings(values):
+    """
+    Strings as one array of NUL terminated utf-8 strings.
+    """
+    return np.frombuffer(''.join(value + '\0' for value in values).encode('utf-8'), dtype=np.uint8)
+
+
+def _decodeStrings(array):
+    return array.tobytes().decode('utf-8').split('\0')[:-1]
+
+
+def _toXMLString(obj):
+    from lxml import etree
+    return etree.tostring(obj.toXML()).decode('utf-8')
+
+
+def _wedgeFromXMLString(string):
+    from lxml import etree
+    from pytom.basic.structures import Wedge
+
+    wedge = Wedge()
+    wedge.fromXML(etree.fromstring(string))
+    return wedge
+
+
+def _scoreFromXMLString(string):
+    from lxml import etree
+    from pytom.basic.score import fromXML
+    return fromXML(etree.fromstring(string))
+
+
+def _memmapMember(filename, name):
+    """
+    Memory map an array of an uncompressed npz archive.
+    @return: the array or None if the member is compressed
+    """
+    import struct
+    import zipfile
+
+    with zipfile.ZipFile(filename) as archive:
+        info = archive.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(filename, 'rb') as file:
+        # the data of a member starts after its local header, which has a variable length name and extra field
+        file.seek(info.header_offset)
+        nameLength, extraLength = struct.unpack('<HH', file.read(30)[26:30])
+        file.seek(info.header_offset + 30 + nameLength + extraLength)
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortranOrder else 'C')
+
+
+def _scoreKey(score):
+    """
+    Key of the score type: everything but the value.
+    """
+    peakPrior = score.getPeakPrior()
+    attributes = tuple(sorted((k, v) for k, v in vars(score).items()
+                              if k != 'scoreValue' and isinstance(v, (int, float, str, bool))))
+    return (score.__class__, attributes, peakPrior.getFileName(), peakPrior.getRadius(), peakPrior._smooth)
+
+
+class ParticleTable(object):
+    """
+    ParticleTable: Columnar representation of a L{pytom.basic.structures.ParticleList}. Rows can be selected with \
+    index arrays or boolean masks (e.g. table.select(table['score'] > 0.5)), the string columns have hash indices \
+    (L{rows}, L{row}, L{groupBy}).
+    """
+    def __init__(self, data=None, tables=None, directory=None):
+        """
+        @param data: rows
+        @type data: L{numpy.ndarray} of dtype L{PARTICLE_DTYPE}
+        @param tables: values of the string and object columns, shared with the tables this one was selected from
+        @type tables: L{dict}
+        @param directory: source directory of the particle list
+        @type directory: L{str}
+        """
+        self.data = np.zeros(0, dtype=PARTICLE_DTYPE) if data is None else data
+        self.tables = tables if tables is not None else {name: _Table() for name in STRING_COLUMNS}
+        self.directory = directory
+        self._indices = {}
+        self._particles = {}
+        self._wedges = {}
+
+    @classmethod
+    def fromParticleList(cls, particleList):
+        """
+        fromParticleList: Create the columns of a particle list
+        @param particleList: particle list
+        @type particleList: L{pytom.basic.structures.ParticleList}
+        @rtype: L{ParticleTable}
+        """
+        table = cls(np.zeros(len(particleList), dtype=PARTICLE_DTYPE), directory=particleList.getDirectory())
+        data, tables = table.data, table.tables
+        filenames, origins, paradigms = tables['filename'], tables['origin'], tables['paradigm']
+        classes, projectDirs, wedges, scoreTypes = tables['class'], tables['projectDir'], tables['wedge'], \
+            tables['scoreType']
+
+        for i, particle in enumerate(particleList._particleList):
+            row = data[i]
+            # particles have unique filenames, so the filename table is not deduplicated
+            row['filename'] = len(filenames.values)
+            filenames.values.append(particle.getFilename())
+
+            pickPosition = particle.getPickPosition()
+            row['position'] = pickPosition.toVector()
+            row['origin'] = origins.add(pickPosition.getOriginFilename())
+            row['binning'] = pickPosition.getBinningFactor()
+            row['refmarker'] = pickPosition.getRefMarkerIndex()
+
+            rotation = particle.getRotation()
+            row['rotation'] = rotation.toList()
+            row['paradigm'] = paradigms.add(rotation.getParadigm())
+            row['shift'] = particle.getShift().toVector()
+
+            # deduplicated by identity, particles that shared a wedge object keep sharing it
+            row['wedge'] = wedges.add(particle.getWedge(), key=id(particle.getWedge()))
+            row['class'] = classes.add(particle.getClass())
+            row['projectDir'] = projectDirs.add(particle.getInfoGUI().getProjectDir())
+
+            score = particle.getScore()
+            if score is None:
+                row['scoreType'] = -1
+                row['score'] = np.nan
+            else:
+                row['scoreType'] = scoreTypes.add(score, key=_scoreKey(score))
+                value = score.getValue()
+                row['score'] = np.nan if value == 'NAN' else value
+
+        return table
+
+    @classmethod
+    def fromBinaryFile(cls, filename, mmap=True):
+        """
+        fromBinaryFile: Load a table stored with L{toBinaryFile}
+        @param filename: file name or file object
+        @param mmap: memory map the rows (read only) instead of reading them, only for file names
+        @type mmap: L{bool}
+        @rtype: L{ParticleTable}
+        """
+        with np.load(filename) as archive:
+            if 'particles' not in archive.files or 'version' not in archive.files:
+                raise IOError('Not a binary particle list!')
+            if int(archive['version'][0]) != BINARY_VERSION:
+                raise IOError('Binary particle list version %d is not supported!' % int(archive['version'][0]))
+
+            tables = {}
+            for column in STRING_COLUMNS:
+                values = _decodeStrings(archive['strings_' + column])
+                if column == 'wedge':
+                    values = [_wedgeFromXMLString(value) for value in values]
+                elif column == 'scoreType':
+                    values = [_scoreFromXMLString(value) for value in values]
+                # the values are unique, only the lookup of add is missing
+                tables[column] = _Table()
+                tables[column].values = values
+            directory = _decodeStrings(archive['directory'])
+
+            data = _memmapMember(filename, 'particles') if mmap and isinstance(filename, str) else None
+            if data is None:
+                data = archive['particles']
+
+        return cls(data, tables, directory[0] if directory else None)
+
+    def _compact(self, column, key):
+        """
+        Codes of a string column and the keys of the values used by this table, without duplicates.
+        """
+        codes = self.data[column]
+        table, keys = self.tables[column], _Table()
+        # the last entry maps -1 (None) to itself
+        remap = np.full(len(table.values) + 1, -1, dtype=codes.dtype)
+        for i in np.unique(codes).tolist():
+            if i >= 0:
+                remap[i] = keys.add(key(table.values[i]))
+        return remap[codes], keys.values
+
+    def toBinaryFile(self, filename):
+        """
+        toBinaryFile: Store the table as uncompressed npz archive, see L{fromBinaryFile}
+        @param filename: file name or file object, no .npz extension is appended
+        """
+        data = np.array(self.data)
+        arrays = {}
+        for column in STRING_COLUMNS:
+            key = _toXMLString if column in ('wedge', 'scoreType') else str
+            data[column], values = self._compact(column, key)
+            arrays['strings_' + column] = _encodeStrings(values)
+        arrays['directory'] = _encodeStrings([] if self.directory is None else [self.directory])
+
+        if isinstance(filename, str):
+            with open(filename, 'wb') as file:
+                np.savez(file, particles=data, version=np.array([BINARY_VERSION]), **arrays)
+        else:
+            np.savez(filename, particles=data, version=np.array([BINARY_VERSION]), **arrays)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, column):
+        """
+        @param column: column name
+        @return: the column, string columns as indices into L{values}
+        @rtype: L{numpy.ndarray}
+        """
+        return self.data[column]
+
+    def values(self, column):
+        """
+        values: The value of a string or object column for every row
+        @param column: column name
+        @rtype: L{list}
+        """
+        table = self.tables[column]
+        return [table[i] for i in self.data[column]]
+
+    def _keys(self, column):
+        """
+        Unique indices of a string column and their keys as used in the XML (None for absent elements).
+        """
+        table = self.tables[column]
+        unique = np.unique(self.data[column])
+        keys = [None if i < 0 and column == 'class' else str(table[i]) for i in unique]
+        return unique, keys
+
+    def _index(self, column):
+        """
+        Hash index of a string column: key -> rows.
+        """
+        if column not in self._indices:
+            codes = self.data[column]
+            unique, keys = self._keys(column)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], unique, side='left').tolist() + [len(codes)]
+
+            index = {}
+            for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+                if key is None:
+                    continue
+                rows = order[start:stop]
+                index[key] = np.sort(np.concatenate([index[key], rows])) if key in index else rows
+            self._indices[column] = index
+        return self._indices[column]
+
+    def rows(self, column, value):
+        """
+        rows: Rows where a string column has value, e.g. rows('class', '1') or rows('origin', 'tomogram.mrc')
+        @param column: column name
+        @param value: value, compared as string
+        @return: row indices in ascending order
+        @rtype: L{numpy.ndarray}
+        """
+        return self._index(column).get(str(value), np.zeros(0, dtype=np.int64))
+
+    def row(self, filename):
+        """
+        row: Row of the particle with filename
+        @param filename: particle filename
+        @type filename: L{str}
+        @rtype: L{int}
+        """
+        if 'filename' not in self._indices:
+            filenames = self.tables['filename']
+            self._indices['filename'] = {filenames[i]: row for row, i in enumerate(self.data['filename'].tolist())}
+        try:
+            return self._indices['filename'][filename]
+        except KeyError:
+            raise KeyError('Particle not found in list!')
+
+    def groupBy(self, column):
+        """
+        groupBy: Split the rows by the value of a string column, rows where the column is None are left out for \
+        the class column (particles without a class).
+        @param column: column name
+        @return: [(value, rows), ...] sorted by value
+        @rtype: L{list}
+        """
+        index = self._index(column)
+        return [(key, index[key]) for key in sorted(index)]
+
+    def argsort(self, column, descending=False):
+        """
+        argsort: Stable sort order of a column. String columns are sorted by the string of their value, vector \
+        columns by their first component.
+        @param column: column name
+        @param descending: sort in descending order, equal rows keep their order
+        @rtype: L{numpy.ndarray}
+        """
+        codes = self.data[column]
+        if column in STRING_COLUMNS:
+            unique, _ = self._keys(column)
+            table = self.tables[column]
+            rank = np.zeros(unique.max() + 2 if len(unique) else 1, dtype=np.int64)
+            for r, i in enumerate(sorted(unique.tolist(), key=lambda i: str(table[i]))):
+                rank[i + 1] = r
+            keys = rank[codes + 1]
+        else:
+            keys = codes if codes.ndim == 1 else codes[:, 0]
+        # equal rows keep their order in both directions, like sorted(..., reverse=True)
+        return np.argsort(-keys if descending else keys, kind='stable')
+
+    def select(self, rows):
+        """
+        select: Rows of this table as a new table, the particles materialized for them are taken over
+        @param rows: row indices or boolean mask
+        @type rows: L{numpy.ndarray}
+        @rtype: L{ParticleTable}
+        """
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        table = ParticleTable(self.data[rows], self.tables, self.directory)
+        table._particles = {new: self._particles[old] for new, old in enumerate(rows.tolist())
+                            if old in self._particles}
+        return table
+
+    def sort(self, column, descending=False):
+        """
+        sort: The table sorted by a column
+        @rtype: L{ParticleTable}
+        """
+        return self.select(self.argsort(column, descending))
+
+    def particle(self, row):
+        """
+        particle: The particle of a row, created on first access. Particles of the same table share their wedge \
+        and peak prior objects, the wedges are copies made for this table (L{_wedge}).
+        @param row: row index
+        @type row: L{int}
+        @rtype: L{pytom.basic.structures.Particle}
+        """
+        if row not in self._particles:
+            self._particles[row] = self._createParticle(row)
+        return self._particles[row]
+
+    def particles(self):
+        """
+        particles: Iterate over the particles of all rows without keeping them, unlike L{particle}
+        @rtype: generator of L{pytom.basic.structures.Particle}
+        """
+        for row in range(len(self)):
+            yield self._particles[row] if row in self._particles else self._createParticle(row)
+
+    def _wedge(self, index):
+        """
+        Copy of a wedge of the wedge column, made once per table. Particle lists created from different tables, \
+        e.g. the splits of a list, do not share wedges with each other or with the source list.
+        """
+        if index < 0:
+            return None
+        if index not in self._wedges:
+            self._wedges[index] = copy.deepcopy(self.tables['wedge'][index])
+        return self._wedges[index]
+
+    def _createParticle(self, row):
+        """
+        Particle of a row, see L{particle}.
+        """
+        from pytom.basic.structures import Particle, Rotation, Shift, PickPosition, InformationGUI
+
+        data, tables = self.data[row], self.tables
+        binning = data['binning'].item()
+        pickPosition = PickPosition(*data['position'].tolist(), originFilename=tables['origin'][data['origin']],
+                                    binning=int(binning) if binning.is_integer() else binning,
+                                    refmarker=int(data['refmarker']))
+        particle = Particle(tables['filename'][data['filename']],
+                            rotation=Rotation(*data['rotation'].tolist(),
+                                              paradigm=tables['paradigm'][data['paradigm']] or 'ZXZ'),
+                            shift=Shift(*data['shift'].tolist()), wedge=self._wedge(int(data['wedge'])),
+                            pickPosition=pickPosition)
+        # set directly, the constructor turns None into 'None'
+        particle._className = tables['class'][data['class']]
+        particle._infoGUI = InformationGUI(tables['projectDir'][data['projectDir']] or '')
+
+        score = tables['scoreType'][data['scoreType']]
+        if score is not None:
+            # a shallow copy, the peak prior is shared like the wedge
+            score = copy.copy(score)
+            value = data['score'].item()
+            score.setValue('NAN' if np.isnan(value) else value)
+            particle._score = score
+        return particle
+
+    def toParticleList(self):
+        """
+        toParticleList: Materialize all rows
+        @rtype: L{pytom.basic.structures.ParticleList}
+        """
+        from pytom.basic.structures import ParticleList
+
+        return ParticleList(self.directory, [self.particle(i) for i in range(len(self))])
@@ -73,7 +73,8 @@ class PyTomClass(object):
     
     def fromXMLFile(self, filename):
         """
-        fromXMLFile: Configures object according to file. Do NOT overload this function in any child!
+        fromXMLFile: Configures object according to file. Do NOT overload this function in any child, except to \
+        read the same file format incrementally (L{ParticleList} streams particle list files).
         @param filename: Absolute / relative path to file
         @type filename: L{str}
         @author: Thomas Hrabe  
@@ -87,7 +88,8 @@ class PyTomClass(object):
     
     def toXMLFile(self,filename):
         """
-        toXMLFile : Dumps object to XML file. Do NOT overload this function in any child!
+        toXMLFile : Dumps object to XML file. Do NOT overload this function in any child, except to write the \
+        identical file incrementally (L{ParticleList} streams particle list files).
         @param filename: Absolute / relative path to file
         @type filename: L{str}
         @author: Thomas Hrabe
@@ -207,6 +209,9 @@ class Mask(PyTomClass):
         self._volume = None
         self._isSphere = isSphere
         self._binning = binning
+        self._rotationCenter = None
+        self._rotatedVolumes = None
+        self._rotatedVolumesSize = 0
         
     def isSphere(self):
         """
@@ -221,14 +226,30 @@ class Mask(PyTomClass):
         """
         set binning for mask usage
         """
+        if binning != self._binning:
+            # volume, rotation center and rotated volumes were computed with the former binning
+            self._volume = None
+            self._rotationCenter = None
+            if self._rotatedVolumes is not None:
+                self._rotatedVolumes = {}
         self._binning = binning
-        
+
     def setDownscale(self,scaleFactor):
         """to be deprecated
         @deprecated: Use setBinning instead!
         """
         self.setBinning(scaleFactor)
          
+    def setRotationCacheSize(self, size):
+        """
+        setRotationCacheSize: Keep up to size rotated mask volumes in memory. Rotations are usually scanned in \
+        the same order for every particle, so the cache is filled once and not evicted afterwards.
+        @param size: maximal number of rotated volumes, 0 disables the cache
+        @type size: int
+        """
+        self._rotatedVolumesSize = size
+        self._rotatedVolumes = {} if size > 0 else None
+
     def getVolume(self,rotation=None,bufferedRead = False) -> vol:
         """
         getVolume: Returns this mask's volume. The volume returned is rotated only 
@@ -245,17 +266,22 @@ class Mask(PyTomClass):
             
             from pytom.lib.pytom_volume import read
             from pytom.tools.files import checkFileExists
+            from pytom.tools.memory import volumeCache
             from pytom.basic.transformations import resize
 
             if not checkFileExists(self._filename):
                 raise IOError('Particle ' + self._filename + ' does not exist!')
 
-            try:
-                self._volume = read(self._filename, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1)
+            def load():
+                volume = read(self._filename, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1)
                 if self._binning != 1:
-                    self._volume, volumef = resize(volume=self._volume, factor=1. / self._binning, interpolation='Fourier')
+                    volume, volumef = resize(volume=volume, factor=1. / self._binning, interpolation='Fourier')
+                return volume
+
+            try:
+                self._volume = volumeCache().getVolume(self._filename, load, key=self._binning)
             except RuntimeError:
-                raise RuntimeError('Error reading file ' + self._volume)
+                raise RuntimeError('Error reading file ' + self._filename)
 
             #self._volume = read(self._filename,0,0,0,0,0,0,0,0,0,self._binning,
 	        #self._binning,self._binning)
@@ -268,12 +294,22 @@ class Mask(PyTomClass):
                 from pytom.basic.structures import Rotation
                 rotation = Rotation(rotation)
             
-            rotationCenter = determineRotationCenter(self._filename,self._binning)
-            
+            if self._rotationCenter is None:
+                self._rotationCenter = determineRotationCenter(self._filename,self._binning)
+            rotationCenter = self._rotationCenter
+
+            if self._rotatedVolumes is not None:
+                key = (round(rotation.getZ1(), 4), round(rotation.getZ2(), 4), round(rotation.getX(), 4))
+                if key in self._rotatedVolumes:
+                    return self._rotatedVolumes[key]
+
             maskRot = vol(self._volume.size_x(),self._volume.size_y(),self._volume.size_z())
             transform(self._volume,maskRot,rotation.getZ1(),rotation.getZ2(),rotation.getX(),
 	        rotationCenter[0],rotationCenter[1],rotationCenter[2],0,0,0,0,0,0)
-            
+
+            if self._rotatedVolumes is not None and len(self._rotatedVolumes) < self._rotatedVolumesSize:
+                self._rotatedVolumes[key] = maskRot
+
             return maskRot
         else:
             return self._volume
@@ -318,6 +354,8 @@ class Mask(PyTomClass):
         self._binning = int(self._binning)
         del(self._volume)
         self._volume = None
+        self._rotationCenter = None
+        self.setRotationCacheSize(self._rotatedVolumesSize)
         
     def check(self):
 
@@ -468,7 +506,8 @@ class Reference(PyTomClass):
     
     def getVolume(self, binning=1):
         """
-        getVolume:
+        getVolume: Reads the reference, or takes it from the volume cache (L{pytom.tools.memory.volumeCache}) if it \
+        is enabled
         @param binning: binning factor
         @type binning: int
         @return: Reference volume
@@ -477,15 +516,20 @@ class Reference(PyTomClass):
 
         from pytom.lib.pytom_volume import read
         from pytom.tools.files import checkFileExists
+        from pytom.tools.memory import volumeCache
         from pytom.basic.transformations import resize
 
         if not checkFileExists(self._referenceFile):
             raise IOError('Particle ' + self._referenceFile + ' does not exist!')
 
-        try:
+        def load():
             reference = read(self._referenceFile, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1)
             if binning != 1:
                 reference, referencef = resize(volume=reference, factor=1. / binning, interpolation='Fourier')
+            return reference
+
+        try:
+            reference = volumeCache().getVolume(self._referenceFile, load, key=binning)
         except RuntimeError:
             raise RuntimeError('Error reading file ' + self._referenceFile)
 
@@ -1243,7 +1287,7 @@ class SingleTiltWedge(PyTomClass):
         if(xmlObj.get('Smooth')!=None):
             self._smooth = float(xmlObj.get('Smooth'))
         
-        rotation = xmlObj.xpath('TiltAxisRotation')
+        rotation = xmlObj.findall('TiltAxisRotation')
             
         if len(rotation) > 0:
             rotation = rotation[0]
@@ -1819,7 +1863,8 @@ class Particle(PyTomClass):
         else:
             self._pickPosition = pickPosition
         
-        if wedge == []:
+        # not wedge == [], which compares the XML of the wedge
+        if isinstance(wedge, list) and len(wedge) == 0:
             wedge = None
             
         self._wedge = wedge or Wedge()
@@ -1874,7 +1919,8 @@ class Particle(PyTomClass):
 
     def getVolume(self, binning=1) -> vol:
         """
-        read Volume from disk. If specified volume will be resized in Fourier space
+        read Volume from disk, or from the volume cache (L{pytom.tools.memory.volumeCache}) if it is enabled. If \
+        specified volume will be resized in Fourier space
         @param binning: binning factor (e.g., 2 makes it 2 times smaller in each dim)
         @type binning: int or float
         @return: volume
@@ -1883,16 +1929,33 @@ class Particle(PyTomClass):
         """
         from pytom.lib.pytom_volume import read
         from pytom.tools.files import checkFileExists
+        from pytom.tools.memory import volumeCache
         from pytom.basic.transformations import resize
-        
+        from pytom.agnostic.subtomogram_stack import find_in_stack
+
+        stack = None
         if not checkFileExists(self._filename):
-            raise IOError('Particle ' + self._filename + ' does not exist!')
-        
-        try:
+            stack = find_in_stack(self._filename)
+            if stack is None:
+                raise IOError('Particle ' + self._filename + ' does not exist!')
+
+        def load():
             #volume = read(self._filename, 0,0,0,0,0,0,0,0,0, binning, binning, binning)
-            volume = read(self._filename, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1)
+            if stack is None:
+                volume = read(self._filename, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1)
+            else:
+                # particle packed in a subtomogram stack
+                from pytom.lib.pytom_numpy import vol2npy
+                data = stack.read(self._filename)
+                volume = vol(*data.shape)
+                vol2npy(volume)[:] = data
             if binning != 1:
                 volume, volumef = resize(volume=volume, factor=1./binning, interpolation='Fourier')
+            return volume
+
+        try:
+            # particles in a stack are memory mapped already and have no file of their own to check for changes
+            volume = load() if stack is not None else volumeCache().getVolume(self._filename, load, key=binning)
         except RuntimeError:
             raise RuntimeError('Error reading file ' + self._filename)
     
@@ -2044,7 +2107,8 @@ class Particle(PyTomClass):
     
         self._filename = particle_element.get('Filename')
         
-        rotation_element = particle_element.xpath('Rotation')
+        # findall instead of xpath, an xpath query is compiled and evaluated for every element
+        rotation_element = particle_element.findall('Rotation')
         if len(rotation_element) > 0:
             rotation_element = rotation_element[0]
             self._rotation = Rotation([0.0,0.0,0.0])
@@ -2052,7 +2116,7 @@ class Particle(PyTomClass):
         else:
             self._rotation = Rotation([0.0,0.0,0.0])
         
-        shift_element = particle_element.xpath('Shift')
+        shift_element = particle_element.findall('Shift')
         if len(shift_element) > 0:
             shift_element = shift_element[0]
             self._shift = Shift([0.0,0.0,0.0])
@@ -2060,7 +2124,7 @@ class Particle(PyTomClass):
         else:
             self._shift = Shift([0.0,0.0,0.0])
 
-        source_element = particle_element.xpath('InfoGUI')
+        source_element = particle_element.findall('InfoGUI')
         if len(source_element) > 0:
             source_element = source_element[0]
             self._infoGUI = InformationGUI('')
@@ -2068,7 +2132,7 @@ class Particle(PyTomClass):
         else:
             self._infoGUI = InformationGUI('')
 
-        position_element = particle_element.xpath('PickPosition')
+        position_element = particle_element.findall('PickPosition')
         if len(position_element) > 0:
             position_element = position_element[0]
             self._pickPosition = PickPosition()
@@ -2076,27 +2140,27 @@ class Particle(PyTomClass):
         else:
             self._pickPosition = PickPosition()
         
-        wedgeXML = particle_element.xpath('Wedge')
+        wedgeXML = particle_element.findall('Wedge')
         if len(wedgeXML) == 0:
-            wedgeXML = particle_element.xpath('SingleTiltWedge')
+            wedgeXML = particle_element.findall('SingleTiltWedge')
             if len(wedgeXML) == 0:
-                wedgeXML = particle_element.xpath('WedgeInfo')
+                wedgeXML = particle_element.findall('WedgeInfo')
             if len(wedgeXML) == 0:
-                wedgeXML = particle_element.xpath('DoubleTiltWedge')
+                wedgeXML = particle_element.findall('DoubleTiltWedge')
             if len(wedgeXML) == 0:
-                wedgeXML = particle_element.xpath('GeneralWedge')
+                wedgeXML = particle_element.findall('GeneralWedge')
         self._wedge = Wedge()
         if len(wedgeXML) > 0:
             self._wedge.fromXML(wedgeXML[0])
         
-        class_element = particle_element.xpath('Class')
+        class_element = particle_element.findall('Class')
         if len(class_element) > 0 and class_element[0] != 'None':
             class_element = class_element[0]
             self._className = str(class_element.get('Name'))
         else:
             self._className = None
         
-        score_element = particle_element.xpath('Score')
+        score_element = particle_element.findall('Score')
         if len(score_element) > 0:
             from pytom.basic.score import fromXML
             self._score = fromXML(score_element[0])
@@ -2197,6 +2261,15 @@ class ParticleList(PyTomClass):
 
     def getDirectory(self):
         return self._directory
+
+    def toTable(self):
+        """
+        toTable: Columnar copy of this list for fast queries, see L{pytom.basic.particle_table.ParticleTable}. \
+        Changes to the particles after this call are not reflected in the table.
+        @rtype: L{pytom.basic.particle_table.ParticleTable}
+        """
+        from pytom.basic.particle_table import ParticleTable
+        return ParticleTable.fromParticleList(self)
     
     def setDirectory(self,directory):
         """
@@ -2293,6 +2366,56 @@ class ParticleList(PyTomClass):
         from pytom.tools.files import getPytomPath
 
         super(self.__class__,self).toHTMLFile(filename,getPytomPath() + '/xslt/ParticleList.xsl')
+
+    def fromXMLFile(self, filename):
+        """
+        fromXMLFile: Overrides parent method and parses the file incrementally, see \
+        L{pytom.basic.particle_list_io.readParticleListXML}. Binary particle lists (L{toBinaryFile}) are recognized \
+        and loaded with L{fromBinaryFile}.
+        @param filename: Absolute / relative path to file
+        @type filename: L{str}
+        """
+        from pytom.basic.particle_list_io import readParticleListXML, isBinaryParticleListFile
+
+        if isBinaryParticleListFile(filename):
+            self.fromBinaryFile(filename)
+        else:
+            readParticleListXML(filename, self)
+
+    def toXMLFile(self, filename):
+        """
+        toXMLFile: Overrides parent method and writes one particle at a time, see \
+        L{pytom.basic.particle_list_io.writeParticleListXML}
+        @param filename: Absolute / relative path to file
+        @type filename: L{str}
+        """
+        from pytom.basic.particle_list_io import writeParticleListXML
+        self._XMLfilename = filename
+        writeParticleListXML(self, filename)
+
+    def toBinaryFile(self, filename):
+        """
+        toBinaryFile: Stores the list in the binary particle list format, an uncompressed npz archive that is much \
+        faster to read and write than XML. See L{pytom.basic.particle_table.ParticleTable.toBinaryFile}.
+        @param filename: Absolute / relative path to file
+        @type filename: L{str}
+        """
+        self.toTable().toBinaryFile(filename)
+
+    def fromBinaryFile(self, filename):
+        """
+        fromBinaryFile: Loads a list stored with L{toBinaryFile}. Particles with the same wedge share the wedge \
+        object.
+        @param filename: Absolute / relative path to file
+        @type filename: L{str}
+        """
+        from pytom.basic.particle_table import ParticleTable
+
+        table = ParticleTable.fromBinaryFile(filename)
+        self._particleList = list(table.particles())
+        if table.directory is not None:
+            self._directory = table.directory
+        self._XMLfilename = filename
         
     def fromXML(self, xmlObj):
         """
@@ -2549,20 +2672,8 @@ class ParticleList(PyTomClass):
         @type className: str
         @return: ParticleList  
         """
-        from pytom.basic.structures import ParticleList as ParticleListConstructor
-        
-        query = '/ParticleList/Particle[Class/@Name="'+str(className)+'"]'
-        
-        particles = self.xpath(query)
-        
-        newParticleList = ParticleListConstructor(self._directory,[])
-        
-        for particle in particles:
-            p = Particle('')
-            p.fromXML(particle)
-            newParticleList.append(p)
-            
-        return newParticleList
+        table = self.toTable()
+        return table.select(table.rows('class', className)).toParticleList()
 
     def particlesFromProjectDir(self,projectDir):
         """
@@ -2571,20 +2682,8 @@ class ParticleList(PyTomClass):
         @type projectDir: str
         @return: ParticleList
         """
-        from pytom.basic.structures import ParticleList as ParticleListConstructor
-
-        query = '/ParticleList/Particle[InfoGUI/@ProjectDir="'+str(projectDir)+'"]'
-
-        particles = self.xpath(query)
-
-        newParticleList = ParticleListConstructor(self._directory,[])
-
-        for particle in particles:
-            p = Particle('')
-            p.fromXML(particle)
-            newParticleList.append(p)
-
-        return newParticleList
+        table = self.toTable()
+        return table.select(table.rows('projectDir', projectDir)).toParticleList()
 
     def particlesFromTomoName(self, projectDir):
         """
@@ -2593,20 +2692,8 @@ class ParticleList(PyTomClass):
         @type projectDir: str
         @return: ParticleList
         """
-        from pytom.basic.structures import ParticleList as ParticleListConstructor
-
-        query = '/ParticleList/Particle[PickPosition/@Origin="' + str(projectDir) + '"]'
-
-        particles = self.xpath(query)
-
-        newParticleList = ParticleListConstructor(self._directory, [])
-
-        for particle in particles:
-            p = Particle('')
-            p.fromXML(particle)
-            newParticleList.append(p)
-
-        return newParticleList
+        table = self.toTable()
+        return table.select(table.rows('origin', projectDir)).toParticleList()
 
     def splitByClass(self,verbose = False):
         """
@@ -2616,51 +2703,24 @@ class ParticleList(PyTomClass):
         """
         #sort list to ascending order
         self.sortByClassLabel()
-        
-        classes = self.xpath('/ParticleList/Particle/Class/@Name')
-        
-        classNames = []
-        
-        for i,aClass in enumerate(classes):
-            if not str(aClass) in classNames:
-                classNames.append(str(aClass))
-        
-        if verbose:
-            print(classNames)
-        
-        particleListList = []
-        
-        for className in classNames:
-            
-            particleList = self.particlesFromClass(className)
-            
-            if verbose:
-                print(particleList)
-            
-            particleListList.append(particleList)
-        
-        return particleListList
+        return self._splitBy('class', verbose)
 
-    def splitByProjectDir(self, verbose=False):
-
-        self.sortByProjectDir()
-
-        dirs = self.xpath('/ParticleList/Particle/InfoGUI/@ProjectDir')
-
-        dirNames = []
-
-        for i,aClass in enumerate(dirs):
-            if not str(aClass) in dirNames:
-                dirNames.append(str(aClass))
+    def _splitBy(self, column, verbose=False):
+        """
+        _splitBy: Split into one particle list per value of a column of L{toTable}, in ascending order of the values
+        @return: List of L{pytom.basic.structures.ParticleList}
+        """
+        table = self.toTable()
+        groups = table.groupBy(column)
 
         if verbose:
-            print(dirNames)
+            print([value for value, rows in groups])
 
         particleListList = []
 
-        for dirName in dirNames:
+        for value, rows in groups:
 
-            particleList = self.particlesFromProjectDir(dirName)
+            particleList = table.select(rows).toParticleList()
 
             if verbose:
                 print(particleList)
@@ -2669,33 +2729,15 @@ class ParticleList(PyTomClass):
 
         return particleListList
 
-    def splitByTomoName(self, verbose=False):
-
-        self.sortByTomoName()
-
-        dirs = self.xpath('/ParticleList/Particle/PickPosition/@Origin')
-
-        dirNames = []
-
-        for i, aClass in enumerate(dirs):
-            if not str(aClass) in dirNames:
-                dirNames.append(str(aClass))
-
-        if verbose:
-            print(dirNames)
-
-        particleListList = []
-
-        for dirName in dirNames:
-
-            particleList = self.particlesFromTomoName(dirName)
+    def splitByProjectDir(self, verbose=False):
 
-            if verbose:
-                print(particleList)
+        self.sortByProjectDir()
+        return self._splitBy('projectDir', verbose)
 
-            particleListList.append(particleList)
+    def splitByTomoName(self, verbose=False):
 
-        return particleListList
+        self.sortByTomoName()
+        return self._splitBy('origin', verbose)
 
     def sortByProjectDir(self, sortType='ascending'):
         """
@@ -2741,10 +2783,18 @@ class ParticleList(PyTomClass):
         @param filename: The filename 
         @returns: A particle if successfull or 
         """
-        
-        for p in self._particleList:
-            if p.getFilename() == filename:
-                return p
+        # filename -> position, rebuilt when it does not match the list anymore
+        index = getattr(self, '_filenameIndex', None)
+        if index is not None:
+            i = index.get(filename)
+            if i is not None and i < len(self._particleList) and self._particleList[i].getFilename() == filename:
+                return self._particleList[i]
+
+        self._filenameIndex = {}
+        for i, p in enumerate(self._particleList):
+            self._filenameIndex.setdefault(p.getFilename(), i)
+        if filename in self._filenameIndex:
+            return self._particleList[self._filenameIndex[filename]]
         
         raise KeyError('Particle not found in list!')
         
@@ -63,6 +63,9 @@ if __name__ == '__main__':
                                                                   " of mpi cores should be one more than the number of "
                                                                   "GPUs you are using.", arg=True,
                                                 optional=True),
+                                   ScriptOption(['--batchSize'], 'Align up to this many particles that scan the same '
+                                                'rotations together on the cpu. Default = 0 (particle by particle)',
+                                                arg=True, optional=True),
                                    ScriptOption(['-v', '--verbose'], "be communicative", optional=True, arg=False),
                                    ScriptOption(['-h', '--help'], 'Help.', arg=False, optional=True)])
     
@@ -74,7 +77,7 @@ if __name__ == '__main__':
         particleList, reference, mask, isSphere, angShells, angleInc, scoreObject, \
         symmetryN, symmetryAxisZ, symmetryAxisX,\
         destination, numberIterations, binning,\
-        pixelSize, diameter, weighting, compound, jobName, gpuIDs, verbose, help = results
+        pixelSize, diameter, weighting, compound, jobName, gpuIDs, batchSize, verbose, help = results
     except Exception as e:
         print(e)
         sys.exit()
@@ -172,6 +175,7 @@ if __name__ == '__main__':
                                symmetries=None, adaptive_res=adaptive_res, fsc_criterion=fsc_criterion)
     locJob.toXMLFile(jobName)
     # run script
-    mainAlignmentLoop( alignmentJob=locJob, verbose=False if verbose is None else True)
+    mainAlignmentLoop( alignmentJob=locJob, verbose=False if verbose is None else True,
+                       batchSize=int(batchSize) if batchSize else 0)
     print('finished')
     
@@ -29,7 +29,7 @@ def splitParticleList(particleList, setParticleNodesRatio=3, numberOfNodes=10):
     return splitLists
 
 def average(particleList, averageName, showProgressBar=False, verbose=False,
-            createInfoVolumes=False, weighting=False, norm=False, gpuId=None):
+            createInfoVolumes=False, weighting=False, norm=False, gpuId=None, returnSums=False):
     """
     average : Creates new average from a particleList
     @param particleList: The particles
@@ -38,7 +38,9 @@ def average(particleList, averageName, showProgressBar=False, verbose=False,
     @param createInfoVolumes: Create info data (wedge sum, inverted density) too? False by default.
     @param weighting: apply weighting to each average according to its correlation score
     @param norm: apply normalization for each particle
-    @return: A new Reference object
+    @param returnSums: return the unweighted sum and the wedge sum instead of writing any file
+    @type returnSums: bool
+    @return: A new Reference object or [unweighted sum, unscaled wedge sum] if returnSums is set
     @rtype: L{pytom.basic.structures.Reference}
     @author: Thomas Hrabe
     @change: limit for wedgeSum set to 1% or particles to avoid division by small numbers - FF
@@ -50,6 +52,7 @@ def average(particleList, averageName, showProgressBar=False, verbose=False,
     from pytom.basic.structures import Reference
     from pytom.basic.normalise import mean0std1
     from pytom.tools.ProgressBar import FixedProgBar
+    from pytom.agnostic.subtomogram_stack import particle_exists
     from math import exp
     import os
     if len(particleList) == 0:
@@ -79,9 +82,9 @@ def average(particleList, averageName, showProgressBar=False, verbose=False,
         if 0 and verbose:
             print(particleObject)
 
-        if not os.path.exists(particleObject.getFilename()):
+        if not particle_exists(particleObject.getFilename()):
             continue
-        particle = read(particleObject.getFilename())
+        particle = particleObject.getVolume()
         if norm:  # normalize the particle
             mean0std1(particle)  # happen inplace
 
@@ -168,6 +171,9 @@ def average(particleList, averageName, showProgressBar=False, verbose=False,
     ###apply spectral weighting to sum
     result = lowpassFilter(result, size_x / 2 - 1, 0.)[0]
 
+    if returnSums:
+        return [result, wedgeSum]
+
     root, ext = os.path.splitext(averageName)
 
     # if createInfoVolumes:
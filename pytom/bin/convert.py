@@ -12,7 +12,7 @@ import pytom.basic.files as f
 import os
 
 # The lookup tables for the conversion functions
-extensions = all_extensions = ["em", "mrc", "ccp4", "pl", "meta", "pdb", "mmCIF", 'mrcs', 'st', 'mdoc', 'h5', 'star', 'txt', 'wimp', 'xml', 'xf']
+extensions = all_extensions = ["em", "mrc", "ccp4", "pl", "meta", "pdb", "mmCIF", 'mrcs', 'st', 'mdoc', 'h5', 'star', 'txt', 'wimp', 'xml', 'xf', 'plb']
 special = ['pl']
 
 lookuptable = []
@@ -92,7 +92,7 @@ def convertfile(file, format, target, chaindata, subtomo_prefix=None, wedge_angl
 
 
     if (in_ex == "pl" and format == "star") or (in_ex == "star" and format == "xml") or \
-            (in_ex == "xf" and format == "txt"):
+            (in_ex == "xf" and format == "txt") or ("plb" in (in_ex, format) and callable(func)):
         try:
             func(file, target, **chaindata)
             return 0,""
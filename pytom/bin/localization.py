@@ -8,18 +8,37 @@ from pytom.tools.parse_script_options import parse_script_options
 from pytom.localization.parallel_extract_peaks import PeakLeader
 
 
-def startLocalizationJob(filename, splitX=0, splitY=0, splitZ=0, gpuID=None):
+def startLocalizationJob(filename, splitX=0, splitY=0, splitZ=0, gpuID=None, batchSize=None, inMemory=False,
+                         binary=False, cacheDir=None):
     """
+    @param filename: job file, or a list of job files that are run one after the other
     @author: chen
     """
     verbose=True
-    job = PeakJob()
-    job.fromXMLFile(filename)
-    job.check()
-    suffix = os.path.basename(job.reference.getFilename()).split('.')[0]
+    jobs = []
+    for name in ([filename] if isinstance(filename, str) else filename):
+        job = PeakJob()
+        job.fromXMLFile(name)
+        job.check()
+        jobs.append(job)
+    suffix = os.path.basename(jobs[0].reference.getFilename()).split('.')[0]
     print(f'suffix: {suffix}')
-    leader = PeakLeader(suffix=suffix)
-    leader.parallelRun(job, splitX, splitY, splitZ, verbose, gpuID=gpuID)
+    leader = PeakLeader(suffix=suffix, inMemory=inMemory, binary=binary)
+    if len(jobs) == 1:
+        leader.parallelRun(jobs[0], splitX, splitY, splitZ, verbose, gpuID=gpuID, batchSize=batchSize,
+                           cacheDir=cacheDir)
+    else:
+        # the jobs can share a destination, name their results after template and tomogram
+        suffixes = []
+        for i, job in enumerate(jobs):
+            jobSuffix = '{}_{}'.format(os.path.basename(job.reference.getFilename()).split('.')[0],
+                                       os.path.basename(job.volume.getFilename()).split('.')[0])
+            if jobSuffix in suffixes:
+                jobSuffix += f'_{i}'
+            suffixes.append(jobSuffix)
+        print(f'suffixes: {suffixes}')
+        leader.parallelRunMultiJobs(jobs, splitX, splitY, splitZ, verbose, gpuID=gpuID, batchSize=batchSize,
+                                    cacheDir=cacheDir, subDirectories=False, suffixes=suffixes)
 
 
 if __name__ == '__main__':
@@ -28,18 +47,31 @@ if __name__ == '__main__':
                           description='Run a localization job. Documentation is available at\n\
                           http://www.pytom.org/doc/pytom/localization.html',
                           authors='Yuxiang Chen, Thomas Hrabe',
-                          options=[ScriptOption(['-j','--jobName'], 'Specify job.xml filename', arg=True, optional=False),
+                          options=[ScriptOption(['-j','--jobName'], 'Specify job.xml filename, several comma separated job files '
+                                                'are run one after the other', arg=True, optional=False),
                                    ScriptOption(['-x','--splitX'], 'Parts you want to split the volume in X dimension', arg=True, optional=True),
                                    ScriptOption(['-y','--splitY'], 'Parts you want to split the volume in Y dimension', arg=True, optional=True),
                                    ScriptOption(['-z','--splitZ'], 'Parts you want to split the volume in Z dimension', arg=True, optional=True),
                                    ScriptOption(['-g', '--gpuID'], 'gpu index for running job', arg=True, optional=True),
+                                   ScriptOption(['-b', '--batchSize'], 'Run the batched CPU engine with this number of '
+                                                'rotations per batch (ignored on gpu)', arg=True, optional=True),
+                                   ScriptOption(['--cacheDir'], 'Directory to cache the rotated templates of the '
+                                                'batched CPU engine in, they are then prepared only once for all jobs '
+                                                'and runs with the same template, mask, wedge and angles', arg=True,
+                                                optional=True),
+                                   ScriptOption(['--inMemory'], 'Send partial results between the nodes over MPI '
+                                                'instead of writing them to disk (requires mpi4py)', arg=False,
+                                                optional=True),
+                                   ScriptOption(['--binary'], 'Exchange messages as binary pickles over mpi4py instead '
+                                                'of XML strings (requires mpi4py)', arg=False, optional=True),
                                    ScriptOption(['-h', '--help'], 'Help.', False, True)])
     
     if len(sys.argv) == 1:
         print(helper)
         sys.exit()
 
-    jobName, splitX, splitY, splitZ, gpuID, b_help = parse_script_options(sys.argv[1:], helper)
+    jobName, splitX, splitY, splitZ, gpuID, batchSize, cacheDir, inMemory, binary, b_help = \
+        parse_script_options(sys.argv[1:], helper)
 
     if b_help is True:
         print(helper)
@@ -66,9 +98,13 @@ if __name__ == '__main__':
     else:
         gpuID = list(map(int,gpuID.split(',')))
 
+    if batchSize is not None:
+        batchSize = int(batchSize)
+
     t = Timing(); t.start()
     
-    startLocalizationJob(jobName, splitX, splitY, splitZ, gpuID=gpuID)
+    startLocalizationJob(jobName.split(','), splitX, splitY, splitZ, gpuID=gpuID, batchSize=batchSize,
+                         inMemory=bool(inMemory), binary=bool(binary), cacheDir=cacheDir)
     
     time = t.end(); print('The overall execution time: %f' % time)
     
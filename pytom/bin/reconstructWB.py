@@ -94,12 +94,16 @@ if __name__ == '__main__':
                    ScriptOption2(['-g', '--gpuID'],
                                  'Which GPUs do you want to use? This can be a single gpu (0) or multiple (1,'
                                  '3). Multiple GPUs is only implemented for subtomogram reconstruction.',
-                                 'string', 'optional')])
+                                 'string', 'optional'),
+                   ScriptOption2(['--packed'],
+                                 'Write the subtomograms into one subtomogram stack next to the particle files instead '
+                                 'of one file per particle.',
+                                 'no arguments', 'optional')])
     # TODO add alignment origin option. that way imod alignment center can be passed to function.
 
     tomogram, particle_list_xml, projection_list_xml, projection_directory, projection_prefix, weighting, size, \
     coordinate_binning, rec_offset, projection_binning, metafile, align_result_file, scale_factor_particle, \
-    particle_polish_file, ctf_center, specimen_angle, low_pass_ny, tilt_range, nprocs, gpuIDs \
+    particle_polish_file, ctf_center, specimen_angle, low_pass_ny, tilt_range, nprocs, gpuIDs, packed \
         = parse_script_options2(sys.argv[1:], helper)
 
     # parse the gpuIDs and overwrite the nprocs if neccessary
@@ -216,7 +220,7 @@ if __name__ == '__main__':
                                            weighting=weighting, low_pass_ny_fraction=low_pass_ny,
                                            post_scale=scale_factor_particle, num_procs=nprocs, ctfcenter=ctf_center,
                                            polishResultFile=particle_polish_file, tilt_range=tilt_range,
-                                           show_progress_bar=True, gpuIDs=gpuIDs)
+                                           show_progress_bar=True, gpuIDs=gpuIDs, packed=packed)
 
     else:
         print('No valid tomogram or particle list provided. Exiting...')
@@ -204,9 +204,7 @@ def paverage(particleList, norm, binning, verbose, outdir='./', gpuID=None):
 
 
 
-            particle = read(particleObject.getFilename(), 0,0,0,0,0,0,0,0,0, 1,1,1)
-            if binning != 1:
-                particle, particlef = resize(volume=particle, factor=1. / binning, interpolation='Fourier')
+            particle = particleObject.getVolume(binning)
 
             if norm:
                 mean0std1(particle)
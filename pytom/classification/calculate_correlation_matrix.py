@@ -13,10 +13,20 @@ from pytom.gpu.initialize import xp
 
 
 class CMWorkerGPU():
-    def __init__(self):
+    def __init__(self, binary=False):
+        """
+        @param binary: exchange jobs and results as binary pickles over mpi4py (L{pytom.parallel.transport}) \
+        instead of text messages over pytom_mpi
+        @type binary: L{bool}
+        """
         if not pytom_mpi.isInitialised():
             pytom_mpi.init()
 
+        self.binary = binary
+        if binary:
+            from pytom.parallel.transport import getTransportComm
+            getTransportComm()
+
         self.mpi_id = pytom_mpi.rank()
         self.num_workers = pytom_mpi.size() - 1
         self.node_name = 'node_' + str(self.mpi_id)
@@ -67,7 +77,11 @@ class CMWorkerGPU():
         for i in range(1, mpi_numberNodes):
             msg = StatusMessage(str(mpi_myid), str(i))
             msg.setStatus("End")
-            pytom_mpi.send(str(msg), i)
+            if self.binary:
+                from pytom.parallel.transport import send
+                send(msg, i)
+            else:
+                pytom_mpi.send(str(msg), i)
 
         pytom_mpi.finalise()
 
@@ -137,16 +151,24 @@ class CMWorkerGPU():
                 print(f'finished {len(subparts)} comparisons for job {nn+1}/{num_jobs} on {device} in {elapsed/1000:10.3f} sec ({elapsed/max(1,len(subparts)):7.3f})')
             # send back the result
 
-            self.send_result(plan.results.get().tolist())
+            results = plan.results.get()
+            self.send_result(results if self.binary else results.tolist())
             del plan
 
         pytom_mpi.finalise()
 
     def send_job(self, job, dest):
+        if self.binary:
+            from pytom.parallel.transport import send
+            send(job, dest)
+            return
         pickled = pickle.dumps(job, protocol=0, fix_imports=True).decode('ISO-8859-1')
         pytom_mpi.send(pickled, dest)
 
     def get_job(self):
+        if self.binary:
+            from pytom.parallel.transport import receive
+            return receive(0)[0]
         from pytom.localization.parallel_extract_peaks import getMsgStr
         mpi_msgString = getMsgStr()
         try:
@@ -157,10 +179,17 @@ class CMWorkerGPU():
         return job
 
     def send_result(self, result):
+        if self.binary:
+            from pytom.parallel.transport import send
+            send(result, 0)
+            return
         pickled = pickle.dumps(result, protocol=0, fix_imports=True).decode('ISO-8859-1')
         pytom_mpi.send(pickled, 0)
 
     def get_result(self):
+        if self.binary:
+            from pytom.parallel.transport import receive
+            return receive()[0]
         from pytom.localization.parallel_extract_peaks import getMsgStr
         mpi_msgString = getMsgStr()
         result = pickle.loads(mpi_msgString.encode('ISO-8859-1'))
@@ -240,10 +269,139 @@ class CMWorkerGPU():
                 print(self.node_name + ': distributed %d particles to node %d' % (len(subpartsGPU[n]), n))
 
 
+class _FourierParticleCache():
+    """
+    LRU cache of particles prepared for the correlation matrix. An entry holds the fourier transform of the
+    transformed and lowpass filtered particle together with its rotated wedge, so that every particle is read,
+    rotated and transformed once per worker instead of once per pair.
+    """
+    def __init__(self, particleList, binning, frequency, maxBytes):
+        """
+        @param particleList: the particles
+        @type particleList: L{pytom.basic.structures.ParticleList}
+        @param binning: binning factor
+        @type binning: L{int}
+        @param frequency: lowpass frequency (after binning)
+        @type frequency: L{int}
+        @param maxBytes: memory budget of the cache in bytes
+        @type maxBytes: L{int}
+        """
+        from collections import OrderedDict
+        self._particleList = particleList
+        self._binning = binning
+        self._frequency = frequency
+        self._maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index):
+        """
+        @param index: index of the particle in the particle list
+        @type index: L{int}
+        @return: fourier transformed particle, real space size, wedge object, wedge rotation and reduced wedge
+        volume (None if the wedge can not be applied as a multiplication in fourier space)
+        @rtype: L{tuple}
+        """
+        if index in self._entries:
+            self._entries.move_to_end(index)
+            self.hits += 1
+            return self._entries[index][0]
+
+        self.misses += 1
+        entry = self._prepare(self._particleList[index])
+        self._entries[index] = entry
+        self._bytes += entry[1]
+        while self._bytes > self._maxBytes and len(self._entries) > 1:
+            self._bytes -= self._entries.popitem(last=False)[1][1]
+
+        return entry[0]
+
+    def _prepare(self, particle):
+        from pytom.basic.filter import lowpassFilter
+        from pytom.basic.structures import SingleTiltWedge
+
+        volume = particle.getTransformedVolume(self._binning)
+        size = (volume.size_x(), volume.size_y(), volume.size_z())
+        fvolume = lowpassFilter(volume, self._frequency, 0, True)[0]
+        wedge = particle.getWedge().getWedgeObject()
+        rotation = particle.getRotation().invert()
+        numberOfElements = fvolume.size_x() * fvolume.size_y() * fvolume.size_z()
+        nbytes = 8 * numberOfElements
+
+        wedgeVolume = None
+        if isinstance(wedge, SingleTiltWedge):
+            # reduced complex weighting, same layout as fvolume
+            wedgeVolume = wedge.returnWedgeVolume(*size, humanUnderstandable=False, rotation=rotation)
+            nbytes += 4 * numberOfElements
+
+        return (fvolume, size, wedge, rotation, wedgeVolume), nbytes
+
+
+def _apply_wedge(fvolume, size, wedge, rotation, wedgeVolume):
+    """
+    Apply a cached wedge to a fourier transformed particle and return the particle in real space. Gives the same
+    result as wedge.apply(ifft(fvolume), rotation).
+    """
+    from pytom.lib.pytom_volume import complexRealMult
+    from pytom.basic.fourier import ifft
+
+    noPixels = size[0] * size[1] * size[2]
+    if wedgeVolume is not None:
+        result = ifft(complexRealMult(fvolume, wedgeVolume))
+        result.shiftscale(0.0, 1 / float(noPixels))
+        return result
+
+    volume = ifft(fvolume)
+    volume.shiftscale(0.0, 1 / float(noPixels))
+    return wedge.apply(volume, rotation)
+
+
+def blocked_pair_tiles(num_particles, block_size):
+    """
+    Split the upper triangle of the correlation matrix into row-block x column-block tiles.
+
+    @param num_particles: number of particles
+    @type num_particles: L{int}
+    @param block_size: number of particles per block
+    @type block_size: L{int}
+    @return: tiles (row_start, row_end, column_start, column_end) in row major order
+    @rtype: L{list}
+    """
+    starts = list(range(0, num_particles, block_size))
+    tiles = []
+    for n, i0 in enumerate(starts):
+        for j0 in starts[n:]:
+            tiles.append((i0, min(i0 + block_size, num_particles), j0, min(j0 + block_size, num_particles)))
+    return tiles
+
+
+def tile_pairs(tile):
+    """
+    @param tile: (row_start, row_end, column_start, column_end)
+    @type tile: L{tuple}
+    @return: number of pairs (i, j) with i < j in the tile
+    @rtype: L{int}
+    """
+    i0, i1, j0, j1 = tile
+    return sum(max(0, j1 - max(j0, i + 1)) for i in range(i0, i1))
+
+
 class CMWorker():
-    def __init__(self):
+    def __init__(self, binary=False):
+        """
+        @param binary: exchange jobs and results as binary pickles over mpi4py (L{pytom.parallel.transport}) \
+        instead of text messages over pytom_mpi
+        @type binary: L{bool}
+        """
         if not pytom_mpi.isInitialised():
             pytom_mpi.init()
+
+        self.binary = binary
+        if binary:
+            from pytom.parallel.transport import getTransportComm
+            getTransportComm()
             
         self.mpi_id = pytom_mpi.rank()
         self.num_workers = pytom_mpi.size()-1
@@ -270,13 +428,14 @@ class CMWorker():
             for i in range(n):
                 correlation_matrix[i][i] = 1
 
-            # gather the results
+            # gather the results, a result holds the scores of each tile of the worker
             for i in range(self.num_workers):
-                result = self.get_result()
-                pairs = list(result.keys())
-                for pair in pairs:
-                    correlation_matrix[pair[0]][pair[1]] = result[pair]
-                    correlation_matrix[pair[1]][pair[0]] = result[pair]
+                for i0, j0, scores in self.get_result():
+                    scores = np.array(scores)
+                    rows, columns = np.nonzero(np.arange(i0, i0 + scores.shape[0])[:, np.newaxis] <
+                                               np.arange(j0, j0 + scores.shape[1])[np.newaxis, :])
+                    correlation_matrix[i0 + rows, j0 + columns] = scores[rows, columns]
+                    correlation_matrix[j0 + columns, i0 + rows] = scores[rows, columns]
             
             # write the correlation matrix to the disk
             np.savetxt(os.path.join(outdir, 'correlation_matrix.csv'), correlation_matrix, delimiter=',')
@@ -299,25 +458,28 @@ class CMWorker():
         for i in range(1, mpi_numberNodes):
             msg = StatusMessage(str(mpi_myid),str(i))
             msg.setStatus("End")
-            pytom_mpi.send(str(msg),i)
+            if self.binary:
+                from pytom.parallel.transport import send
+                send(msg, i)
+            else:
+                pytom_mpi.send(str(msg),i)
         
         pytom_mpi.finalise()
     
     def run(self, verbose=False):
-        from pytom.lib.pytom_volume import read, sum
-        from pytom.basic.filter import lowpassFilter
+        from pytom.lib.pytom_volume import read
         from pytom.basic.correlation import nxcc
-        from pytom.basic.structures import Rotation
         from pytom.tools.ProgressBar import FixedProgBar
         import time
 
         t = time.time()
+        numberOfPairs = 0
         while True:
             # get the job
             job = self.get_job()
             
             try:
-                pairs = job["Pairs"]
+                tiles = job["Tiles"]
                 pl_filename = job["ParticleList"]
             except:
                 if verbose:
@@ -329,60 +491,55 @@ class CMWorker():
             pl.fromXMLFile(pl_filename)
 
             if verbose:
-                prog = FixedProgBar(0, len(pairs)-1, self.node_name+':')
-                i = 0
+                prog = FixedProgBar(0, max(1, sum(tile_pairs(tile) for tile in tiles)), self.node_name+':')
+                n = 0
 
             # run the job
-            result = {}
-            last_filename = None
+            result = []
             binning = int(job["Binning"])
+            cache = _FourierParticleCache(pl, binning, job["Frequency"], int(job["CacheMemory"]))
 
             mask = read(job["Mask"], 0, 0, 0, 0, 0, 0, 0, 0, 0, binning, binning, binning)
-            
-            
-            for pair in pairs:
-                if verbose:
-                    prog.update(i)
-                    i += 1
-                g = pl[pair[0]]
-                f = pl[pair[1]]
-                vf = f.getTransformedVolume(binning)
-                wf = f.getWedge().getWedgeObject()
-                wf_rotation = f.getRotation().invert()
-
-                # wf.setRotation(Rotation(-rotation[1],-rotation[0],-rotation[2]))
-                # wf_vol = wf.returnWedgeVolume(vf.size_x(), vf.size_y(), vf.size_z(), True, -rotation[1],-rotation[0],-rotation[2])
-                vf = lowpassFilter(vf, job["Frequency"], 0)[0]
-
-                if g.getFilename() != last_filename:
-                    vg = g.getTransformedVolume(binning)
-                    wg = g.getWedge().getWedgeObject()
-                    wg_rotation = g.getRotation().invert()
-                    # wg.setRotation(Rotation(-rotation[1],-rotation[0],-rotation[2]))
-                    # wg_vol = wg.returnWedgeVolume(vg.size_x(), vg.size_y(), vg.size_z(), True, -rotation[1],-rotation[0],-rotation[2])
-                    vg = lowpassFilter(vg, job["Frequency"], 0)[0]
-
-                    last_filename = g.getFilename()
-
-
-                score = nxcc( wg.apply(vf, wg_rotation), wf.apply(vg, wf_rotation), mask)
-                # overlapped_wedge_vol = wf_vol * wg_vol
-                # scaling = float(overlapped_wedge_vol.numelem())/sum(overlapped_wedge_vol)
-                # score *= scaling
-
-                result[pair] = score
-            
+
+            # tiles are sized such that the particles of a row-block and a column-block fit in the cache
+            for i0, i1, j0, j1 in tiles:
+                scores = numpy.zeros((i1 - i0, j1 - j0))
+                for i in range(i0, i1):
+                    g = cache.get(i)
+                    for j in range(max(j0, i + 1), j1):
+                        if verbose:
+                            prog.update(n)
+                            n += 1
+                        f = cache.get(j)
+
+                        # wedge of g applied to f and vice versa
+                        scores[i - i0, j - j0] = nxcc(_apply_wedge(f[0], f[1], *g[2:]),
+                                                      _apply_wedge(g[0], g[1], *f[2:]), mask)
+                        numberOfPairs += 1
+
+                # numpy arrays go out-of-band with the binary transport
+                result.append((i0, j0, scores if self.binary else scores.tolist()))
+
+            if verbose:
+                print(self.node_name + ': prepared %d particles for %d pairs' % (cache.misses, numberOfPairs))
+
             # send back the result
             self.send_result(result)
-        print((time.time()-t)*1000/len(pairs))
+        print((time.time()-t)*1000/max(1, numberOfPairs))
         pytom_mpi.finalise()
 
-    
     def send_job(self, job, dest):
+        if self.binary:
+            from pytom.parallel.transport import send
+            send(job, dest)
+            return
         pickled = pickle.dumps(job, protocol=0, fix_imports=True).decode('utf-8')
         pytom_mpi.send(pickled, dest)
     
     def get_job(self):
+        if self.binary:
+            from pytom.parallel.transport import receive
+            return receive(0)[0]
         from pytom.localization.parallel_extract_peaks import getMsgStr
         mpi_msgString = getMsgStr()
         try:
@@ -393,10 +550,17 @@ class CMWorker():
         return job
     
     def send_result(self, result):
+        if self.binary:
+            from pytom.parallel.transport import send
+            send(result, 0)
+            return
         pickled = pickle.dumps(result, protocol=0, fix_imports=True).decode('utf-8')
         pytom_mpi.send(pickled, 0)
     
     def get_result(self):
+        if self.binary:
+            from pytom.parallel.transport import receive
+            return receive()[0]
         from pytom.localization.parallel_extract_peaks import getMsgStr
         mpi_msgString = getMsgStr()
         result = pickle.loads(mpi_msgString.encode('utf-8'))
@@ -404,39 +568,47 @@ class CMWorker():
         return result
     
     def distribute_job(self, job, verbose=False):
+        from pytom.agnostic.io import read_size
         pl_filename = job["ParticleList"]
         from pytom.basic.structures import ParticleList
         pl = ParticleList('.')
         pl.fromXMLFile(pl_filename)
         nn = len(pl)
-        all_pairs = []
-        for i in range(nn):
-            for j in range(i+1, nn):
-                all_pairs.append((i, j))
-        n = len(all_pairs)
-        particlesPerNode = int(n/self.num_workers)
-        residual = n-particlesPerNode*self.num_workers
-        start_idx = 0
+        cacheMemory = int(job.get("CacheMemory", 4 * 1024**3))
+
+        # bytes of a cached particle: reduced complex fourier transform and reduced wedge volume
+        x, y, z = [int(s) // int(job["Binning"]) for s in read_size(job["Mask"])]
+        particleBytes = 12 * x * y * (z // 2 + 1)
+
+        # a tile needs a row-block and a column-block of particles in the cache, but there should be enough tiles
+        # to balance the workers
+        blockSize = max(1, min(cacheMemory // (2 * particleBytes), nn))
+        while blockSize > 1 and len(blocked_pair_tiles(nn, blockSize)) < 4 * self.num_workers:
+            blockSize = (blockSize + 1) // 2
+
+        # split the row major tiles into contiguous parts with an even number of pairs, so that a worker keeps
+        # its row-block in the cache while going through the column-blocks
+        tiles = blocked_pair_tiles(nn, blockSize)
+        pairs = numpy.array([tile_pairs(tile) for tile in tiles])
+        owners = numpy.minimum((numpy.cumsum(pairs) - pairs / 2.) * self.num_workers / max(1, pairs.sum()),
+                               self.num_workers - 1).astype(int)
+
         for i in range(1, self.num_workers+1):
-            if i < residual+1: # since i starts from 1
-                l = particlesPerNode+1
-            else:
-                l = particlesPerNode
-            
-            sub_pairs = all_pairs[start_idx : start_idx+l]
-            start_idx += l
-            
+            sub_tiles = [tile for tile, owner in zip(tiles, owners) if owner == i - 1]
+
             # construct the job
             sub_job = {}
-            sub_job["Pairs"] = sub_pairs
+            sub_job["Tiles"] = sub_tiles
             sub_job["ParticleList"] = pl_filename
             sub_job["Mask"] = job["Mask"]
             sub_job["Frequency"] = job["Frequency"]
             sub_job["Binning"] = job["Binning"]
+            sub_job["CacheMemory"] = cacheMemory
             self.send_job(sub_job, i)
             
             if verbose:
-                print(self.node_name + ': distributed %d particles to node %d' % (len(sub_pairs), i))
+                print(self.node_name + ': distributed %d pairs in %d tiles to node %d' %
+                      (sum(tile_pairs(tile) for tile in sub_tiles), len(sub_tiles), i))
 
 if __name__ == '__main__':
     # parse command line arguments
@@ -456,6 +628,9 @@ if __name__ == '__main__':
                                     ScriptOption(['-g', '--gpuID'], "Index or indices of the gpu's one wants to use. CCC can run on multiple gpu's simultaneously. The indices "
                                                                     "of multiple gpu's are separated by a comma (no space). For example 0,2,3,5 **Please note that the number "
                                                                     "of mpi cores should be one more than the number of GPUs you are using.**", True, True),
+                                    ScriptOption(['--cacheMemory'], 'Memory in GB each CPU worker uses to cache prepared particles '
+                                                                    '(default 4). Larger caches mean fewer particle reads.', True, True),
+                                    ScriptOption(['--binary'], 'Exchange jobs and results as binary messages over mpi4py.', False, True),
                                     ScriptOption(['--help'], 'Help info.', False, True)])
     
     if len(sys.argv) == 1:
@@ -463,7 +638,7 @@ if __name__ == '__main__':
         sys.exit()
     
     try:
-        pl_filename, mask_filename, freq, binning, verbose, outdir, gpuIDs, help = parse_script_options(sys.argv[1:], helper)
+        pl_filename, mask_filename, freq, binning, verbose, outdir, gpuIDs, cacheMemory, binary, help = parse_script_options(sys.argv[1:], helper)
     except Exception as e:
         print(e)
         print(helper)
@@ -491,12 +666,13 @@ if __name__ == '__main__':
     job["Binning"] = binning
     job["outdir"] = outdir if outdir else './'
     job['gpuIDs'] = [] if gpuIDs is None else list(map(int, gpuIDs.split(',')))
+    job["CacheMemory"] = int(float(cacheMemory if cacheMemory else 4) * 1024**3)
 
     if not job['gpuIDs']:
-        worker = CMWorker()
+        worker = CMWorker(binary)
         worker.start(job, verbose)
     else:
-        worker = CMWorkerGPU()
+        worker = CMWorkerGPU(binary)
         worker.start(job, verbose)
 
     if worker.mpi_id == 0:
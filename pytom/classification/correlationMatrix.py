@@ -5,6 +5,20 @@ A correlation matrix is one basic mean for the classification / clustering of a
 @author: hrabe
 '''
 
+
+
+def _readParticle(particle, binningFactor):
+    """
+    _readParticle: Read a particle binned at read, particles packed in a subtomogram stack through \
+    L{pytom.basic.structures.Particle.getVolume}
+    """
+    import os
+    from pytom_volume import read
+
+    if not os.path.exists(particle.getFilename()):
+        return particle.getVolume(max(int(binningFactor), 1))
+    return read(particle.getFilename(),0,0,0,0,0,0,0,0,0,int(binningFactor),int(binningFactor),int(binningFactor))
+
         
 def calculateCorrelationVector(particle,particleList,mask,particleIndex,applyWedge=True,binningFactor=0,lowestFrequency=0,highestFrequency=1):
     """
@@ -56,10 +70,10 @@ def calculateCorrelationVector(particle,particleList,mask,particleIndex,applyWed
         
         #read from disk
         
-        particleVolume = read(particle.getFilename(),0,0,0,0,0,0,0,0,0,int(binningFactor),int(binningFactor),int(binningFactor))
+        particleVolume = _readParticle(particle, binningFactor)
         
         #otherParticleVolume = read(otherParticle.getFilename(),binningX=binningFactor,binningY=binningFactor,binningZ=binningFactor)
-        otherParticleVolume = read(otherParticle.getFilename(),0,0,0,0,0,0,0,0,0,int(binningFactor),int(binningFactor),int(binningFactor))
+        otherParticleVolume = _readParticle(otherParticle, binningFactor)
         
         #initialise memory for buffer volumes
         if not particleRotated:
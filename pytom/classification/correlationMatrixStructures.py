@@ -45,11 +45,13 @@ class CorrelationVector(PyTomClass):
         @author: Thomas Hrabe
         """        
         from lxml import etree
+        from pytom.basic.particle_list_io import toBinaryXML
 
         vectorElement = etree.Element("CorrelationVector",ParticleIndex = self._particleIndex.__str__())
         
         vectorElement.append(self._particle.toXML())
-        vectorElement.append(self._particleList.toXML())
+        # only read by the manager process, the binary list is much faster to parse
+        vectorElement.append(toBinaryXML(self._particleList))
         
         for i in range(len(self._correlations)):
             
@@ -71,7 +73,8 @@ class CorrelationVector(PyTomClass):
         if xmlObj.__class__ != _Element:
             raise ParameterError('You must provide a valid XML-CorrelationVector object.')
         
-        from pytom.basic.structures import Particle,ParticleList
+        from pytom.basic.structures import Particle
+        from pytom.basic.particle_list_io import particleListFromXML
         
         self._particleIndex = int(xmlObj.get('ParticleIndex'))
         
@@ -79,9 +82,7 @@ class CorrelationVector(PyTomClass):
         self._particle = Particle('.')
         self._particle.fromXML(particleObject[0])
         
-        particleListObject = xmlObj.xpath('ParticleList')
-        self._particleList = ParticleList('/')
-        self._particleList.fromXML(particleListObject[0])
+        self._particleList = particleListFromXML(xmlObj, '/')
         
         values = xmlObj.xpath('Correlation')
         
@@ -173,11 +174,13 @@ class CorrelationVectorJob(PyTomClass):
         """
         
         from lxml import etree
+        from pytom.basic.particle_list_io import toBinaryXML
         
         jobElement = etree.Element('CorrelationVectorJob',ParticleIndex = self._particleIndex.__str__(),ApplyWedge=self._applyWedge.__str__(),Binning = self._binningFactor.__str__(),LowestFrequency = str(self._lowestFrequency),HighestFrequency = str(self._highestFrequency))
         
         jobElement.append(self._particle.toXML())
-        jobElement.append(self._particleList.toXML())
+        # the job is sent to a worker process for every particle, the binary list is much faster to parse
+        jobElement.append(toBinaryXML(self._particleList))
         jobElement.append(self._mask.toXML())
         
         return jobElement
@@ -195,15 +198,14 @@ class CorrelationVectorJob(PyTomClass):
             raise ParameterError('You must provide a valid XML-CorrelationVectorJob object.')
         
         
-        from pytom.basic.structures import Particle,ParticleList,Mask
+        from pytom.basic.structures import Particle,Mask
+        from pytom.basic.particle_list_io import particleListFromXML
         
         particleObject = xmlObj.xpath('Particle')
         self._particle = Particle('.')
         self._particle.fromXML(particleObject[0])
         
-        particleListObject = xmlObj.xpath('ParticleList')
-        self._particleList = ParticleList('/')
-        self._particleList.fromXML(particleListObject[0])
+        self._particleList = particleListFromXML(xmlObj, '/')
     
         maskObject = xmlObj.xpath('Mask')[0]
         self._mask = Mask()
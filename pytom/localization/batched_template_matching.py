@@ -0,0 +1,413 @@
+'''
+Batched CPU template matching. All terms that do not depend on the rotation (the fourier transform of the
+tomogram, the normalization by the standard deviation under the mask and the spline coefficients of the
+template) are computed once, after which the rotations are processed in batches with preallocated buffers
+and multithreaded FFTs. The prepared templates can be shared between tomograms through an on-disk cache.
+
+Created on Oct 18, 2026
+'''
+import os
+import numpy as np
+import scipy.fft
+from scipy.ndimage import affine_transform, spline_filter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TemplateMatchingPlanCPU(object):
+    """
+    TemplateMatchingPlanCPU: holds the rotation independent terms and the work buffers of a template matching run.
+    The interface mirrors L{pytom.gpu.gpuStructures.TemplateMatchingPlan}.
+    """
+    def __init__(self, volume, template, mask, wedge_volume=None, wedge_template=None, mask_is_spherical=True,
+                 batch_size=8, num_threads=None):
+        """
+        @param volume: search volume
+        @type volume: L{numpy.ndarray}
+        @param template: template, is rotated around its center (size // 2 + size % 2)
+        @type template: L{numpy.ndarray}
+        @param mask: mask of the template, has the same size as the template
+        @type mask: L{numpy.ndarray}
+        @param wedge_volume: reduced complex wedge for the search volume, None for no wedge
+        @type wedge_volume: L{numpy.ndarray}
+        @param wedge_template: reduced complex wedge for the template, None for no wedge
+        @type wedge_template: L{numpy.ndarray}
+        @param mask_is_spherical: if True the mask is not rotated and std_v is computed only once
+        @type mask_is_spherical: bool
+        @param batch_size: number of rotations that share one FFT call
+        @type batch_size: int
+        @param num_threads: threads for the FFTs and the rotations, defaults to the number of cpus
+        @type num_threads: int
+        """
+        if template.shape != mask.shape:
+            raise RuntimeError('Template and mask size are not consistent!')
+        if any([t > v for t, v in zip(template.shape, volume.shape)]):
+            raise RuntimeError('Template size is bigger than the target volume')
+
+        self.num_threads = num_threads if num_threads else (os.cpu_count() or 1)
+        self.batch_size = max(1, int(batch_size))
+        self.mask_is_spherical = mask_is_spherical
+
+        self.shape = volume.shape
+        self.template_shape = template.shape
+        self.axes = (1, 2, 3)
+
+        volume = np.asarray(volume, dtype=np.float32)
+        if wedge_volume is not None:
+            volume = scipy.fft.irfftn(scipy.fft.rfftn(volume, workers=self.num_threads) * wedge_volume,
+                                      s=self.shape, workers=self.num_threads).astype(np.float32)
+        self.volume = volume
+
+        # fftshift of the correlation is folded into the cached volume spectrum as a phase ramp
+        self.phase = self._shift_phase(self.shape)
+        self.volume_fft = scipy.fft.rfftn(volume, workers=self.num_threads) * self.phase
+
+        # spline coefficients are computed once instead of in every rotation
+        self.template_coefficients = spline_filter(np.asarray(template, dtype=np.float32), 3, output=np.float64,
+                                                   mode='constant')
+        self.mask = np.asarray(mask, dtype=np.float32)
+        self.mask_coefficients = None if mask_is_spherical else spline_filter(self.mask, 3, output=np.float64,
+                                                                                mode='constant')
+        self.wedge = None if wedge_template is None else np.asarray(wedge_template, dtype=np.float32)
+        self.p = self.mask.sum()
+
+        # position of the template in the padded volume
+        sx, sy, sz = self.template_shape
+        self.paste = tuple(slice(S // 2 - s // 2, S // 2 - s // 2 + s) for s, S in zip(self.template_shape, self.shape))
+        self.rotation_center = (sx // 2 + sx % 2, sy // 2 + sy % 2, sz // 2 + sz % 2)
+
+        # preallocated buffers, the padded buffer is only written in the template region so its border stays zero
+        self.templates = np.zeros((self.batch_size,) + self.template_shape, dtype=np.float32)
+        self.masks = np.repeat(self.mask[np.newaxis], self.batch_size, axis=0)
+        self.padded = np.zeros((self.batch_size,) + self.shape, dtype=np.float32)
+
+        self.std_v = self.calc_std_v(self.mask, self.p) if mask_is_spherical else None
+
+        self.pool = ThreadPoolExecutor(self.num_threads) if self.num_threads > 1 else None
+
+    @staticmethod
+    def _shift_phase(shape):
+        """
+        Phase ramp in the reduced complex layout that equals an fftshift of the inverse transform.
+        """
+        ramps = []
+        for i, n in enumerate(shape):
+            k = np.fft.rfftfreq(n) * n if i == len(shape) - 1 else np.fft.fftfreq(n) * n
+            ramp = np.exp(2j * np.pi * k * (n // 2) / n).astype(np.complex64)
+            ramps.append(ramp.reshape([-1 if j == i else 1 for j in range(len(shape))]))
+        phase = ramps[0]
+        for ramp in ramps[1:]:
+            phase = phase * ramp
+        return phase
+
+    def calc_std_v(self, mask, p):
+        """
+        Standard deviation of the search volume under the mask at every position.
+        """
+        padded = np.zeros(self.shape, dtype=np.float32)
+        padded[self.paste] = mask
+        mask_fft = np.conj(scipy.fft.rfftn(padded, workers=self.num_threads)) * self.phase
+        mean = scipy.fft.irfftn(scipy.fft.rfftn(self.volume, workers=self.num_threads) * mask_fft, s=self.shape,
+                                workers=self.num_threads) / p
+        sqr = scipy.fft.irfftn(scipy.fft.rfftn(self.volume ** 2, workers=self.num_threads) * mask_fft, s=self.shape,
+                               workers=self.num_threads) / p
+        std_v = sqr - mean ** 2
+        std_v[std_v <= 1e-09] = 1
+        return np.sqrt(std_v).astype(np.float32)
+
+    def _rotate(self, coefficients, matrix, output):
+        affine_transform(coefficients, matrix, output=output, order=3, mode='constant', prefilter=False)
+
+    def rotate_batch(self, angles):
+        """
+        Rotate the template (and the mask if not spherical) for all angles of a batch into the preallocated buffers.
+        @param angles: list of [phi, psi, theta]
+        """
+        from pytom.voltools.utils import transform_matrix
+
+        matrices = [transform_matrix(rotation=(a[0], a[2], a[1]), rotation_order='rzxz',
+                                     center=self.rotation_center) for a in angles]
+        jobs = [(self.template_coefficients, m, self.templates[i]) for i, m in enumerate(matrices)]
+        if not self.mask_is_spherical:
+            jobs += [(self.mask_coefficients, m, self.masks[i]) for i, m in enumerate(matrices)]
+
+        if self.pool is None:
+            for job in jobs:
+                self._rotate(*job)
+        else:
+            list(self.pool.map(lambda job: self._rotate(*job), jobs))
+
+    def prepare_batch(self, n):
+        """
+        Apply the wedge to the first n rotated templates and normalize them under their masks, in place. The
+        prepared templates do not depend on the search volume, see L{RotatedTemplateCache}.
+        """
+        templates, masks = self.templates[:n], self.masks[:n]
+
+        # apply the wedge to all templates in one transform
+        if self.wedge is not None:
+            templates[...] = scipy.fft.irfftn(scipy.fft.rfftn(templates, axes=self.axes, workers=self.num_threads) *
+                                              self.wedge, s=self.template_shape, axes=self.axes,
+                                              workers=self.num_threads)
+
+        # normalize under the mask, vectorized over the batch
+        p = self.p if self.mask_is_spherical else masks.sum(axis=self.axes, keepdims=True)
+        meanT = (templates * masks).sum(axis=self.axes, keepdims=True) / p
+        stdT = np.sqrt((templates ** 2 * masks).sum(axis=self.axes, keepdims=True) / p - meanT ** 2)
+        stdT[stdT == 0] = 1
+        templates -= meanT
+        templates /= stdT
+        templates *= masks
+
+    def correlate_batch(self, n, prepared=False):
+        """
+        Fast local correlation of the first n rotated templates with the search volume.
+        @param prepared: the templates in the buffer are already prepared (L{prepare_batch})
+        @return: score maps of shape (n,) + volume shape
+        """
+        if not prepared:
+            self.prepare_batch(n)
+        templates, masks = self.templates[:n], self.masks[:n]
+        p = self.p if self.mask_is_spherical else masks.sum(axis=self.axes, keepdims=True)
+
+        padded = self.padded[:n]
+        padded[(slice(None),) + self.paste] = templates
+
+        spectrum = scipy.fft.rfftn(padded, axes=self.axes, workers=self.num_threads)
+        np.conj(spectrum, out=spectrum)
+        spectrum *= self.volume_fft
+        scores = scipy.fft.irfftn(spectrum, s=self.shape, axes=self.axes, workers=self.num_threads)
+        del spectrum
+
+        if self.mask_is_spherical:
+            scores /= (self.p * self.std_v)
+        else:
+            for i in range(n):
+                scores[i] /= (p[i] * self.calc_std_v(masks[i], p[i]))
+        return scores
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+class RotatedTemplateCache(object):
+    """
+    RotatedTemplateCache: on-disk cache of prepared templates, i.e. rotated, wedge filtered and normalized under the
+    mask, for every angle of an angle list. Prepared templates do not depend on the search volume, so matching the
+    same template against many tomograms (or tiles) only rotates it once. Entries are keyed by a hash of the
+    template, the mask, the template wedge and the angle list and stay valid across runs.
+
+    Every entry is a .npy file of shape (number of angles,) + template shape, plus a second file with the rotated
+    masks if the mask is not spherical. Entries are written to a temporary file and renamed when complete, so
+    processes that prepare the same entry at the same time do not see partial data.
+    """
+    def __init__(self, directory):
+        """
+        @param directory: cache directory, created if needed
+        @type directory: str
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(template, mask, wedge, mask_is_spherical, angles):
+        """
+        @return: hash of everything the prepared templates depend on
+        @rtype: str
+        """
+        import hashlib
+
+        h = hashlib.sha1()
+        for array in (template, mask, wedge):
+            if array is None:
+                h.update(b'None')
+            else:
+                h.update(str(array.shape).encode())
+                h.update(np.ascontiguousarray(array, dtype=np.float32).tobytes())
+        h.update(b'spherical' if mask_is_spherical else b'rotated mask')
+        h.update(np.asarray(angles, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.directory, key + '.npy'), os.path.join(self.directory, key + '_masks.npy')
+
+    def load(self, key, masks=False):
+        """
+        @param key: entry key, see L{key}
+        @param masks: also load the rotated masks
+        @return: memory mapped (templates, masks or None), or None if the entry is not cached
+        @rtype: tuple
+        """
+        templates_path, masks_path = self._paths(key)
+        if not os.path.exists(templates_path) or (masks and not os.path.exists(masks_path)):
+            return None
+        return (np.load(templates_path, mmap_mode='r'),
+                np.load(masks_path, mmap_mode='r') if masks else None)
+
+    def create(self, key, number, shape, masks=False):
+        """
+        Start writing an entry, the entry is only visible after L{commit}.
+        @param number: number of angles
+        @param shape: template shape
+        @param masks: also store the rotated masks
+        @return: writable memory mapped (templates, masks or None)
+        @rtype: tuple
+        """
+        self._pending = []
+        arrays = []
+        for path, store in zip(self._paths(key), (True, masks)):
+            if not store:
+                arrays.append(None)
+                continue
+            temporary = f'{path}.{os.getpid()}.tmp'
+            self._pending.append((temporary, path))
+            arrays.append(np.lib.format.open_memmap(temporary, mode='w+', dtype=np.float32,
+                                                    shape=(number,) + tuple(shape)))
+        return tuple(arrays)
+
+    def commit(self, arrays):
+        """
+        Make an entry created by L{create} visible, the templates are renamed last.
+        """
+        for array in arrays:
+            if array is not None:
+                array.flush()
+        for temporary, path in reversed(self._pending):
+            os.replace(temporary, path)
+        self._pending = []
+
+    def discard(self):
+        """
+        Remove the temporary files of an unfinished entry.
+        """
+        for temporary, path in getattr(self, '_pending', []):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self._pending = []
+
+
+def templateMatchingCPU(volume, reference, rotations, scoreFnc=None, mask=None, maskIsSphere=False, wedgeInfo=None,
+                        batchSize=8, numThreads=None, cacheDir=None, **kwargs):
+    '''
+    templateMatchingCPU: batched CPU version of L{pytom.localization.extractPeaks.extractPeaks} using FLCF scoring.
+    @param volume: target volume
+    @type volume: L{pytom.lib.pytom_volume.vol} or L{numpy.ndarray}
+    @param reference: reference
+    @type reference: L{pytom.lib.pytom_volume.vol} or L{numpy.ndarray}
+    @param rotations: rotation angle list
+    @type rotations: L{pytom.angles.globalSampling.GlobalSampling}
+    @param scoreFnc: score function that is used, only FLCF is supported
+    @type scoreFnc: L{pytom.basic.correlation}
+    @param mask: mask volume, a sphere is generated if None
+    @type mask: L{pytom.lib.pytom_volume.vol} or L{numpy.ndarray}
+    @param maskIsSphere: flag to indicate whether the mask is sphere or not
+    @type maskIsSphere: boolean
+    @param wedgeInfo: wedge information
+    @type wedgeInfo: L{pytom.basic.structures.WedgeInfo} or L{pytom.agnostic.structures.Wedge}
+    @param batchSize: number of rotations processed together
+    @type batchSize: int
+    @param numThreads: number of threads for FFTs and rotations
+    @type numThreads: int
+    @param cacheDir: directory of a L{RotatedTemplateCache}, the prepared templates are read from it if another run \
+    with the same template, mask, wedge and angles stored them, otherwise they are stored
+    @type cacheDir: str
+    @return: [result, orientation, sumV, sqrV] as numpy arrays, sumV and sqrV are None unless moreInfo is set
+    @rtype: list
+    '''
+    from pytom.basic.structures import WedgeInfo, Wedge
+    from pytom.agnostic.structures import Wedge as AgnosticWedge
+
+    nodeName = kwargs.get('nodeName', '')
+    verbose = kwargs.get('verboseMode', True)
+    moreInfo = kwargs.get('moreInfo', False)
+
+    if scoreFnc is not None and getattr(scoreFnc, '__name__', 'flcf') != 'flcf':
+        raise ValueError('The batched CPU template matching only supports FLCF scoring.')
+
+    volume, reference = [_to_numpy(v) for v in (volume, reference)]
+    if mask is None:
+        from pytom.agnostic.tools import create_sphere
+        size = reference.shape[0]
+        mask = create_sphere(reference.shape, size / 2, 0).astype(np.float32)
+        maskIsSphere = True
+    else:
+        mask = _to_numpy(mask)
+
+    wedge_volume, wedge_template = None, None
+    if wedgeInfo.__class__ in (WedgeInfo, Wedge, AgnosticWedge):
+        wedge_volume = _to_numpy(wedgeInfo.returnWedgeVolume(*volume.shape))
+        wedge_template = _to_numpy(wedgeInfo.returnWedgeVolume(*reference.shape))
+        print('Applied wedge to volume')
+
+    plan = TemplateMatchingPlanCPU(volume, reference, mask, wedge_volume, wedge_template, maskIsSphere,
+                                   batch_size=batchSize, num_threads=numThreads)
+
+    result = np.full(volume.shape, -1, dtype=np.float32)
+    orientation = np.zeros(volume.shape, dtype=np.float32)
+    sumV = np.zeros(volume.shape, dtype=np.float32) if moreInfo else None
+    sqrV = np.zeros(volume.shape, dtype=np.float32) if moreInfo else None
+
+    angles = rotations[:]
+    if verbose:
+        from pytom.tools.ProgressBar import FixedProgBar
+        prog = FixedProgBar(0, max(len(angles) - 1, 1), nodeName)
+
+    cache, cached, store = None, None, None
+    if cacheDir is not None:
+        cache = RotatedTemplateCache(cacheDir)
+        key = cache.key(reference, mask, plan.wedge, maskIsSphere, angles)
+        cached = cache.load(key, masks=not maskIsSphere)
+        if cached is None:
+            store = cache.create(key, len(angles), reference.shape, masks=not maskIsSphere)
+        elif verbose:
+            print(f'{nodeName}: using cached rotated templates {key}')
+
+    try:
+        for start in range(0, len(angles), plan.batch_size):
+            batch = angles[start:start + plan.batch_size]
+            n = len(batch)
+            if cached is not None:
+                plan.templates[:n] = cached[0][start:start + n]
+                if not maskIsSphere:
+                    plan.masks[:n] = cached[1][start:start + n]
+            else:
+                plan.rotate_batch(batch)
+                plan.prepare_batch(n)
+                if store is not None:
+                    store[0][start:start + n] = plan.templates[:n]
+                    if not maskIsSphere:
+                        store[1][start:start + n] = plan.masks[:n]
+            scores = plan.correlate_batch(n, prepared=True)
+
+            for i in range(n):
+                better = scores[i] > result
+                np.copyto(result, scores[i], where=better)
+                orientation[better] = start + i
+
+            if moreInfo:
+                sumV += scores.sum(axis=0)
+                sqrV += (scores ** 2).sum(axis=0)
+
+            if verbose:
+                prog.update(start + n - 1)
+
+        if store is not None:
+            cache.commit(store)
+            store = None
+    finally:
+        if store is not None:
+            cache.discard()
+        plan.close()
+
+    return [result, orientation, sumV, sqrV]
+
+
+def _to_numpy(volume):
+    """Return a float32 numpy copy of a pytom volume, numpy arrays are passed through."""
+    if isinstance(volume, np.ndarray):
+        return volume.astype(np.float32, copy=False)
+    if hasattr(volume, 'get'):  # cupy array
+        return volume.get().astype(np.float32, copy=False)
+    from pytom.lib.pytom_numpy import vol2npy
+    return vol2npy(volume).copy().astype(np.float32, copy=False)
@@ -184,7 +184,7 @@ class ExPeakResult:
         putSubVolume(subV, mask, startX, startY, startZ)
         
     
-    def findParticles(self, sizeParticle, maxNumParticle=0, minScore=-1, write2disk=0, margin=None, offset=[0,0,0], structured_mask=None):
+    def findParticles(self, sizeParticle, maxNumParticle=0, minScore=-1, write2disk=0, margin=None, offset=[0,0,0], structured_mask=None, method='nms'):
         """
         findParticles: Find particles in target volume according to the result volume.
         @param sizeParticle: size or radius of searched particle
@@ -197,10 +197,19 @@ class ExPeakResult:
         @type write2disk: integer
         @param margin: set the margin of the score volume
         @param margin: [x,y,z] or integer
+        @param method: 'nms' picks from the local maxima in one pass (L{findParticlesNMS}), 'greedy' scans the full \
+        volume for every particle
+        @type method: string
         
         @return: list of found particles
         @rtype: L{pytom.localization.structures.FoundParticle}
         """
+        if method == 'nms':
+            return self.findParticlesNMS(sizeParticle, maxNumParticle, minScore, write2disk, margin, offset,
+                                         structured_mask)
+        elif method != 'greedy':
+            raise ValueError('Unknown peak picking method: ' + str(method))
+
         from pytom.lib.pytom_volume import vol, peak, putSubVolume, read
         from pytom.localization.structures import FoundParticle
 
@@ -280,3 +289,120 @@ class ExPeakResult:
                 break
             
         return resList
+
+    def findParticlesNMS(self, sizeParticle, maxNumParticle=0, minScore=-1, write2disk=0, margin=None, offset=[0,0,0], structured_mask=None):
+        """
+        findParticlesNMS: Find particles by non-maximum suppression. All local maxima above minScore are collected \
+        in one pass and visited in descending order; a maximum is rejected if it falls in the excluded region of an \
+        already picked particle. The picked particles are kept in a grid hash so every test is local. \
+        Parameters and result are the same as for L{findParticles}.
+        Differs from the greedy scan only in that positions on the flank of an excluded region, which are not \
+        local maxima, are never picked. Structured masks exclude where the rotated mask is above 0.5.
+
+        @return: list of found particles
+        @rtype: L{pytom.localization.structures.FoundParticle}
+        """
+        import numpy as np
+        from scipy.ndimage import maximum_filter
+        from pytom.lib.pytom_volume import vol, read
+        from pytom.lib.pytom_numpy import vol2npy
+        from pytom.localization.structures import FoundParticle
+        from pytom.basic.structures import PickPosition, Rotation
+
+        if self.result is None or self.orient is None or self.angleList is None:
+            self.readAll()
+
+        scores = vol2npy(self.result)
+        shape = scores.shape
+
+        exclusion = None  # binary exclusion region relative to its start int(pos - size/2)
+        if sizeParticle.__class__ == list:
+            xP, yP, zP = sizeParticle
+            exclusion = np.ones((int(xP), int(yP), int(zP)), dtype=bool)
+        elif sizeParticle.__class__ == vol:
+            xP, yP, zP = sizeParticle.size_x(), sizeParticle.size_y(), sizeParticle.size_z()
+            exclusion = vol2npy(sizeParticle) > 0.001
+        else:
+            radius = int(sizeParticle)
+            xP = yP = zP = 2 * radius
+            if structured_mask is None:
+                grid = np.mgrid[-radius:radius, -radius:radius, -radius:radius]
+                exclusion = (grid ** 2).sum(axis=0) <= radius ** 2
+            else:
+                structured_mask = read(structured_mask)
+                xP, yP, zP = structured_mask.size_x(), structured_mask.size_y(), structured_mask.size_z()
+        extent = np.array([xP, yP, zP], dtype=np.float64)
+
+        if margin:
+            if margin.__class__ == list:
+                marginX, marginY, marginZ = margin
+            else:
+                marginX = marginY = marginZ = margin
+        else: # no margin given, set automatically
+            marginX = int(xP/2); marginY = int(yP/2); marginZ = int(zP/2)
+
+        # all local maxima above the threshold inside the margin, best first
+        peaks = (scores == maximum_filter(scores, size=3, mode='constant', cval=-np.inf)) & (scores > minScore)
+        inner = np.zeros(shape, dtype=bool)
+        inner[marginX:shape[0]-marginX, marginY:shape[1]-marginY, marginZ:shape[2]-marginZ] = True
+        peaks &= inner
+        candidates = np.argwhere(peaks)
+        candidates = candidates[np.argsort(-scores[peaks], kind='stable')]
+
+        # grid hash of picked particles, a cell is at least as large as the excluded region
+        cellSize = max(1, int(np.ceil(extent.max())))
+        cells = {}
+        picked = []  # [start of excluded region, excluded region]
+        rotatedMasks = {}
+
+        resList = []
+        for position in candidates:
+            if len(resList) >= maxNumParticle:
+                break
+
+            cell = tuple(position // cellSize)
+            excluded = False
+            for neighbour in np.ndindex(3, 3, 3):
+                for index in cells.get((cell[0] + neighbour[0] - 1, cell[1] + neighbour[1] - 1,
+                                        cell[2] + neighbour[2] - 1), ()):
+                    start, region = picked[index]
+                    local = position - start
+                    if (local >= 0).all() and (local < region.shape).all() and region[tuple(local)]:
+                        excluded = True
+                        break
+                if excluded:
+                    break
+            if excluded:
+                continue
+
+            posV = [int(i) for i in position]
+            [scoreV, orientV] = self.get(posV[0], posV[1], posV[2])
+
+            i = len(resList)
+            particleFilename = 'particle_'+str(i)+'.em'
+            if write2disk:
+                # write the found particle to the disk
+                l = write2disk
+                v = read(self.volFilename, posV[0]-l/2, posV[1]-l/2, posV[2]-l/2, l, l, l, 0,0,0,0,0,0)
+                v.write(particleFilename)
+
+            score = self.score()
+            score.setValue(scoreV)
+            pos = PickPosition(posV, originFilename=self.volFilename)
+            pos + offset
+            orientation = Rotation(orientV)
+            resList.append(FoundParticle(pos, orientation, score, particleFilename))
+
+            region = exclusion
+            if region is None:
+                key = tuple(orientV)
+                if key not in rotatedMasks:
+                    from pytom.basic.transformations import rotate
+                    rotated = rotate(structured_mask, orientV[0], z2=orientV[1], x=orientV[2])
+                    rotatedMasks[key] = vol2npy(rotated).copy() > 0.5
+                region = rotatedMasks[key]
+            start = (position - extent / 2).astype(int)
+            picked.append((start, region))
+            cells.setdefault(cell, []).append(len(picked) - 1)
+
+        return resList
@@ -10,6 +10,30 @@ from pytom.lib.pytom_numpy import vol2npy, npy2vol
 from pytom.agnostic.tools import subvolume, putSubVolume
 
 
+# MPI tag of the score and orientation arrays sent after a PeakResultMsg in the in-memory reduction
+RESULT_TAG = 77
+
+_comm = None
+
+
+def getComm():
+    '''
+    getComm: Get the mpi4py communicator of the in-memory reduction. It is a duplicate of MPI_COMM_WORLD, so the \
+    score and orientation arrays can never be matched by a pytom_mpi.receive (any source, any tag) on the world \
+    communicator. Duplicating is collective, all ranks call this in L{PeakLeader.__init__}.
+    @rtype: L{mpi4py.MPI.Comm}
+    '''
+    global _comm
+
+    if _comm is None:
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            raise Exception("mpi4py library is not installed!")
+        _comm = MPI.COMM_WORLD.Dup()
+    return _comm
+
+
 def getMsgStr():
     '''
     getMsgStr: Use MPI to receive the message
@@ -72,15 +96,27 @@ class PeakWorker(object):
         if msg.getSender() != '':
             self.backTo = int(msg.getSender())
 
-    def run(self, verbose=True, moreInfo=False, gpuID=-1):
+    def run(self, verbose=True, moreInfo=False, gpuID=-1, batchSize=None, cacheDir=None):
         """
         run: Run the worker and return the result
         @param verbose: verbose mode
         @type verbose: boolean
+        @param batchSize: if set (and no gpu is used), run the batched CPU engine \
+        L{pytom.localization.batched_template_matching.templateMatchingCPU} with this many rotations per batch
+        @type batchSize: integer
+        @param cacheDir: directory of the rotated template cache of the batched CPU engine, implies the batched \
+        engine (with 8 rotations per batch if batchSize is not set)
+        @type cacheDir: string
         @return: result of calculation
         @rtype: L{pytom.localization.peak_job.PeakResult}
         """
-        v = self.volume.getVolume(self.volume.subregion)
+        if gpuID is None and cacheDir and not batchSize:
+            batchSize = 8
+
+        if gpuID is None and not batchSize:
+            v = self.volume.getVolume(self.volume.subregion)
+        else:  # read only the tile directly into numpy
+            v = self.volume.getVolume(self.volume.subregion, ndarray=True)
         ref = self.reference.getVolume()
         maskFilename = self.mask.getFilename()
         if maskFilename == '': # No mask is given, use the default
@@ -99,21 +135,26 @@ class PeakWorker(object):
             ref = self.bandpass.filter(ref)
         
         g = None
-        if gpuID is None:  # gpu dependent import of functions
+        engineKwargs = {}
+        if gpuID is None and batchSize:
+            from pytom.localization.batched_template_matching import templateMatchingCPU as extractPeaks
+            engineKwargs['batchSize'] = batchSize
+            engineKwargs['cacheDir'] = cacheDir
+        elif gpuID is None:  # gpu dependent import of functions
             from pytom.localization.extractPeaks import extractPeaks
         else:
             from pytom.localization.extractPeaks import templateMatchingGPU as extractPeaks
-            v, ref, m = [vol2npy(x).copy() for x in (v, ref, m)]
+            ref, m = [vol2npy(x).copy() for x in (ref, m)]
             g = gpuID[self.mpi_id]
 
         if verbose==True:
             print(self.name + ': starting to calculate %d rotations' % rot.numberRotations() )
         [resV, orientV, sumV, sqrV] = extractPeaks(v, ref, rot, scoreFnc, m, mIsSphere, wedg, nodeName=self.name,
                                                    verboseMode=verbose, moreInfo=moreInfo, gpuID=g,
-                                                   jobid=self.mpi_id)
+                                                   jobid=self.mpi_id, **engineKwargs)
         self.runtimes = self.runtimes + 1
 
-        if g is not None:  # convert the results back to pytomvol for merging between procs
+        if resV.__class__ != vol:  # convert the results back to pytomvol for merging between procs
             # vol2npy returns a pytom volume view of a numpy array
             # need to ensure the returned variable does not refer to a locally existing variable
             copy1, copy2 = np.asfortranarray(resV), np.asfortranarray(orientV)
@@ -127,13 +168,30 @@ class PeakLeader(PeakWorker):
     """
     PeakLeader: Class for parallel running of jobs (new architecture)
     """
-    def __init__(self,suffix=''):
+    def __init__(self,suffix='', inMemory=False, binary=False):
+        """
+        @param suffix: suffix of the final scores and angles files
+        @type suffix: string
+        @param inMemory: send the partial score and orientation volumes directly to the leader over MPI instead of \
+        writing them to disk. Only the final result is written.
+        @type inMemory: boolean
+        @param binary: exchange all messages as binary pickles over mpi4py (L{pytom.parallel.transport}) instead \
+        of XML strings over pytom_mpi. With inMemory the volumes are then part of the result message.
+        @type binary: boolean
+        """
         import pytom.lib.pytom_mpi as pytom_mpi
 
         if not pytom_mpi.isInitialised():
             pytom_mpi.init()
 
         self.suffix=suffix
+        self.inMemory = inMemory
+        self.binary = binary
+        if binary:
+            from pytom.parallel.transport import getTransportComm
+            getTransportComm()
+        elif inMemory:
+            getComm()
         self.mpi_id = pytom_mpi.rank()
         self.name = 'node_' + str(self.mpi_id)
 
@@ -160,10 +218,19 @@ class PeakLeader(PeakWorker):
     def getMsgType(self, mpi_msgString):
         """
         getMsgType: Determine the message type
+        @param mpi_msgString: message string, or message object if received over the binary transport
         
         @rtype: 2-PeakJobMsg, 1-PeakResultMsg, 0-StatusMessage
         """
         from lxml import etree
+
+        if self.binary:
+            from pytom.localization.peak_job_msg import PeakJobMsg, PeakResultMsg
+            from pytom.parallel.messages import StatusMessage
+            for msgType, msgClass in ((2, PeakJobMsg), (1, PeakResultMsg), (0, StatusMessage)):
+                if isinstance(mpi_msgString, msgClass):
+                    return msgType
+            return -1
         
         xmlObj = etree.fromstring(mpi_msgString)
         
@@ -256,7 +323,7 @@ class PeakLeader(PeakWorker):
             
             if verbose==True:
                 print(self.name+': send number of %d rotations to node %d' % (subJob2.rotations.numberRotations(), self.mpi_id+subMem1))
-            subJob2.send(self.mpi_id, self.mpi_id+subMem1)
+            subJob2.send(self.mpi_id, self.mpi_id+subMem1, self.binary)
             
             self.jobInfoPool["numJobsA"] = self.jobInfoPool["numJobsA"] + 1
             from pytom.localization.peak_job import JobInfo
@@ -289,9 +356,10 @@ class PeakLeader(PeakWorker):
         """
         # check if the split is feasible
         if job.volume.subregion == [0,0,0,0,0,0]:
-            v = job.volume.getVolume()
+            # only the header is needed, the tiles are read by the workers themselves
+            from pytom.agnostic.io import read_size
             origin = [0,0,0]
-            vsize_x = v.size_x(); vsize_y = v.size_y(); vsize_z = v.size_z()
+            vsize_x, vsize_y, vsize_z = [int(s) for s in read_size(job.volume.getFilename())]
         else:
             origin = job.volume.subregion[0:3]
             vsize_x = job.volume.subregion[3]
@@ -384,7 +452,7 @@ class PeakLeader(PeakWorker):
             else:
                 if verbose==True:
                     print(self.name + ' : send part of the volume to ' + str(targetID))
-                subJob.send(self.mpi_id, targetID)
+                subJob.send(self.mpi_id, targetID, self.binary)
             
             targetID = targetID + numMem
             self.jobInfoPool["numJobsV"] = self.jobInfoPool["numJobsV"] + 1
@@ -457,6 +525,55 @@ class PeakLeader(PeakWorker):
         
         return result
     
+    def sendRes(self, resV, orientV, jobID):
+        """
+        sendRes: Send the result back without touching the disk. A PeakResultMsg without filenames announces \
+        the result, the score and orientation arrays follow over mpi4py. As pytom_mpi messages from one sender \
+        are matched in order, the announcement is always received before the arrays.
+        @param resV: result volume
+        @type resV: L{pytom.lib.pytom_volume.vol}
+        @param orientV: orientation volume
+        @type orientV: L{pytom.lib.pytom_volume.vol}
+        @param jobID: ID of job
+        @type jobID: integer
+        """
+        from pytom.localization.structures import Volume, Orientation
+        from pytom.localization.peak_job import PeakResult
+
+        if self.binary:
+            # the volumes travel out-of-band with the result message
+            PeakResult(resV, orientV, jobID).send(self.mpi_id, self.backTo, True)
+            return
+
+        PeakResult(Volume(''), Orientation(''), jobID).send(self.mpi_id, self.backTo)
+
+        comm = getComm()
+        data = [np.ascontiguousarray(vol2npy(v), dtype=np.float32) for v in (resV, orientV)]
+        comm.send(data[0].shape, dest=self.backTo, tag=RESULT_TAG)
+        for d in data:
+            comm.Send(d, dest=self.backTo, tag=RESULT_TAG)
+
+    def receiveRes(self, sender):
+        """
+        receiveRes: Receive the score and orientation arrays announced by a PeakResultMsg from sender.
+        @param sender: mpi rank of the sender
+        @type sender: integer
+        @return: [result volume, orientation volume]
+        @rtype: [L{pytom.lib.pytom_volume.vol}, L{pytom.lib.pytom_volume.vol}]
+        """
+        comm = getComm()
+        shape = comm.recv(source=sender, tag=RESULT_TAG)
+        res = []
+        for i in range(2):
+            data = np.empty(shape, dtype=np.float32)
+            comm.Recv(data, source=sender, tag=RESULT_TAG)
+            # npy2vol shares the memory, copy into a volume that owns its data
+            tmp = npy2vol(np.asfortranarray(data), 3)
+            v = vol(*shape)
+            v.copyVolume(tmp)
+            res.append(v)
+        return res
+
     def summarize(self, result, jobID, verbose=True):
         """
         summarize: Get the result and do the summarization accordingly.\
@@ -472,8 +589,11 @@ class PeakLeader(PeakWorker):
         if self.jobInfoPool == {}: # leaf node
             assert self.backTo != None
             if not self.backTo is None:
-                result =  self.writeRes(resV, orientV, jobID)
-                result.send(self.mpi_id, self.backTo)
+                if self.inMemory:
+                    self.sendRes(resV, orientV, jobID)
+                else:
+                    result =  self.writeRes(resV, orientV, jobID)
+                    result.send(self.mpi_id, self.backTo, self.binary)
             else:
                 self.writeRes(resV,orientV,None)
                 self.parallelEnd(verbose)
@@ -534,17 +654,21 @@ class PeakLeader(PeakWorker):
                 self.resOrient = self.resOrientA
                 
             if self.backTo != None:
-                result = self.writeRes(self.resVol, self.resOrient, self.jobInfoPool[jobID].originalJobID)
                 if verbose==True:
                     print(self.name + ': sending back result to ' + str(self.backTo))
-                result.send(self.mpi_id, self.backTo)
+                if self.inMemory:
+                    self.sendRes(self.resVol, self.resOrient, self.jobInfoPool[jobID].originalJobID)
+                else:
+                    result = self.writeRes(self.resVol, self.resOrient, self.jobInfoPool[jobID].originalJobID)
+                    result.send(self.mpi_id, self.backTo, self.binary)
             else:
                 # write the final result to the disk
                 self.writeRes(self.resVol, self.resOrient)
                 self.parallelEnd(verbose)
                 
     
-    def parallelRun(self, job, splitX=0, splitY=0, splitZ=0, verbose=True, gpuID=-1):
+    def parallelRun(self, job, splitX=0, splitY=0, splitZ=0, verbose=True, gpuID=-1, batchSize=None, cacheDir=None,
+                    finalise=True):
         """
         parallelRun: Parallel run the job on the computer cluster.
         @param job: job
@@ -555,6 +679,12 @@ class PeakLeader(PeakWorker):
         @type splitY: integer
         @param splitZ: split part along the z dimension
         @type splitZ: integer
+        @param batchSize: number of rotations per batch for the batched CPU engine, None for the default engine
+        @type batchSize: integer
+        @param cacheDir: directory of the rotated template cache of the batched CPU engine
+        @type cacheDir: string
+        @param finalise: finalise MPI at the end, False if more jobs follow
+        @type finalise: boolean
         """
         import pytom.lib.pytom_mpi as pytom_mpi
         if self.mpi_id == 0: # send the first message
@@ -563,7 +693,7 @@ class PeakLeader(PeakWorker):
             job.members = pytom_mpi.size()
             print('job members', job.members)
             self.distributeJobs(job, splitX, splitY, splitZ)
-            result = self.run(verbose, gpuID=gpuID)
+            result = self.run(verbose, gpuID=gpuID, batchSize=batchSize, cacheDir=cacheDir)
             self.summarize(result, self.jobID)
             #job.send(0, 0)
 
@@ -571,12 +701,16 @@ class PeakLeader(PeakWorker):
         end = False
         while not end:
             # get the message string
-            mpi_msgString = getMsgStr()
+            if self.binary:
+                from pytom.parallel.transport import receive
+                mpi_msgString = receive()[0]
+            else:
+                mpi_msgString = getMsgStr()
             
             msgType = self.getMsgType(mpi_msgString)
             
             if msgType == 2: # Job msg
-                msg = self.getJobMsg(mpi_msgString)
+                msg = mpi_msgString if self.binary else self.getJobMsg(mpi_msgString)
                 job = self.jobFromMsg(msg) # set members
                 
                 if self.mpi_id == 0:
@@ -584,18 +718,23 @@ class PeakLeader(PeakWorker):
                 else:
                     self.distributeJobs(job)
                 
-                result = self.run(verbose, gpuID=gpuID)
+                result = self.run(verbose, gpuID=gpuID, batchSize=batchSize, cacheDir=cacheDir)
                 self.summarize(result, self.jobID)
                 
             elif msgType == 1: # Result msg
-                msg = self.getResMsg(mpi_msgString)
+                msg = mpi_msgString if self.binary else self.getResMsg(mpi_msgString)
                 res = self.resFromMsg(msg)
                 
                 if verbose == True:
                     print(self.name + ": processing result from worker " + msg.getSender())
                     
-                resV = res.result.getVolume()
-                resO = res.orient.getVolume()
+                if self.inMemory and self.binary:
+                    resV, resO = res.result, res.orient
+                elif self.inMemory:
+                    resV, resO = self.receiveRes(int(msg.getSender()))
+                else:
+                    resV = res.result.getVolume()
+                    resO = res.orient.getVolume()
                 jobID = res.jobID
 
                 self.summarize([resV, resO], jobID)
@@ -603,8 +742,11 @@ class PeakLeader(PeakWorker):
             elif msgType == 0: # Status msg
                 # get the message as StatusMessage and finish
                 from pytom.parallel.messages import StatusMessage
-                msg = StatusMessage('','')
-                msg.fromStr(mpi_msgString)
+                if self.binary:
+                    msg = mpi_msgString
+                else:
+                    msg = StatusMessage('','')
+                    msg.fromStr(mpi_msgString)
                 if msg.getStatus() == 'End':
                     end = True
                     if verbose==True:
@@ -628,7 +770,8 @@ class PeakLeader(PeakWorker):
             os.rename(self.dstDir+'/'+'node_0_orient.em', self.dstDir+'/'+'angles_{}{}.em'.format(self.suffix, gpuflag))
         
         self.clean() # clean itself
-        pytom_mpi.finalise()
+        if finalise:
+            pytom_mpi.finalise()
 
         
     def parallelEnd(self, verbose=True):
@@ -644,18 +787,42 @@ class PeakLeader(PeakWorker):
         for i in range(pytom_mpi.size()):
             msg = StatusMessage(str(self.mpi_id), str(i))
             msg.setStatus("End")
-            pytom_mpi.send(str(msg), i)
+            if self.binary:
+                from pytom.parallel.transport import send
+                send(msg, i)
+            else:
+                pytom_mpi.send(str(msg), i)
             
             
-    def parallelRunMultiJobs(self, jobs, splitX=0, splitY=0, splitZ=0, verbose=True):
+    def parallelRunMultiJobs(self, jobs, splitX=0, splitY=0, splitZ=0, verbose=True, gpuID=-1, batchSize=None,
+                             cacheDir=None, subDirectories=True, suffixes=None):
+        """
+        parallelRunMultiJobs: Run several jobs one after the other, e.g. the same template against a batch of \
+        tomograms. With a cacheDir the batched CPU engine prepares the rotated templates only for the first \
+        tomogram (or tile) and reads them from the cache for all others.
+        @param jobs: jobs
+        @type jobs: L{list} of L{pytom.localization.peak_job.PeakJob}
+        @param batchSize: number of rotations per batch for the batched CPU engine, None for the default engine
+        @type batchSize: integer
+        @param cacheDir: directory of the rotated template cache of the batched CPU engine
+        @type cacheDir: string
+        @param subDirectories: write the result of job i to the subdirectory Job_i of its destination
+        @type subDirectories: boolean
+        @param suffixes: suffix of the scores and angles files of each job, the suffix of the leader if None. Jobs \
+        that write into the same directory need distinct suffixes.
+        @type suffixes: L{list} of string
+        """
         for i in range(len(jobs)):
             job = jobs[i]
+            if suffixes is not None:
+                self.suffix = suffixes[i]
             
-            if self.mpi_id == 0:
+            if self.mpi_id == 0 and subDirectories:
                 from pytom.tools.files import checkDirExists
                 new_dir = job.dstDir + 'Job_' + str(i)
                 if not checkDirExists(new_dir):
                     os.mkdir(new_dir)
                 job.dstDir = new_dir
             
-            self.parallelRun(job, splitX, splitY, splitZ, verbose)
+            self.parallelRun(job, splitX, splitY, splitZ, verbose, gpuID=gpuID, batchSize=batchSize, cacheDir=cacheDir,
+                             finalise=i == len(jobs) - 1)
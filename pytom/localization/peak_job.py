@@ -197,13 +197,15 @@ class PeakJob(PyTomClass):
         
         return returnValue
 
-    def send(self, source, destination):
+    def send(self, source, destination, binary=False):
         """
         send: Send the job-relevant message from source to destination
         @param source: source machine id gained from pytom.lib.pytom_mpi
         @type source: int
         @param destination: destination machine id
         @type destination: int
+        @param binary: send the message object over L{pytom.parallel.transport} instead of as XML string
+        @type binary: bool
         @author: chen
         """
         
@@ -212,7 +214,12 @@ class PeakJob(PyTomClass):
         # self.check()
         msg = PeakJobMsg(str(source), str(destination))
         msg.setJob(self)
-        
+
+        if binary:
+            from pytom.parallel.transport import send
+            send(msg, destination)
+            return
+
         import pytom.lib.pytom_mpi as pytom_mpi
 
         pytom_mpi.send(str(msg), int(destination))
@@ -301,12 +308,27 @@ class PeakResult(PyTomClass):
          
         return returnValue
     
-    def send(self, source, destination):
+    def send(self, source, destination, binary=False):
+        """
+        send: Send the result message from source to destination
+        @param source: source machine id gained from pytom.lib.pytom_mpi
+        @type source: int
+        @param destination: destination machine id
+        @type destination: int
+        @param binary: send the message object over L{pytom.parallel.transport} instead of as XML string. The \
+        result and orientation may then also be L{pytom.lib.pytom_volume.vol} instead of files.
+        @type binary: bool
+        """
         
         from pytom.localization.peak_job_msg import PeakResultMsg
         
         msg = PeakResultMsg(str(source), str(destination))
         msg.setResult(self)
+
+        if binary:
+            from pytom.parallel.transport import send
+            send(msg, destination)
+            return
         
         import pytom.lib.pytom_mpi as pytom_mpi
         print(f'destination: {destination}\ntype: {source}')
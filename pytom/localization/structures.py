@@ -29,7 +29,7 @@ class Volume(PyTomClass):
         """
         self._filename = filename
     
-    def getVolume(self, subregion=[0,0,0,0,0,0], sampling=[0,0,0], binning=[0,0,0]):
+    def getVolume(self, subregion=[0,0,0,0,0,0], sampling=[0,0,0], binning=[0,0,0], ndarray=False):
         """
         getVolume: Get the volume according to the given parameters.
         Note the subregion, sampling and binning parameters are not the same as
@@ -41,15 +41,24 @@ class Volume(PyTomClass):
         @type sampling: list
         @param binning: binning [factorX, factorY, factorZ]
         @type binning: list
-        
-        @rtype: L{pytom.lib.pytom_volume.vol}
+        @param ndarray: return a numpy array read through the memory-mapped L{pytom.agnostic.io.read}, \
+        only the subregion is loaded from disk. Sampling and binning are not supported in this mode.
+        @type ndarray: bool
+
+        @rtype: L{pytom.lib.pytom_volume.vol} or L{numpy.ndarray}
         """
-        from pytom.lib.pytom_volume import read
         from pytom.tools.files import checkFileExists
         
         if not checkFileExists(self._filename):
             raise Exception('File ' + self._filename + ' does not exist!')
-        
+
+        if ndarray:
+            from pytom.agnostic.io import read
+            if any(sampling) or any(binning):
+                raise ValueError('Sampling and binning are not supported when reading as ndarray.')
+            return read(self._filename, subregion=subregion, keepnumpy=True)
+
+        from pytom.lib.pytom_volume import read
         return read(self._filename, subregion[0], subregion[1], subregion[2],
                     subregion[3], subregion[4], subregion[5],
                     sampling[0], sampling[1], sampling[2],
@@ -10,13 +10,23 @@ from pytom.parallel.messages import Message
 
 class ParallelWorker(PyTomClass):
     
-    def __init__(self):
+    def __init__(self, binary=False):
+        """
+        @param binary: send the message objects as binary pickles over mpi4py (L{pytom.parallel.transport}) \
+        instead of as XML strings over pytom_mpi
+        @type binary: bool
+        """
         
         import pytom_mpi
         
         if not pytom_mpi.isInitialised():
             pytom_mpi.init()
         
+        self._binary = binary
+        if binary:
+            from pytom.parallel.transport import getTransportComm
+            getTransportComm()
+        
         self._mpi_id = pytom_mpi.rank()
         self._numberWorkers = pytom_mpi.size() -1
         
@@ -48,6 +58,29 @@ class ParallelWorker(PyTomClass):
         print('You forgot to overwrite getMsgObject in your worker class')
         assert False
     
+    def _send(self, msg, destination):
+        """
+        _send: Send a message object with the transport of this worker
+        """
+        if self._binary:
+            from pytom.parallel.transport import send
+            send(msg, destination)
+        else:
+            import pytom_mpi
+            pytom_mpi.send(str(msg), destination)
+    
+    def _receive(self):
+        """
+        _receive: Receive a message with the transport of this worker
+        @return: message object if binary, otherwise message string
+        """
+        if self._binary:
+            from pytom.parallel.transport import receive
+            return receive()[0]
+        else:
+            import pytom_mpi
+            return pytom_mpi.receive()
+    
     def setJob(self, jobMessage):
         """
         setJob:
@@ -83,7 +116,7 @@ class ParallelWorker(PyTomClass):
             
             for i in range(0, numberJobsToSend):
                 #send out all first numberJobsToSend jobs
-                pytom_mpi.send(str(self._jobList[i]),i+1)
+                self._send(self._jobList[i],i+1)
                 
                 
             numberFinishedJobs = 0
@@ -93,15 +126,18 @@ class ParallelWorker(PyTomClass):
             
             while not finished:
                 #distribute remaining jobs to finished workers
-                mpi_msgString = pytom_mpi.receive()
+                mpi_msgString = self._receive()
                 
-                msg = Message('1','0')
-                msg.fromStr(mpi_msgString)
+                if self._binary:
+                    msg = mpi_msgString
+                else:
+                    msg = Message('1','0')
+                    msg.fromStr(mpi_msgString)
                          
                 numberFinishedJobs += 1
             
                 if numberSentJobs < numberJobs:
-                    pytom_mpi.send(str(self._jobList[numberSentJobs]),int(msg.getSender()))
+                    self._send(self._jobList[numberSentJobs],int(msg.getSender()))
                     numberSentJobs += 1
             
                 finished = numberSentJobs == numberJobs and numberFinishedJobs == numberJobs
@@ -110,7 +146,7 @@ class ParallelWorker(PyTomClass):
                 for i in range(0,self._numberWorkers):
                     msg = StatusMessage('0',i+1)
                     msg.setStatus('End')
-                    pytom_mpi.send(str(msg),i+1)
+                    self._send(msg,i+1)
                     print('Sending end msg to:', i+1)
                 
         else:
@@ -121,16 +157,19 @@ class ParallelWorker(PyTomClass):
                            
                 #listen for messages
                 
-                mpi_msgString = pytom_mpi.receive()
+                mpi_msgString = self._receive()
                 
                 if verbose:
                     print(mpi_msgString)
                     
                 try:
                     
+                    if self._binary and isinstance(mpi_msgString, StatusMessage):
+                        # raise into the status message handling below
+                        raise MessageError('StatusMessage')
                     
                     #wait for job and start processing
-                    msg = self.getMsgObject(mpi_msgString)                           
+                    msg = mpi_msgString if self._binary else self.getMsgObject(mpi_msgString)
                     
                     self.setJob(msg)
                     
@@ -139,15 +178,18 @@ class ParallelWorker(PyTomClass):
                     resultMsg = StatusMessage(self._mpi_id,'0')
                     resultMsg.setStatus('Finished')
                     
-                    pytom_mpi.send(str(resultMsg),0)
+                    self._send(resultMsg,0)
                    
                 except (MessageError,PyTomClassError,ParameterError):
                         try:
                             #message is a StatusMessage
                             #if message status is End, finish this worker. 
                             #You can also add other statuses
-                            msg = StatusMessage('','')
-                            msg.fromStr(mpi_msgString)
+                            if self._binary:
+                                msg = mpi_msgString
+                            else:
+                                msg = StatusMessage('','')
+                                msg.fromStr(mpi_msgString)
                             if msg.getStatus() == 'End':
                                 end = True
                                                    
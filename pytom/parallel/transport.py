@@ -0,0 +1,174 @@
+'''
+Binary message transport over mpi4py.
+
+pytom_mpi only moves strings, so messages are serialised to XML or to a protocol 0 pickle and decoded to text before
+they are sent. This module sends python objects instead. They are pickled with the latest protocol and large
+buffers (numpy arrays and L{pytom.lib.pytom_volume.vol}) travel out-of-band, i.e. without being copied into the
+pickle stream (mpi4py.util.pkl5). Volumes are reduced to numpy arrays by the pickler of this module only, other
+pickling (multiprocessing, copy) is not affected. The transport runs on a duplicate of MPI_COMM_WORLD, so its messages
+can never be matched by a pytom_mpi.receive that is waiting for a string message at the same time.
+
+All ranks have to call L{getTransportComm} (directly or through L{send}/L{receive}) before the first message is
+exchanged, because duplicating a communicator is a collective operation.
+'''
+import copyreg
+import io
+import pickle
+
+# tag used when none is given
+DEFAULT_TAG = 0
+
+_comm = None
+
+
+def _vol_from_array(data):
+    from pytom.lib.pytom_numpy import npy2vol
+    from pytom.lib.pytom_volume import vol
+
+    # npy2vol shares the memory of the received buffer, copy into a volume that owns its data
+    result = vol(*data.shape)
+    result.copyVolume(npy2vol(data, 3))
+    return result
+
+
+def _reduce_vol(volume):
+    from pytom.lib.pytom_numpy import vol2npy
+    # a view on the volume memory, pickled out-of-band by numpy
+    return _vol_from_array, (vol2npy(volume),)
+
+
+class _TransportPickler(pickle.Pickler):
+    """
+    _TransportPickler: Pickler that also reduces L{pytom.lib.pytom_volume.vol}
+    """
+    dispatch_table = copyreg.dispatch_table.copy()
+    try:
+        from pytom.lib.pytom_volume import vol as _vol
+        dispatch_table[_vol] = _reduce_vol
+        del _vol
+    except ImportError:
+        pass
+
+
+def _dumps(obj):
+    """
+    _dumps: Pickle an object with the latest protocol
+    @return: [pickle stream, out-of-band buffers]
+    @rtype: L{list}
+    """
+    stream, buffers = io.BytesIO(), []
+    _TransportPickler(stream, protocol=pickle.HIGHEST_PROTOCOL, buffer_callback=buffers.append).dump(obj)
+    return [stream.getvalue(), buffers]
+
+
+def getTransportComm():
+    """
+    getTransportComm: Get the communicator of the binary transport
+    @rtype: L{mpi4py.util.pkl5.Intracomm}
+    """
+    global _comm
+
+    if _comm is None:
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            raise Exception("mpi4py library is not installed!")
+
+        try:
+            from mpi4py.util import pkl5
+            _comm = pkl5.Intracomm(MPI.COMM_WORLD.Dup())
+        except ImportError:
+            # mpi4py < 3.1, no out-of-band buffers but still the latest pickle protocol
+            MPI.pickle.PROTOCOL = pickle.HIGHEST_PROTOCOL
+            _comm = MPI.COMM_WORLD.Dup()
+
+    return _comm
+
+
+def send(obj, destination, tag=DEFAULT_TAG):
+    """
+    send: Send a python object
+    @param obj: any picklable object, e.g. a L{pytom.parallel.messages.Message}, a dict or a volume
+    @param destination: rank of the receiver
+    @type destination: L{int}
+    @param tag: message tag
+    @type tag: L{int}
+    """
+    # the buffers are pickle.PickleBuffer objects, which pkl5 sends again without copying them
+    getTransportComm().send(_dumps(obj), dest=int(destination), tag=tag)
+
+
+def receive(source=None, tag=None):
+    """
+    receive: Receive a python object
+    @param source: rank of the sender, None for any sender
+    @type source: L{int}
+    @param tag: message tag, None for any tag
+    @type tag: L{int}
+    @return: [object, rank of the sender]
+    @rtype: L{list}
+    """
+    from mpi4py import MPI
+
+    status = MPI.Status()
+    data, buffers = getTransportComm().recv(source=MPI.ANY_SOURCE if source is None else int(source),
+                                            tag=MPI.ANY_TAG if tag is None else tag, status=status)
+    return [pickle.loads(data, buffers=buffers), status.Get_source()]
+
+
+def _benchmark(rounds=10, volumeSize=128, numberOfPairs=100000):
+    """
+    _benchmark: Ping-pong throughput of the pytom_mpi string transport (protocol 0 pickles) against the binary \
+    transport. Run with two processes: mpirun -n 2 python -m pytom.parallel.transport
+    @param rounds: number of round trips per payload
+    @type rounds: L{int}
+    @param volumeSize: edge length of the volume payload
+    @type volumeSize: L{int}
+    @param numberOfPairs: number of entries of the result dict payload (as sent by the CCC workers)
+    @type numberOfPairs: L{int}
+    """
+    import time
+    import numpy as np
+    import pytom.lib.pytom_mpi as pytom_mpi
+
+    if not pytom_mpi.isInitialised():
+        pytom_mpi.init()
+    rank = pytom_mpi.rank()
+    if pytom_mpi.size() != 2:
+        raise RuntimeError('Run the benchmark with two processes!')
+    other = 1 - rank
+
+    def sendString(obj, destination):
+        pytom_mpi.send(pickle.dumps(obj, protocol=0, fix_imports=True).decode('ISO-8859-1'), destination)
+
+    def receiveString():
+        return pickle.loads(pytom_mpi.receive().encode('ISO-8859-1'))
+
+    rng = np.random.default_rng(0)
+    payloads = {'volume %d^3' % volumeSize: rng.random((volumeSize,) * 3, dtype=np.float32),
+                'dict %d pairs' % numberOfPairs: {(i, i + 1): float(i) / numberOfPairs for i in range(numberOfPairs)}}
+
+    getTransportComm()
+    for name, payload in payloads.items():
+        nbytes = len(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        for transport, (sendFunction, receiveFunction) in (('pytom_mpi', (sendString, receiveString)),
+                                                           ('binary', (send, lambda: receive(other)[0]))):
+            getTransportComm().Barrier()
+            t = time.time()
+            for i in range(rounds):
+                if rank == 0:
+                    sendFunction(payload, other)
+                    receiveFunction()
+                else:
+                    sendFunction(receiveFunction(), other)
+            elapsed = time.time() - t
+
+            if rank == 0:
+                print('%-20s %-10s %8.2f msg/s %10.1f MB/s' % (name, transport, 2 * rounds / elapsed,
+                                                               2 * rounds * nbytes / elapsed / 1024 ** 2))
+
+    pytom_mpi.finalise()
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -15,6 +15,7 @@ except:
 import pylab as pp
 from pytom.gpu.initialize import xp, device
 from pylab import imshow, show, savefig, subplots
+from collections import OrderedDict
 
 def polish_particles(particle_list_filename, projection_directory, averaged_subtomogram, binning, offset,
                      projections, tilt_angles, mpi, fsc_path='', peak_border=75, outputDirectory='./',
@@ -116,10 +117,16 @@ def polish_particles(particle_list_filename, projection_directory, averaged_subt
 
     if verbose: print("{:s}> Started on running the process".format(gettime()))
 
-    lists = list(zip(*input_to_processes))
-    if verbose: print(len(list(lists)))
+    # all tasks of a group share a projection, so every worker reads a projection once per group instead of once
+    # per particle
+    groups = group_tasks_by_projection(input_to_processes, mpi.size)
+    if verbose: print(len(groups))
 
-    output = mpi.parfor(run_single_tilt_angle, list(zip(lists[0], lists[1],lists[2],lists[3],lists[4],lists[5],lists[6],lists[7],lists[8],lists[9],lists[10],lists[11],lists[12],lists[13]))) # Some problem internally 23/10/2019
+    output = [None] * len(input_to_processes)
+    for group, results in zip(groups, mpi.parfor(run_tilt_angle_group, [[input_to_processes[i] for i in group]
+                                                                        for group in groups])):
+        for i, result in zip(group, results):
+            output[i] = result
 
     results_file = os.path.join(outputDirectory, f"resultsPolish_{particle_list_name}.txt")
     np.savetxt(results_file, np.array(output, dtype=LOCAL_ALIGNMENT_RESULTS), fmt=fmtLAR, header=headerLocalAlignmentResults)
@@ -138,7 +145,146 @@ def run_single_tilt_angle_unpack(inp):
     """
     return run_single_tilt_angle(*inp)
 
-def cut_patch(projection, ang, pick_position, vol_size=200, binning=8, dimz=0, offset=[0,0,0]):
+# per process caches of the polishing workers
+_polish_cache = {'projection': (None, None, None), 'subtomograms': {}, 'templates': OrderedDict()}
+
+# number of template projections kept by a worker
+TEMPLATE_CACHE_SIZE = 256
+
+
+def group_tasks_by_projection(tasks, number_of_workers=1, tasks_per_worker=4):
+    """
+    Group the polishing tasks that use the same projection. Groups are split further when there are fewer than
+    tasks_per_worker groups per worker, so the work can still be balanced over the workers.
+
+    @param tasks: arguments to "run_single_tilt_angle" for every task
+    @type tasks: list
+    @param number_of_workers: number of processes that run the groups
+    @type number_of_workers: int
+    @param tasks_per_worker: minimal number of groups per worker
+    @type tasks_per_worker: int
+    @return: lists of task indices
+    @returntype: list
+    """
+    import numpy as np
+
+    by_projection = OrderedDict()
+    for i, task in enumerate(tasks):
+        by_projection.setdefault(task[9], []).append(i)
+
+    splits = max(1, int(np.ceil(tasks_per_worker * number_of_workers / max(1, len(by_projection)))))
+    groups = []
+    for indices in by_projection.values():
+        groups += [[int(i) for i in part] for part in np.array_split(indices, min(splits, len(indices)))]
+    return groups
+
+
+def run_tilt_angle_group(tasks):
+    """
+    Run "run_single_tilt_angle" for a group of tasks that use the same projection.
+
+    @param tasks: arguments to "run_single_tilt_angle" for every task
+    @type tasks: list
+    @return: the results of "run_single_tilt_angle" in the order of the tasks
+    @returntype: list
+    """
+    return [run_single_tilt_angle(*task) for task in tasks]
+
+
+def load_projection(filename):
+    """
+    Read a projection and compute its spline coefficients for cutting patches. The last projection is kept by the
+    worker. The file is memory mapped, so processes on the same node share its pages.
+
+    @param filename: the filename of the projection
+    @type filename: str
+    @return: the projection, its spline coefficients (see "cut_from_projection")
+    @returntype: tuple
+    """
+    import numpy as np
+    from scipy.ndimage import spline_filter
+    from pytom.agnostic.io import read
+
+    name, projection, coefficients = _polish_cache['projection']
+    if name != filename:
+        projection = read(filename, mmap=True)
+        try:
+            data = projection.squeeze().get()
+        except AttributeError:
+            data = projection.squeeze()
+        # identical to the prefilter of map_coordinates(order=2)
+        coefficients = spline_filter(data, 2, output=np.float64, mode='constant')
+        _polish_cache['projection'] = (filename, projection, coefficients)
+    return projection, coefficients
+
+
+def load_subtomogram(filename, fsc_path=''):
+    """
+    Read the (averaged) subtomogram that is reprojected as template, masked and optionally filtered by the FSC. The
+    result is kept by the worker.
+
+    @param filename: the filename of the subtomogram
+    @type filename: str
+    @param fsc_path: file with the FSC profile, not applied if the file does not exist
+    @type fsc_path: str
+    @return: the subtomogram
+    @returntype: ndarray
+    """
+    import os
+    from pytom.agnostic.io import read
+    from pytom.agnostic.filter import applyFourierFilterFull, profile2FourierVol
+
+    key = (filename, fsc_path)
+    if key not in _polish_cache['subtomograms']:
+        subtomogram = read(filename) * read(
+            '/data/gijsvds/ctem/05_Subtomogram_Analysis/Alignment/GLocal/mask_200_75_5.mrc')
+
+        if os.path.isfile(fsc_path):
+            profile = [line.split()[0] for line in open(fsc_path, 'r').readlines()]
+            fsc_mask3d = profile2FourierVol(profile, subtomogram.shape)
+
+            subtomogram = applyFourierFilterFull(subtomogram, fsc_mask3d)
+        _polish_cache['subtomograms'][key] = subtomogram
+    return _polish_cache['subtomograms'][key]
+
+
+def template_projection(subtomogram, particle_rotation, ang, fsc_path=''):
+    """
+    Project the subtomogram in the orientation of the particle at a tilt angle. The projection is computed once per
+    orientation and tilt angle by every worker.
+
+    @param subtomogram: the filename of the subtomogram
+    @type subtomogram: str
+    @param particle_rotation: the rotation of the particle (Z1/phi, X/the, Z2/psi)
+    @type particle_rotation: tuple
+    @param ang: the tilt angle
+    @type ang: float
+    @param fsc_path: file with the FSC profile, see "load_subtomogram"
+    @type fsc_path: str
+    @return: the template projection
+    @returntype: ndarray
+    """
+    from pytom.agnostic.transform import rotate3d, rotate_axis
+
+    templates = _polish_cache['templates']
+    key = (subtomogram, tuple(particle_rotation), ang, fsc_path)
+    if key in templates:
+        templates.move_to_end(key)
+        return templates[key]
+
+    volume = load_subtomogram(subtomogram, fsc_path)
+    # First rotate the template towards orientation of the particle, then to the tilt angle
+    rotated1 = rotate3d(volume, phi=particle_rotation[0], the=particle_rotation[1], psi=particle_rotation[2])
+    rotated2 = rotate_axis(rotated1, -ang, 'y')  # SWITCHED TO ROTATE AXIS AND ANGLE *-1 THIS IS AN ATTEMPT
+    template = rotated2.sum(axis=2)
+
+    templates[key] = template
+    if len(templates) > TEMPLATE_CACHE_SIZE:
+        templates.popitem(last=False)
+    return template
+
+
+def cut_patch(projection, ang, pick_position, vol_size=200, binning=8, dimz=0, offset=[0,0,0], prefiltered=False):
     from pytom.agnostic.transform import rotate3d, rotate_axis
     import numpy as np
     from math import cos, sin, pi
@@ -159,7 +305,7 @@ def cut_patch(projection, ang, pick_position, vol_size=200, binning=8, dimz=0, o
     xx = (cos(ang * pi / 180) * (x - dim_x / 2) - sin(ang * pi / 180) * (z - dim_z / 2)) + dim_x / 2
 
     # Cut the small patch out
-    patch = cut_from_projection(projection.squeeze(), [xx, yy], [vol_size, vol_size])
+    patch = cut_from_projection(projection.squeeze(), [xx, yy], [vol_size, vol_size], prefiltered=prefiltered)
     patch = patch #- patch.mean()
 
     return patch, xx, yy
@@ -222,17 +368,10 @@ def run_single_tilt_angle(subtomogram, ang, offset, vol_size, particle_position,
     # Filter using FSC
     fsc_mask = None
     k = 0.01
-    subtomogram = read(subtomogram) * read(
-        '/data/gijsvds/ctem/05_Subtomogram_Analysis/Alignment/GLocal/mask_200_75_5.mrc')
 
     import os
     from pytom.agnostic.filter import filter_volume_by_profile, profile2FourierVol
     fsc_path = ''
-    if os.path.isfile(fsc_path):
-        profile = [line.split()[0] for line in open(fsc_path, 'r').readlines()]
-        fsc_mask3d = profile2FourierVol(profile, subtomogram.shape)
-
-        subtomogram = applyFourierFilterFull(subtomogram, fsc_mask3d)
 
 
     # Cross correlate the templat
@@ -244,18 +383,17 @@ def run_single_tilt_angle(subtomogram, ang, offset, vol_size, particle_position,
 
 
 
-    img = read(img)
-
-    rotated1 = rotate3d(subtomogram, phi=particle_rotation[0], the=particle_rotation[1], psi=particle_rotation[2])
-    rotated2 = rotate_axis(rotated1, -ang, 'y')  # SWITCHED TO ROTATE AXIS AND ANGLE *-1 THIS IS AN ATTEMPT
-    template = rotated2.sum(axis=2)
+    # projection, its spline coefficients and the template projection are cached by the worker process
+    img, coefficients = load_projection(img)
+    template = template_projection(subtomogram, particle_rotation, ang, fsc_path)
 
     # write('pp1_template.mrc', template)
 
 
     # img = read(img)
     try:
-        patch, xx, yy = cut_patch(img, ang, particle_position, dimz=dimz, vol_size=vol_size, binning=binning )
+        patch, xx, yy = cut_patch(coefficients, ang, particle_position, dimz=dimz, vol_size=vol_size, binning=binning,
+                                  prefiltered=True)
         mask2d = create_circle(patch.shape, radius=75, sigma=5, num_sigma=2)
         patch *= mask2d
         # write('pp1_patch.mrc', patch)
@@ -907,6 +907,91 @@ class TiltAlignment:
         #print(numpy.sqrt(score))
         return score
 
+    def alignmentDeviations(self, optimizableVariables):
+        """
+        compute deviations of the marker model for given parameters, for least squares optimization
+
+        @param optimizableVariables: array of variables that are subject to optimization
+        @type optimizableVariables: numpy array
+        @return: deviations in x and y of all clicked markers
+        @rtype: numpy array
+        """
+        from pytom.reconstruction.tiltAlignmentFunctions import markerArrays, markerResidualVectorized
+        self.setOptimizableVariables(self.TiltSeries_._TiltAlignmentParas, optimizableVariables)
+        self.sum_called += 1
+
+        return markerResidualVectorized(self.TiltSeries_._TiltAlignmentParas.cent, *markerArrays(self._Markers),
+                                        cTilt=self._cTilt, sTilt=self._sTilt,
+                                        transX=self._alignmentTransX, transY=self._alignmentTransY,
+                                        rotInPlane=self._alignmentRotations, isoMag=self._alignmentMagnifications,
+                                        dBeam=self._alignmentBeamTilt)
+
+    def alignmentJacobian(self, optimizableVariables):
+        """
+        compute the analytic derivatives of L{alignmentDeviations} with respect to the optimizable variables
+
+        @param optimizableVariables: array of variables that are subject to optimization
+        @type optimizableVariables: numpy array
+        @return: jacobian (deviations x optimizable variables)
+        @rtype: numpy array
+        """
+        from pytom.reconstruction.tiltAlignmentFunctions import markerArrays, markerResidualVectorized
+        self.setOptimizableVariables(self.TiltSeries_._TiltAlignmentParas, optimizableVariables)
+
+        deviations, jacobian = markerResidualVectorized(self.TiltSeries_._TiltAlignmentParas.cent,
+                                                        *markerArrays(self._Markers),
+                                                        cTilt=self._cTilt, sTilt=self._sTilt,
+                                                        transX=self._alignmentTransX, transY=self._alignmentTransY,
+                                                        rotInPlane=self._alignmentRotations,
+                                                        isoMag=self._alignmentMagnifications,
+                                                        dBeam=self._alignmentBeamTilt, jacobian=True)
+        return jacobian[:, self.getOptimizableColumns(self.TiltSeries_._TiltAlignmentParas)]
+
+    def getOptimizableColumns(self, TiltAlignmentParameters_):
+        """
+        columns of the jacobian of markerResidualVectorized that belong to the optimizable variables, in the order \
+        of getOptimizableVariables
+
+        @param TiltAlignmentParameters_: parameters for tilt alignment
+        @type TiltAlignmentParameters_: TiltAlignmentParameters
+        @return: column indices
+        @rtype: list
+        """
+        ntilt = self._ntilt
+        nmark = len(self._Markers)
+        columns = []
+
+        # marker 3D coords
+        for imark in range(nmark):
+            if imark != TiltAlignmentParameters_.irefmark:
+                columns += [3 * imark, 3 * imark + 1, 3 * imark + 2]
+        col = 3 * nmark
+
+        # translations
+        if self.optimizeMarkerPositions:
+            for itilt in range(ntilt):
+                columns += [col + itilt, col + ntilt + itilt]
+        col += 2 * ntilt
+
+        # magnification changes
+        if TiltAlignmentParameters_.dmag:
+            columns += [col + itilt for itilt in range(ntilt)
+                        if int(self._projIndices[itilt]) != int(self._projIndices[self.ireftilt])]
+        col += ntilt
+
+        # image rotations, only the first one if all rotations are the same
+        if TiltAlignmentParameters_.drot:
+            columns += [col + itilt for itilt in range(ntilt)]
+        else:
+            columns.append(col)
+        col += ntilt
+
+        # beam inclination
+        if TiltAlignmentParameters_.dbeam:
+            columns.append(col)
+
+        return columns
+
     def alignmentScoreFixedMarker(self, optimizableVariables):
         """
         compute alignment score for given parameters
@@ -1246,6 +1331,10 @@ class TiltAlignment:
             optimizer = scipy.optimize.fmin_powell
             if not mute:
                 print("using scipy fmin_powell optimizer")
+        elif self.TiltSeries_._TiltAlignmentParas.optimizer == 'least_squares':
+            optimizer = scipy.optimize.least_squares
+            if not mute:
+                print("using scipy least_squares optimizer with analytic jacobian")
         else:
             if not mute:
                 print(("optimizer " + str(self.TiltSeries_._TiltAlignmentParas.optimizer) +
@@ -1287,6 +1376,13 @@ class TiltAlignment:
             optimizableVariables, success = optimizer(scoringFunction, optimizableVariables0,
                                                       maxfev=self.TiltSeries_._TiltAlignmentParas.maxIter*10, epsfcn=0.0,
                                                       factor=10)
+        elif self.TiltSeries_._TiltAlignmentParas.optimizer == 'least_squares':
+            # without marker shifts the translations follow from the reference marker, the analytic jacobian does
+            # not cover that dependency
+            jacobian = self.alignmentJacobian if self.optimizeMarkerPositions else '2-point'
+            optimizableVariables = optimizer(self.alignmentDeviations, optimizableVariables0, jac=jacobian,
+                                             x_scale='jac',
+                                             max_nfev=self.TiltSeries_._TiltAlignmentParas.maxIter).x
 
         score = markerResidual(self.TiltSeries_._TiltAlignmentParas.cent,
             Markers_=self._Markers,
@@ -2024,7 +2120,8 @@ class TiltAlignmentParameters:
         @type handflip: bool
         @param maxIter:  Maximum number of iteration for optimization (default: 2000)
         @type maxIter: int
-        @param optimizer: optimzation algorithm 
+        @param optimizer: optimzation algorithm: fmin, fmin_powell, fmin_cg, fmin_slsqp, leastsq or least_squares \
+        (scipy.optimize.least_squares with analytic jacobian, fastest for many markers and free parameters)
         @type optimizer: str
         @param leastsq: least-squared optimization
         @type leastsq: bool
@@ -25,10 +25,12 @@ class ReconstructionMessage(Message):
                 
     def toXML(self):
         from lxml import etree
+        from pytom.basic.particle_list_io import toBinaryXML
         
         message_element = etree.Element('ReconstructionMessage',Sender = str(self._sender), Recipient = str(self._recipient), Timestamp = str(self._timestamp))
                                 
-        message_element.append(self._particleList.toXML())
+        # binary particle list, much faster to parse for the workers than XML
+        message_element.append(toBinaryXML(self._particleList))
         message_element.append(self._projectionList.toXML())
         message_element.set('CubeSize',str(self._cubeSize))
         message_element.set('Binning',str(self._binning))
@@ -39,7 +41,7 @@ class ReconstructionMessage(Message):
 
     def fromXML(self,xmlObj):
         from lxml.etree import _Element
-        from pytom.basic.structures import ParticleList
+        from pytom.basic.particle_list_io import particleListFromXML
         from pytom.reconstruction.reconstructionStructures import ProjectionList
         
         if xmlObj.__class__ != _Element :
@@ -58,9 +60,7 @@ class ReconstructionMessage(Message):
         self._binning = float(message_element.get('Binning'))
         self._applyWeighting = bool(message_element.get('ApplyWeighting'))        
         
-        self._particleList = ParticleList('.')
-        particleListXML = message_element.xpath('ParticleList')[0]
-        self._particleList.fromXML(particleListXML)
+        self._particleList = particleListFromXML(message_element, '.')
                
         self._projectionList = ProjectionList()
         projectionListXML = message_element.xpath('ProjectionList')[0]
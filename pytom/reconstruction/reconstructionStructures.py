@@ -181,6 +181,45 @@ def align_single_projection(index, projection_list, tilt_angles, shared_dtype, s
                    (projection.getOffsetX(), projection.getOffsetY()))
 
 
+# ============================= helper functions parallel subtomogram reconstruction =====
+
+def to_shared_memory(array):
+    """
+    Copy an array into a new block of shared memory so that spawned processes can attach to it without reading \
+    it from disk. The caller has to close and unlink the block.
+
+    @param array: array to share, a cupy array is copied to the host first
+    @type array: L{numpy.ndarray}
+    @return: the shared memory block and a descriptor for L{from_shared_memory}
+    @rtype: L{tuple}
+    """
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    if not isinstance(array, np.ndarray):
+        array = array.get()
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, order='F')[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def from_shared_memory(descriptor):
+    """
+    Attach to a block created by L{to_shared_memory}.
+
+    @param descriptor: descriptor returned by L{to_shared_memory}
+    @type descriptor: L{tuple}
+    @return: the shared memory block (keep a reference while the array is used) and a fortran ordered view on it
+    @rtype: L{tuple}
+    """
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf, order='F')
+
+
 # ============================== Projection Class =========================================
 
 class Projection(PyTomClass):
@@ -1003,7 +1042,7 @@ class ProjectionList(PyTomClass):
                            apply_circle_filter=True,  pre_scale_factor=1., post_scale=1., num_procs=1,
                            ctfcenter=None, polishResultFile='', specimen_angle=0.,
                            tilt_range=None, show_progress_bar=False,
-                           verbose=False, gpuIDs=None):
+                           verbose=False, gpuIDs=None, packed=False):
         """
         reconstructVolumes: reconstruct a subtomogram given a particle object.
 
@@ -1026,11 +1065,13 @@ class ProjectionList(PyTomClass):
         @param gpuIDs: List of gpu-ids on which reconstruction will take place.
         @type gpuIDs: list
         @param specimen_angle: angle of the specimen, the tilt angle will be corrected by this angle
+        @param packed: write the subtomograms into a subtomogram stack next to the particle files instead of one \
+        file per particle, see L{pytom.agnostic.subtomogram_stack}
+        @type packed: bool
         """
         import time, os, sys
-        from pytom.agnostic.io import write
-        # from pytom.basic.files import write_em
         from pytom.lib.pytom_volume import vol, backProject, rescaleSpline
+        from pytom.agnostic.subtomogram_stack import SubtomogramStackWriter, stack_path, clear_stack
         from pytom.tools.ProgressBar import FixedProgBar
         from multiprocessing import Process, set_start_method
 
@@ -1088,16 +1129,18 @@ class ProjectionList(PyTomClass):
         # create list for processes
         procs = []
 
-        # set the temp dir from particle storage path
-        temp_dir = os.path.dirname(particles[0].getFilename())
+        # a new reconstruction replaces the particles of an earlier packed run
+        stack_dir = stack_path(particles[0].getFilename()) if packed else None
+        if packed:
+            clear_stack(stack_dir)
 
         if num_procs > 1 or gpuIDs is not None:
+            from multiprocessing import Queue
+            from pytom.lib.pytom_numpy import vol2npy
 
-            # temp storage of projections
-            for n in range(4):
-                if not os.path.exists(temp_dir):
-                    os.mkdir(temp_dir)
-                write(os.path.join(temp_dir, '.temp_' + str(n) + '.em'), stacks[n])
+            # share the stacks with the child processes, pytom volumes are passed as fortran ordered views
+            shared = [to_shared_memory(vol2npy(x) if x.__class__ == vol else x) for x in stacks]
+            shared_stacks = [descriptor for _, descriptor in shared]
             del stacks
 
             # set gpu or cpu extraction
@@ -1111,23 +1154,23 @@ class ProjectionList(PyTomClass):
                 if isinstance(gpuIDs, int):
                     gpuIDs = [gpuIDs, ]
 
-            # create each process
+            # processes take the next particle when they are done, a None ends a process
+            queue = Queue()
+            for particleIndex, p in enumerate(particles):
+                queue.put((particleIndex, p))
             for i in range(num_procs):
-                # select the particles for the process
-                ps = particles[i::num_procs]
+                queue.put(None)
 
-                # if empty skip
-                if not len(ps) > 0:
-                    continue
-
-                # start all processes
-                proc = Process(target=extract, args=(ps, i, verbose, binning, post_scale, cube_size, polishResultFile,
-                                                     gpuIDs[i], temp_dir))
+            # create each process
+            for i in range(min(num_procs, len(particles))):
+                proc = Process(target=extract, args=(queue, i, verbose, binning, post_scale, cube_size,
+                                                     polishResultFile, gpuIDs[i], shared_stacks, stack_dir))
                 procs.append(proc)
                 proc.start()
 
-                # print('Subtomogram reconstruction for particle {} has started (batch mode).'.format(particleIndex))
         else:
+            from pytom.lib.pytom_numpy import vol2npy
+
             if show_progress_bar:
                 progressBar = FixedProgBar(0, len(particles), 'Particle volumes generated ')
                 progressBar.update(0)
@@ -1137,11 +1180,13 @@ class ProjectionList(PyTomClass):
             vol_bp = vol(cube_size, cube_size, cube_size)
             [vol_img, vol_phi, vol_the, vol_offsetProjections] = stacks
 
+            reconstructionPosition = vol(3, vol_img.size_z(), 1)
+            reconstructionPosition_np = vol2npy(reconstructionPosition)
+
+            stack = SubtomogramStackWriter(stack_dir) if packed else None
+
             for particleIndex in range(len(particles)):
-                t = time.time()
                 p = particles[particleIndex]
-                # self.extract_single_particle(p, particleIndex, verbose, binning, post_scale, cube_size)
-                # print('Subtomogram reconstruction for particle {} has started.'.format(particleIndex))
                 if show_progress_bar:
                     progressBar.update(particleIndex)
 
@@ -1150,14 +1195,9 @@ class ProjectionList(PyTomClass):
 
                 vol_bp.setAll(0.0)
 
-                reconstructionPosition = vol(3, vol_img.size_z(), 1)
-                reconstructionPosition.setAll(0.0)
-
                 # adjust coordinates of subvolumes to binned reconstruction
-                for i in range(vol_img.size_z()):
-                    reconstructionPosition(float(p.getPickPosition().getX() / binning), 0, i, 0)
-                    reconstructionPosition(float(p.getPickPosition().getY() / binning), 1, i, 0)
-                    reconstructionPosition(float(p.getPickPosition().getZ() / binning), 2, i, 0)
+                reconstructionPosition_np[:, :, 0] = self._reconstruction_positions(
+                    p, particleIndex, binning, vol_img.size_z()).T
 
                 if verbose:
                     print((p.getPickPosition().getX() / binning, p.getPickPosition().getY() / binning,
@@ -1168,9 +1208,17 @@ class ProjectionList(PyTomClass):
                 if post_scale > 1:
                     volumeRescaled = vol(cube_size / post_scale, cube_size / post_scale, cube_size / post_scale)
                     rescaleSpline(vol_bp, volumeRescaled)
-                    volumeRescaled.write(p.getFilename())
+                    result = volumeRescaled
+                else:
+                    result = vol_bp
+
+                if stack is None:
+                    result.write(p.getFilename())
                 else:
-                    vol_bp.write(p.getFilename())
+                    stack.write(p.getFilename(), result)
+
+            if stack is not None:
+                stack.close()
 
             print(f'recon time: {time.time()-t:.3f} sec')
 
@@ -1179,18 +1227,52 @@ class ProjectionList(PyTomClass):
             procs = [proc for proc in procs if proc.is_alive()]
 
         if num_procs > 1 or gpuIDs is not None:
-            for n in range(4):
-                os.system('rm -f {}'.format(os.path.join(temp_dir, '.temp_' + str(n) + '.em')))
+            for shm, _ in shared:
+                shm.close()
+                shm.unlink()
 
         print('\n Subtomogram reconstructions have finished.\n\n')
 
-    def extract_particles_on_gpu(self, particles, pid, verbose, binning, post_scale, cube_size, filename_ppr,
-                                 gpuID, temp_dir):
-        import os
-        from pytom.agnostic.io import read, write
+    def _reconstruction_positions(self, particle, particle_index, binning, num_projections, particle_polish=None):
+        """
+        Reconstruction position of a particle for each projection, optionally corrected by particle polishing.
+
+        @param particle: the particle
+        @type particle: L{pytom.basic.structures.Particle}
+        @param particle_index: index of the particle in the particle list, selects the rows of the polish results
+        @type particle_index: L{int}
+        @param binning: binning of the projections
+        @type binning: L{int}
+        @param num_projections: number of projections in the stack
+        @type num_projections: L{int}
+        @param particle_polish: loaded particle polish results (LOCAL_ALIGNMENT_RESULTS)
+        @type particle_polish: L{numpy.ndarray}
+        @return: positions with shape (num_projections, 3)
+        @rtype: L{numpy.ndarray}
+        """
+        import numpy as np
+
+        pick = np.array([particle.getPickPosition().getX(), particle.getPickPosition().getY(),
+                         particle.getPickPosition().getZ()], dtype=np.float64) / binning
+
+        if particle_polish is None:
+            return np.repeat(pick[np.newaxis], num_projections, axis=0).astype(np.float32)
+
+        # shifting the rotated position and rotating back comes down to adding the back rotated shift
+        start_index = particle_index * len(self)
+        offset_x = particle_polish['AlignmentTransX'][start_index: start_index + len(self)].astype(np.float64)
+        offset_y = particle_polish['AlignmentTransY'][start_index: start_index + len(self)].astype(np.float64)
+        angles = -np.array([projection.getTiltAngle() for projection in self._list]) * np.pi / 180
+        positions = pick + np.stack([np.cos(angles) * offset_x, offset_y, np.sin(angles) * offset_x], axis=1)
+        return (positions[:num_projections] / binning).astype(np.float32)
+
+    def extract_particles_on_gpu(self, queue, pid, verbose, binning, post_scale, cube_size, filename_ppr,
+                                 gpuID, shared_stacks, stack_dir=None):
+        from pytom.agnostic.io import write
         from pytom.gpu.initialize import xp, device
         from pytom.agnostic.transform import resize
         from pytom.agnostic.reconstruction_functions import backProjectGPU
+        from pytom.agnostic.subtomogram_stack import SubtomogramStackWriter
         import time
 
         xp.cuda.Device(gpuID).use()
@@ -1199,32 +1281,28 @@ class ProjectionList(PyTomClass):
         t = time.time()
 
         try:
-            # read the temp stacks
-            stacks = []
-            for n in range(4):
-                stacks.append(read(os.path.join(temp_dir, '.temp_' + str(n) + '.em'), keepnumpy=True))
-
-            # put in gpu mem
-            [projections, vol_phi, vol_the, vol_offsetProjections] = [xp.asarray(x) for x in stacks]
+            # attach to the shared stacks and put them in gpu mem
+            shared = [from_shared_memory(descriptor) for descriptor in shared_stacks]
+            [projections, vol_phi, vol_the, vol_offsetProjections] = [xp.asarray(x) for _, x in shared]
             num_projections = projections.shape[2]
 
             vol_bp = xp.zeros((cube_size, cube_size, cube_size), dtype=xp.float32)
-            reconstructionPosition = xp.zeros((num_projections, 3), dtype=xp.float32)
 
             interpolation = 'filt_bspline'
 
             proj_angles = vol_the.squeeze()
 
-            for p in particles:
+            # each process appends to its own chunk of the stack
+            stack = SubtomogramStackWriter(stack_dir, pid) if stack_dir else None
 
-                # set back project volume and reconstruction position back to zero
-                reconstructionPosition.fill(.0)
+            for particleIndex, p in iter(queue.get, None):
+
+                # set back project volume back to zero
                 vol_bp.fill(.0)
 
                 # adjust coordinates of subvolumes to binned reconstruction
-                reconstructionPosition[:, 0] = float(p.getPickPosition().getX() / binning)
-                reconstructionPosition[:, 1] = float(p.getPickPosition().getY() / binning)
-                reconstructionPosition[:, 2] = float(p.getPickPosition().getZ() / binning)
+                reconstructionPosition = xp.asarray(self._reconstruction_positions(p, particleIndex, binning,
+                                                                                   num_projections))
 
                 # run the back projection for the particle
                 backProjectGPU(projections, vol_bp, vol_phi.squeeze(), proj_angles,
@@ -1232,11 +1310,17 @@ class ProjectionList(PyTomClass):
 
                 # do post scaling
                 if post_scale > 1:
-                    # scale and write
-                    scaled = resize(vol_bp, 1. / post_scale, interpolation='Spline')
-                    write(p.getFileName(), scaled)
+                    result = resize(vol_bp, 1. / post_scale, interpolation='Spline')
+                else:
+                    result = vol_bp
+
+                if stack is None:
+                    write(p.getFilename(), result)
                 else:
-                    write(p.getFilename(), vol_bp)
+                    stack.write(p.getFilename(), result)
+
+            if stack is not None:
+                stack.close()
 
         except Exception as e:
             print('Caught exception in worker thread (x = %d):' % pid)
@@ -1245,84 +1329,62 @@ class ProjectionList(PyTomClass):
 
         print(f'recon time in process {pid}: {time.time()-t:.3f} sec')
 
-    def extract_single_particle(self, particles, pid, verbose, binning, post_scale, cube_size, filename_ppr,
-                                gpuID, temp_dir):
+    def extract_single_particle(self, queue, pid, verbose, binning, post_scale, cube_size, filename_ppr,
+                                gpuID, shared_stacks, stack_dir=None):
         from pytom.lib.pytom_volume import vol, backProject, rescaleSpline
-        from pytom.basic.files import read
-        import numpy as np
+        from pytom.lib.pytom_numpy import vol2npy, npy2vol
+        from pytom.agnostic.subtomogram_stack import SubtomogramStackWriter
         import time
-        import os
 
         print(f'start recon in process: {pid}')
         t = time.time()
 
         try:
-            # read the temp stacks
-            stacks = []
-            for n in range(4):
-                stacks.append(read(os.path.join(temp_dir, '.temp_' + str(n) + '.em')))
-
-            # put in variables
-            [vol_img, vol_phi, vol_the, vol_offsetProjections] = stacks
+            # attach to the shared stacks, the volumes use the shared memory directly
+            shared = [from_shared_memory(descriptor) for descriptor in shared_stacks]
+            [vol_img, vol_phi, vol_the, vol_offsetProjections] = [npy2vol(x, 3) for _, x in shared]
             num_projections = vol_img.size_z()
 
             vol_bp = vol(cube_size, cube_size, cube_size)
             vol_bp.setAll(0.0)
 
             reconstructionPosition = vol(3, num_projections, 1)
-            reconstructionPosition.setAll(0.0)
-            start_index = pid * len(self)
+            reconstructionPosition_np = vol2npy(reconstructionPosition)
+
+            # possible particle polish results loading
+            if filename_ppr:
+                from pytom.gui.guiFunctions import LOCAL_ALIGNMENT_RESULTS, loadstar
+                particle_polish = loadstar(filename_ppr, dtype=LOCAL_ALIGNMENT_RESULTS)
+            else:
+                particle_polish = None
+
+            # each process appends to its own chunk of the stack
+            stack = SubtomogramStackWriter(stack_dir, pid) if stack_dir else None
 
-            for p in particles:
+            for particleIndex, p in iter(queue.get, None):
                 # reset
-                reconstructionPosition.setAll(0.0)
                 vol_bp.setAll(0.0)
 
                 # adjust coordinates of subvolumes to binned reconstruction
-                if not filename_ppr:
-                    for i in range(num_projections):
-                        reconstructionPosition(float(p.getPickPosition().getX() / binning), 0, i, 0)
-                        reconstructionPosition(float(p.getPickPosition().getY() / binning), 1, i, 0)
-                        reconstructionPosition(float(p.getPickPosition().getZ() / binning), 2, i, 0)
-
-                else:
-                    # possible particle polish results loading
-                    x, y, z = float(p.getPickPosition().getX() / binning), float(
-                        p.getPickPosition().getY() / binning), float(p.getPickPosition().getZ() / binning)
-
-                    for i in range(len(self)):
-                        from pytom.gui.guiFunctions import LOCAL_ALIGNMENT_RESULTS, loadstar
-                        import pytom.basic.combine_transformations as ct
-
-                        particle_polish_file = loadstar(filename_ppr, dtype=LOCAL_ALIGNMENT_RESULTS)
-
-                        offsetX = float(particle_polish_file['AlignmentTransX'][start_index + i])
-                        offsetY = float(particle_polish_file['AlignmentTransY'][start_index + i])
-
-                        pick_position = np.matrix([x, y, z]).T
-
-                        rotation = ct.matrix_rotate_3d_y(self._list[i].getTiltAngle())
-
-                        shift = np.matrix([offsetX, offsetY, 0]).T
-
-                        new_position = rotation * pick_position
-
-                        new_position_shifted = new_position + shift
-                        reposition = np.linalg.inv(rotation) * new_position_shifted
-                        reposition = np.array(reposition.T)[0]
-
-                        reconstructionPosition(float(reposition[0] / binning), 0, i, 0)
-                        reconstructionPosition(float(reposition[1] / binning), 1, i, 0)
-                        reconstructionPosition(float(reposition[2] / binning), 2, i, 0)
+                reconstructionPosition_np[:, :, 0] = self._reconstruction_positions(
+                    p, particleIndex, binning, num_projections, particle_polish).T
 
                 backProject(vol_img, vol_bp, vol_phi, vol_the, reconstructionPosition, vol_offsetProjections)
 
                 if post_scale > 1:
                     volumeRescaled = vol(cube_size / post_scale, cube_size / post_scale, cube_size / post_scale)
                     rescaleSpline(vol_bp, volumeRescaled)
-                    volumeRescaled.write(p.getFilename())
+                    result = volumeRescaled
+                else:
+                    result = vol_bp
+
+                if stack is None:
+                    result.write(p.getFilename())
                 else:
-                    vol_bp.write(p.getFilename())
+                    stack.write(p.getFilename(), result)
+
+            if stack is not None:
+                stack.close()
 
         except Exception as e:
             print('Caught exception in worker thread (x = %d):' % pid)
@@ -373,6 +373,15 @@ def markerResidual(cent, Markers_, cTilt, sTilt, transX, transY, rotInPlane, til
 
     ntilt = len(transX)
     nmark = len(Markers_)
+
+    # the optimizers only need the deviations or the residual, compute those for all markers at once
+    if not (dMagnFocus or returnErrors or errorRef or verbose):
+        Dev = markerResidualVectorized(cent, *markerArrays(Markers_), cTilt=cTilt, sTilt=sTilt, transX=transX,
+                                       transY=transY, rotInPlane=rotInPlane, isoMag=isoMag, dBeam=dBeam)
+        if equationSet:
+            return Dev
+        return (Dev ** 2).sum() / (len(Dev) // 2 - nmark)
+
     if equationSet:
         Dev = []
 
@@ -481,6 +490,139 @@ def markerResidual(cent, Markers_, cTilt, sTilt, transX, transY, rotInPlane, til
         return residual
 
 
+def markerArrays(Markers_):
+    """
+    collect marker coordinates in arrays for L{markerResidualVectorized}
+
+    @param Markers_: Markers
+    @type Markers_: Markers
+    @return: 3D coordinates (nmark x 3), x- and y-coordinates in projections (nmark x ntilt each)
+    @rtype: tuple of numpy arrays
+    """
+    r = numpy.array([Marker.get_r() for Marker in Markers_], dtype=float).reshape(-1, 3)
+    xProj = numpy.array([Marker.xProj for Marker in Markers_], dtype=float)
+    yProj = numpy.array([Marker.yProj for Marker in Markers_], dtype=float)
+    return r, xProj, yProj
+
+
+def markerResidualVectorized(cent, r, xProj, yProj, cTilt, sTilt, transX, transY, rotInPlane, isoMag=None,
+                             dBeam=None, jacobian=False):
+    """
+    deviations of a marker model from the marker coords, same model as L{markerResidual} but computed for all \
+    markers and tilts at once
+
+    @param cent: x,y coordinates of tiltaxis rotation stage.
+    @type cent: numpy.array
+    @param r: 3D coordinates of markers
+    @type r: array (nmark x 3)
+    @param xProj: x-coordinates of markers in projections, not-clicked markers are -1
+    @type xProj: array (nmark x ntilt)
+    @param yProj: y-coordinates of markers in projections, not-clicked markers are -1
+    @type yProj: array (nmark x ntilt)
+    @param transX: translations in X
+    @type transX: vector (ntilt)
+    @param transY: translations in Y
+    @type transY: vector (ntilt)
+    @param rotInPlane: rotation of tilt axis in each projection (against X-axis in deg)
+    @type rotInPlane: array
+    @param isoMag: magnification (vector; dim: ntilt)
+    @type isoMag: vector (ntilt)
+    @param dBeam: beam inclination
+    @type dBeam: float
+    @param jacobian: also compute the derivatives of the deviations
+    @type jacobian: bool
+    @return: deviations (deltaX, deltaY per clicked marker and tilt, in the order of markerResidual with \
+    equationSet=True) and, for jacobian=True, the derivatives with respect to r (marker-major, 3 columns per \
+    marker), transX, transY, isoMag, rotInPlane and dBeam, in this order of columns
+    @rtype: numpy array or tuple of numpy arrays
+    """
+    nmark, ntilt = xProj.shape
+    deg = pi / 180.
+    cTilt, sTilt = numpy.asarray(cTilt, dtype=float), numpy.asarray(sTilt, dtype=float)
+    rotInPlane = numpy.asarray(rotInPlane, dtype=float)
+    mag = numpy.ones(ntilt) if isoMag is None else numpy.asarray(isoMag, dtype=float)
+
+    # marker positions in 3d model rotated on approximate tilt axis
+    meanpsi = rotInPlane.mean()
+    cmeanpsi, smeanpsi = cos(- meanpsi * deg - pi / 2.), sin(- meanpsi * deg - pi / 2.)
+    xmod = (cmeanpsi * r[:, 0] - smeanpsi * r[:, 1])[:, numpy.newaxis]
+    ymod = (smeanpsi * r[:, 0] + cmeanpsi * r[:, 1])[:, numpy.newaxis]
+    zmod = r[:, 2][:, numpy.newaxis]
+
+    # rotate clicked markers back and inverse shift
+    cpsi, spsi = numpy.cos(- rotInPlane * deg - pi / 2.), numpy.sin(- rotInPlane * deg - pi / 2.)
+    xmark = xProj - cent[0] - transX
+    ymark = yProj - cent[1] - transY
+    x_rot = cpsi * xmark - spsi * ymark
+    y_rot = spsi * xmark + cpsi * ymark
+    x_meas, y_meas = mag * x_rot, mag * y_rot
+
+    # model projection, derivatives of the projection with respect to xmod, ymod and zmod
+    if dBeam:
+        cdbeam, sdbeam = cos(dBeam), sin(dBeam)
+        x_proj = cTilt * xmod - sTilt * sdbeam * ymod - sTilt * cdbeam * zmod
+        y_proj = sTilt * sdbeam * xmod + (cdbeam ** 2 + sdbeam ** 2 * cTilt * ymod +
+                                          cdbeam * sdbeam * (1 - cTilt) * zmod)
+    else:
+        cdbeam, sdbeam = 1., 0.
+        x_proj = cTilt * xmod - sTilt * zmod
+        y_proj = ymod + 0. * cTilt
+    dxp = (cTilt, - sTilt * sdbeam, - sTilt * cdbeam)
+    dyp = (sTilt * sdbeam, (sdbeam ** 2 * cTilt) if dBeam else numpy.ones(ntilt), cdbeam * sdbeam * (1 - cTilt))
+
+    observed = (xProj > -1.) & (yProj > -1.)
+    imark, itilt = numpy.nonzero(observed)
+    deviations = numpy.empty(2 * len(imark))
+    deviations[0::2] = (x_meas - x_proj)[observed]
+    deviations[1::2] = (y_meas - y_proj)[observed]
+    if not jacobian:
+        return deviations
+
+    ncols = 3 * nmark + 4 * ntilt + 1
+    rows = numpy.arange(len(imark))
+    J = numpy.zeros((2 * len(imark), ncols))
+    Jx, Jy = J[0::2], J[1::2]
+
+    # marker coordinates, deltas depend on r through the model projection only
+    dmod = ((cmeanpsi, smeanpsi), (- smeanpsi, cmeanpsi), (0., 0.))
+    for d in range(3):
+        dxmod, dymod = dmod[d]
+        dzmod = 1. if d == 2 else 0.
+        Jx[rows, 3 * imark + d] = -(dxp[0] * dxmod + dxp[1] * dymod + dxp[2] * dzmod)[itilt]
+        Jy[rows, 3 * imark + d] = -(dyp[0] * dxmod + dyp[1] * dymod + dyp[2] * dzmod)[itilt]
+
+    # translations
+    m, c, s = mag[itilt], cpsi[itilt], spsi[itilt]
+    col = 3 * nmark
+    Jx[rows, col + itilt] = - m * c
+    Jy[rows, col + itilt] = - m * s
+    col += ntilt
+    Jx[rows, col + itilt] = m * s
+    Jy[rows, col + itilt] = - m * c
+
+    # magnifications
+    col += ntilt
+    if isoMag is not None:
+        Jx[rows, col + itilt] = x_rot[observed]
+        Jy[rows, col + itilt] = y_rot[observed]
+
+    # rotations, the own rotation of the projection and all rotations through the mean tilt axis
+    col += ntilt
+    Jx[rows, col + itilt] = y_meas[observed] * deg
+    Jy[rows, col + itilt] = - x_meas[observed] * deg
+    dxmod_dpsi, dymod_dpsi = ymod * deg / ntilt, - xmod * deg / ntilt
+    Jx[:, col:col + ntilt] -= (dxp[0] * dxmod_dpsi + dxp[1] * dymod_dpsi)[observed][:, numpy.newaxis]
+    Jy[:, col:col + ntilt] -= (dyp[0] * dxmod_dpsi + dyp[1] * dymod_dpsi)[observed][:, numpy.newaxis]
+
+    # beam inclination
+    col += ntilt
+    Jx[:, col] = -(- sTilt * cdbeam * ymod + sTilt * sdbeam * zmod)[observed]
+    Jy[:, col] = -(sTilt * cdbeam * xmod - 2 * cdbeam * sdbeam + 2 * sdbeam * cdbeam * cTilt * ymod +
+                   (cdbeam ** 2 - sdbeam ** 2) * (1 - cTilt) * zmod)[observed]
+
+    return deviations, J
+
+
 def alignmentFixMagRot( Markers_, cTilt, sTilt, ireftilt, irefmark=1, r=None, imdim=2048, handflip=0,
                         mute=True, writeResults='', optimizeShift=True, logfile_residual='', imdimX=0, imdimY=0):
     """
@@ -13,6 +13,7 @@ import logging
 import os
 import datetime
 import sys
+import threading
 from tqdm import tqdm
 
 # math
@@ -187,6 +188,7 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
     """
     # IMPORTANT: We assume the particle models are in the desired voxel spacing for the pixel size of the simulation!
     from pytom.simulation.potential import create_gold_marker
+    from pytom.simulation.placement import SphereIndex, particle_spheres, place
     from pytom.voltools import transform
     from pytom.agnostic.io import read_mrc, write
 
@@ -240,6 +242,9 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
         loc_x_start = loc_y_start = difference // 2
         loc_x_end = loc_y_end = int(size - xp.ceil(difference / 2))
 
+    # bounding and core spheres of the placed objects, rejects most collisions before the voxel exact test
+    placement_index = SphereIndex(max([max(v.shape) for v in volumes_real] + [1]))
+
     # Add large cell structures, such as membranes first!
     if number_of_membranes:
         number_of_classes += 1
@@ -364,6 +369,8 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
             particle_nr += 1
             particles_by_class[cls_id] += 1
 
+            placement_index.add((loc_x, loc_y, loc_z), *particle_spheres(accurate_particle_occupancy))
+
             # update text
             ground_truth_txt_file += f'vesicle {int(loc_x - loc_x_start)} {int(loc_y - loc_y_start)} {int(loc_z)} ' \
                                      f'NaN NaN NaN\n'
@@ -416,33 +423,22 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
 
             # find random location for the particle
             xx, yy, zz = gold_real.shape
-            tries_left = default_tries_left
-            while tries_left > 0:
-                loc_x = xp.random.randint(loc_x_start + xx // 2 + 1, loc_x_end - xx // 2 - 1)
-                loc_y = xp.random.randint(loc_y_start + yy // 2 + 1, loc_y_end - yy // 2 - 1)
-                loc_z = xp.random.randint(zz // 2 + 1, Z - zz // 2 - 1)
 
-                tries_left -= 1
+            def draw_location():
+                return (xp.random.randint(loc_x_start + xx // 2 + 1, loc_x_end - xx // 2 - 1),
+                        xp.random.randint(loc_y_start + yy // 2 + 1, loc_y_end - yy // 2 - 1),
+                        xp.random.randint(zz // 2 + 1, Z - zz // 2 - 1))
 
-                # calculate coordinates of bbox for the newly rotated particle
-                bbox_x = [loc_x - xx // 2, loc_x + xx // 2 + xx % 2]
-                bbox_y = [loc_y - yy // 2, loc_y + yy // 2 + yy % 2]
-                bbox_z = [loc_z - zz // 2, loc_z + zz // 2 + zz % 2]
-
-                # create masked occupancy mask
-                masked_occupancy_mask = occupancy_accurate_mask[bbox_x[0]:bbox_x[1], bbox_y[0]:bbox_y[1],
-                                        bbox_z[0]:bbox_z[1]]
-                masked_occupancy_mask = masked_occupancy_mask * accurate_particle_occupancy
-
-                # if the location fits (masked occupancy pixel-wise mask is empty), break the loop and use this location
-                if masked_occupancy_mask.sum() == 0:
-                    break
+            spheres = particle_spheres(accurate_particle_occupancy)
+            placement = place(occupancy_accurate_mask, placement_index, accurate_particle_occupancy, spheres,
+                              draw_location, default_tries_left)
 
             # however if still can't fit, ignore this particle (also adds variance in how many particles are
             # actually put)
-            if tries_left < 1:
+            if placement is None:
                 skipped_particles += 1
                 continue
+            (loc_x, loc_y, loc_z), (bbox_x, bbox_y, bbox_z) = placement
 
             # populate occupancy volumes
             # occupancy_bbox_mask[bbox_x[0]:bbox_x[1], bbox_y[0]:bbox_y[1], bbox_z[0]:bbox_z[1]] = particle_nr
@@ -462,6 +458,8 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
             particle_nr += 1
             particles_by_class[cls_id] += 1
 
+            placement_index.add((loc_x, loc_y, loc_z), *spheres)
+
             # update text
             ground_truth_txt_file += f'fiducial {int(loc_x - loc_x_start)} {int(loc_y - loc_y_start)} {int(loc_z)} ' \
                                      f'NaN NaN NaN\n'
@@ -523,34 +521,21 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
 
         # find random location for the particle
         xx, yy, zz = rotated_particle_real.shape
-        tries_left = default_tries_left
-        while tries_left > 0:
-            loc_x = xp.random.randint(loc_x_start + xx // 2 + 1, loc_x_end - xx // 2 - 1)
-            loc_y = xp.random.randint(loc_y_start + yy // 2 + 1, loc_y_end - yy // 2 - 1)
-            loc_z = xp.random.randint(zz // 2 + 1, Z - zz // 2 - 1)
-
-            tries_left -= 1
-
-            # calculate coordinates of bbox for the newly rotated particle
-            # bbox_x = [loc_x - dims[cls_id][0] // 2, loc_x + dims[cls_id][0] // 2 + dims[cls_id][0] % 2]
-            # bbox_y = [loc_y - dims[cls_id][1] // 2, loc_y + dims[cls_id][1] // 2 + dims[cls_id][1] % 2]
-            # bbox_z = [loc_z - dims[cls_id][2] // 2, loc_z + dims[cls_id][2] // 2 + dims[cls_id][2] % 2]
-            bbox_x = [loc_x - xx // 2, loc_x + xx // 2 + xx % 2]
-            bbox_y = [loc_y - yy // 2, loc_y + yy // 2 + yy % 2]
-            bbox_z = [loc_z - zz // 2, loc_z + zz // 2 + zz % 2]
-
-            # create masked occupancy mask
-            masked_occupancy_mask = occupancy_accurate_mask[bbox_x[0]:bbox_x[1], bbox_y[0]:bbox_y[1], bbox_z[0]:bbox_z[1]]
-            masked_occupancy_mask = masked_occupancy_mask * accurate_particle_occupancy
-
-            # if the location fits (masked occupancy pixel-wise mask is empty), break the loop and use this location
-            if masked_occupancy_mask.sum() == 0:
-                break
+
+        def draw_location():
+            return (xp.random.randint(loc_x_start + xx // 2 + 1, loc_x_end - xx // 2 - 1),
+                    xp.random.randint(loc_y_start + yy // 2 + 1, loc_y_end - yy // 2 - 1),
+                    xp.random.randint(zz // 2 + 1, Z - zz // 2 - 1))
+
+        spheres = particle_spheres(accurate_particle_occupancy)
+        placement = place(occupancy_accurate_mask, placement_index, accurate_particle_occupancy, spheres,
+                          draw_location, default_tries_left)
 
         # however if still can't fit, ignore this particle (also adds variance in how many particles are actually put)
-        if tries_left < 1:
+        if placement is None:
             skipped_particles += 1
             continue
+        (loc_x, loc_y, loc_z), (bbox_x, bbox_y, bbox_z) = placement
 
         # populate occupancy volumes
         # occupancy_bbox_mask[bbox_x[0]:bbox_x[1], bbox_y[0]:bbox_y[1], bbox_z[0]:bbox_z[1]] = particle_nr
@@ -571,6 +556,8 @@ def generate_model(particle_folder, save_path, listpdbs, listmembranes, pixel_si
         particle_nr += 1
         particles_by_class[cls_id] += 1
 
+        placement_index.add((loc_x, loc_y, loc_z), *spheres)
+
         # update text
         ground_truth_txt_file += f'{listpdbs[cls_id]} {int(loc_x - loc_x_start)} {int(loc_y - loc_y_start)} {int(loc_z)} ' \
                                  f'{p_angles[0]:.4f} {p_angles[1]:.4f} {p_angles[2]:.4f}\n'
@@ -770,6 +757,111 @@ def microscope_single_projection(noisefree_projection, dqe, mtf, dose, pixel_siz
     return projection_poisson
 
 
+class MultislicePlan(object):
+    """
+    Everything the multislice propagation needs that only depends on image size, pixel size, slice thickness and
+    voltage: the Fresnel propagators and the buffer of the electron wave. The wave is kept in ifftshifted layout
+    during the propagation, which removes the fftshift/ifftshift pairs around every slice. A plan is not thread safe,
+    use L{get_multislice_plan} to get the plan of the current thread.
+    """
+    def __init__(self, image_size, pixel_size, msdz, voltage):
+        """
+        @param image_size: size of the projection image
+        @type  image_size: L{int}
+        @param pixel_size: pixel size of image in m
+        @type  pixel_size: L{float}
+        @param msdz: slice (step) size for multislice method in m
+        @type  msdz: L{float}
+        @param voltage: voltage of electron beam in eV
+        @type  voltage: L{float}
+        """
+        self.image_size = image_size
+        self.pixel_size = pixel_size
+        self.msdz = msdz
+        self.voltage = voltage
+        self.wave = np.empty((image_size, image_size), dtype=np.complex64)
+        self._propagators = {}
+
+        try:
+            import scipy.fft as fft
+            self._fftn = lambda a: fft.fftn(a, overwrite_x=True)
+            self._ifftn = lambda a: fft.ifftn(a, overwrite_x=True)
+        except ImportError:
+            self._fftn, self._ifftn = np.fft.fftn, np.fft.ifftn
+
+    def propagator(self, dz):
+        """
+        Fresnel propagator for a slice thickness, ifftshifted and cached.
+
+        @param dz: slice thickness in m
+        @type  dz: L{float}
+
+        @return: propagator, 2d array of complex values
+        @rtype:  L{np.ndarray}
+        """
+        if dz not in self._propagators:
+            from pytom.simulation.microscope import fresnel_propagator
+            propagator = fresnel_propagator(self.image_size, self.pixel_size, self.voltage, dz)
+            # cast to numpy if required
+            if hasattr(propagator, 'get'):
+                propagator = propagator.get()
+            self._propagators[dz] = np.fft.ifftshift(propagator).astype(np.complex64)
+        return self._propagators[dz]
+
+    def exit_wave(self, projected_potential, last_slice_dz=None):
+        """
+        Propagate a plane wave through the slices of the sample.
+
+        @param projected_potential: potential averaged per slice, 3d array of floats or complex values with the slices
+        along the last dimension
+        @type  projected_potential: L{np.ndarray}
+        @param last_slice_dz: thickness of the last slice in m if it differs from msdz
+        @type  last_slice_dz: L{float}
+
+        @return: exit wave in ifftshifted layout, a view on the buffer of the plan that is overwritten by the next call
+        @rtype:  L{np.ndarray}
+        """
+        from pytom.simulation.microscope import transmission_function
+
+        wave = self.wave
+        wave[...] = 1  # initial probability
+        n_slices = projected_potential.shape[2]
+        for ii in range(n_slices):
+            dz = last_slice_dz if (ii == n_slices - 1 and last_slice_dz) else self.msdz
+            wave *= transmission_function(np.fft.ifftshift(projected_potential[:, :, ii]), self.voltage, dz)
+            field = self._fftn(wave)
+            field *= self.propagator(dz)
+            wave[...] = self._ifftn(field)
+        return wave
+
+
+_multislice_plans = threading.local()
+
+
+def get_multislice_plan(image_size, pixel_size, msdz, voltage):
+    """
+    Get the multislice plan of the current thread, plans are reused by all tilts/frames that a thread projects.
+
+    @param image_size: size of the projection image
+    @type  image_size: L{int}
+    @param pixel_size: pixel size of image in m
+    @type  pixel_size: L{float}
+    @param msdz: slice (step) size for multislice method in m
+    @type  msdz: L{float}
+    @param voltage: voltage of electron beam in eV
+    @type  voltage: L{float}
+
+    @return: the plan
+    @rtype:  L{MultislicePlan}
+    """
+    if not hasattr(_multislice_plans, 'plans'):
+        _multislice_plans.plans = {}
+    key = (int(image_size), float(pixel_size), float(msdz), float(voltage))
+    if key not in _multislice_plans.plans:
+        _multislice_plans.plans[key] = MultislicePlan(*key)
+    return _multislice_plans.plans[key]
+
+
 def parallel_project(grandcell, frame, image_size, pixel_size, msdz, n_slices, ctf, dose, dqe, mtf, voltage,
                      oversampling=1, translation=(.0,.0,.0), rotation=(.0,.0,.0), scale=(1., 1., 1.),
                      solvent_potential=physics.V_WATER, solvent_absorption=.0, ice_thickness_voxels=None, beam_damage_snr=0):
@@ -822,7 +914,6 @@ def parallel_project(grandcell, frame, image_size, pixel_size, msdz, n_slices, c
     @author: Marten Chaillet
     """
     from pytom.voltools import transform
-    from pytom.simulation.microscope import transmission_function, fresnel_propagator
     
     # cast possible cupy to numpy for now
     # TODO: see if this can be done on the gpu
@@ -905,37 +996,15 @@ def parallel_project(grandcell, frame, image_size, pixel_size, msdz, n_slices, c
     # free the memory to accomodate space
     del sample
 
-    # calculate the transmission function for each slice
-    psi_t = transmission_function(projected_potent_ms, voltage, msdz)
-
-    # calculate the fresnel propagator (identical for same dz)
-    propagator = fresnel_propagator(image_size, pixel_size, voltage, msdz)
-    # cast to numpy if required
-    if hasattr(propagator, 'get'):
-        propagator = propagator.get()
-
-    # Wave propagation with MULTISLICE method, psi_multislice is complex
-    psi_multislice = xp.zeros((image_size,image_size), dtype=xp.complex64) + 1 # +1 for initial probability
-
-    # Loop over all the slices, except the last one if it has a different slice size
-    for ii in range(n_slices-min(1,num_px_last_slice)):
-        wave_field = xp.fft.fftn( xp.fft.ifftshift(psi_multislice) * xp.fft.ifftshift(psi_t[:, :, ii]) )
-        psi_multislice = xp.fft.fftshift( xp.fft.ifftn((wave_field * xp.fft.ifftshift(propagator) )) )
-
+    # propagate the electron wave through the slices, the plan is shared by all tilts/frames of this worker thread
+    plan = get_multislice_plan(image_size, pixel_size, msdz, voltage)
     # Calculate propagation through last slice in case the last slice contains a different number of pixels
-    if num_px_last_slice:
-        msdz_end = num_px_last_slice * pixel_size
-        psi_t[:, :, -1] = transmission_function(projected_potent_ms[:, :, -1], voltage, msdz_end)
-        propagator_end = fresnel_propagator(image_size, pixel_size, voltage, msdz_end)
-        # cast to numpy if required
-        #TODO: remove once this becomes agnostic
-        if hasattr(propagator_end, 'get'):
-            propagator_end = propagator_end.get()
-        wave_field = xp.fft.fftn( xp.fft.ifftshift(psi_multislice) * xp.fft.ifftshift(psi_t[:, :, -1]) )
-        psi_multislice = xp.fft.fftshift( xp.fft.ifftn( wave_field * xp.fft.ifftshift(propagator_end) ) )
-
-    # Multiple by CTF for microscope effects on electron wave
-    wave_ctf = xp.fft.ifftshift(ctf) * xp.fft.fftn(xp.fft.ifftshift(psi_multislice) )
+    last_slice_dz = num_px_last_slice * pixel_size if num_px_last_slice else None
+    exit_wave = plan.exit_wave(projected_potent_ms, last_slice_dz=last_slice_dz)
+    del projected_potent_ms
+
+    # Multiple by CTF for microscope effects on electron wave, the exit wave is already ifftshifted
+    wave_ctf = xp.fft.ifftshift(ctf) * xp.fft.fftn(exit_wave)
     # Intensity in image plane is obtained by taking the absolute square of the wave function
     noisefree_projection = xp.abs(xp.fft.fftshift(xp.fft.ifftn(wave_ctf))) ** 2
 
@@ -966,6 +1035,58 @@ def parallel_project(grandcell, frame, image_size, pixel_size, msdz, n_slices, c
     return (noisefree_projection, projection)
 
 
+def project_with_ctf(grandcell, frame, image_size, pixel_size, msdz, n_slices, ctf_parameters, *args, **kwargs):
+    """
+    Create the CTF of a tilt/frame and project it with L{parallel_project}. Creating the CTF in the worker means only
+    the CTFs of the projections in progress are in memory.
+
+    @param ctf_parameters: keyword arguments for L{pytom.simulation.microscope.create_complex_ctf}
+    @type  ctf_parameters: L{dict}
+
+    @return: (noisefree projection, projection)
+    @rtype:  L{tuple} - (L{np.ndarray}, L{np.ndarray})
+    """
+    from pytom.simulation.microscope import create_complex_ctf
+    ctf = create_complex_ctf(**ctf_parameters)
+    return parallel_project(grandcell, frame, image_size, pixel_size, msdz, n_slices, ctf, *args, **kwargs)
+
+
+def parallel_generator(tasks, nodes, verbose=0):
+    """
+    Run joblib tasks on threads and yield the results in order of the tasks. Tasks are dispatched as workers become
+    available, so results do not pile up in memory when they are consumed right away. With joblib < 1.3 the tasks are
+    run in batches of nodes.
+
+    @param tasks: iterable of joblib delayed calls
+    @type  tasks: L{iterable}
+    @param nodes: number of threads
+    @type  nodes: L{int}
+    @param verbose: joblib verbosity
+    @type  verbose: L{int}
+
+    @return: generator of the task results
+    @rtype:  L{generator}
+    """
+    from joblib import Parallel
+    from itertools import islice
+
+    try:
+        parallel = Parallel(n_jobs=nodes, verbose=verbose, prefer="threads", return_as='generator')
+    except TypeError:
+        parallel = None
+
+    if parallel is not None:
+        yield from parallel(tasks)
+        return
+
+    tasks = iter(tasks)
+    while True:
+        batch = list(islice(tasks, nodes))
+        if not batch:
+            break
+        yield from Parallel(n_jobs=nodes, verbose=verbose, prefer="threads")(batch)
+
+
 def generate_tilt_series_cpu(save_path,
                              angles,
                              nodes=1,
@@ -994,12 +1115,15 @@ def generate_tilt_series_cpu(save_path,
                              solvent_potential=physics.V_WATER,
                              absorption_contrast=False,
                              beam_damage_snr=0,
-                             grandcell=None):
+                             grandcell=None,
+                             streaming=True):
     """
     Creating a tilt series for the initial grand model by rotating the sample along a set of tilt angles. For each angle
     the projection process of the microscope will be simulated. Calculation of each projection will be done on CPU
     nodes, as specified by nodes parameter. Computational cost can quickly increase for small pixel sizes with no
     oversampling factor. Sufficient RAM memory needs to be available to store each instance of the grandmodel for projection.
+    In streaming mode the projections are written to disk as they finish, so the memory for the images does not grow
+    with the number of tilts.
 
     @param save_path: simulation project folder
     @type  save_path: L{str}
@@ -1053,6 +1177,9 @@ def generate_tilt_series_cpu(save_path,
     @param grandcell: optional parameter for passing grandcell directly to function, 3d array of floats or complex
     values
     @type  grandcell: L{np.ndarray}
+    @param streaming: write each projection to the memory mapped output stacks as soon as it is finished, instead of
+    keeping the full series in memory until all projections are done
+    @type  streaming: L{bool}
 
     @return: - (projection are stored in save_path)
     @rtype:  None
@@ -1063,9 +1190,9 @@ def generate_tilt_series_cpu(save_path,
     from pytom.basic.datatypes import DATATYPE_METAFILE as dmf
     from pytom.basic.datatypes import fmtAlignmentResults, HEADER_ALIGNMENT_RESULTS, FMT_METAFILE, HEADER_METAFILE
     from pytom.gui.guiFunctions import savestar
-    from pytom.simulation.microscope import create_detector_response, create_complex_ctf
+    from pytom.simulation.microscope import create_detector_response
     from pytom.simulation.microscope import convert_defocus_astigmatism_to_defocusU_defocusV
-    from pytom.agnostic.io import read_mrc, write
+    from pytom.agnostic.io import read_mrc, write, MRCStackWriter
     from joblib import Parallel, delayed
     # NOTE; Parameter defocus specifies the defocus at the bottom of the model!
 
@@ -1205,6 +1332,7 @@ def generate_tilt_series_cpu(save_path,
         angles[i] += xp.random.normal(0, sigma_tilt_angle)
 
     # defocus_series = [xp.random.normal(defocus, 0.2E-6) for a in angles]
+    # the ctfs are created by the projection workers, only the parameters are drawn here
     ctf_series = []
     dz_series, ast_series, ast_angle_series = [], [], []
     for x in angles:
@@ -1213,12 +1341,11 @@ def generate_tilt_series_cpu(save_path,
         dz = xp.random.normal(defocus, 0.2e-6)
         ast = xp.random.normal(astigmatism, 0.1e-6)  # introduce astigmastism with 100 nm variation
         ast_angle = xp.random.normal(astigmatism_angle, 5)  # vary angle randomly around a 40 degree angle
-        ctf = create_complex_ctf((image_size, image_size), pixel_size, dz, voltage=voltage,
-                                     Cs=spherical_aberration, Cc=chromatic_aberration, energy_spread=energy_spread,
-                                     illumination_aperture=illumination_aperture, objective_diameter=objective_diameter,
-                                     focus_length=focus_length, astigmatism=ast,
-                                     astigmatism_angle=ast_angle, display=False)
-        ctf_series.append(ctf)
+        ctf_series.append(dict(image_shape=(image_size, image_size), pixel_size=pixel_size, defocus=dz,
+                               voltage=voltage, Cs=spherical_aberration, Cc=chromatic_aberration,
+                               energy_spread=energy_spread, illumination_aperture=illumination_aperture,
+                               objective_diameter=objective_diameter, focus_length=focus_length, astigmatism=ast,
+                               astigmatism_angle=ast_angle, display=False))
         dz_series.append(dz)
         ast_series.append(ast)
         ast_angle_series.append(ast_angle)
@@ -1232,29 +1359,46 @@ def generate_tilt_series_cpu(save_path,
     print(f'Projecting the model with {nodes} processes')
 
     verbosity = 11  # set to 55 for debugging, 11 to see progress, 0 to turn off output
-    results = Parallel(n_jobs=nodes, verbose=verbosity, prefer="threads") \
-        (delayed(parallel_project)(rotation_volume, i, image_size, pixel_size, msdz, n_slices, ctf,
-                                   dose_per_tilt, dqe, mtf, voltage, oversampling=oversampling, translation=translation,
-                                   rotation=(.0, angle, in_plane_rotation), scale=magnification,
-                                   solvent_potential=solvent_potential,
-                                   solvent_absorption=solvent_amplitude, ice_thickness_voxels=box_height,
-                                   beam_damage_snr=beam_damage_snr)
-         for i, (angle, in_plane_rotation,
-                 translation, magnification, ctf) in enumerate(zip(angles, in_plane_rotations,
-                                                                   translations, magnifications, ctf_series)))
+    tasks = (delayed(project_with_ctf)(rotation_volume, i, image_size, pixel_size, msdz, n_slices, ctf_parameters,
+                                       dose_per_tilt, dqe, mtf, voltage, oversampling=oversampling,
+                                       translation=translation, rotation=(.0, angle, in_plane_rotation),
+                                       scale=magnification, solvent_potential=solvent_potential,
+                                       solvent_absorption=solvent_amplitude, ice_thickness_voxels=box_height,
+                                       beam_damage_snr=beam_damage_snr)
+             for i, (angle, in_plane_rotation,
+                     translation, magnification, ctf_parameters) in enumerate(zip(angles, in_plane_rotations,
+                                                                                  translations, magnifications,
+                                                                                  ctf_series)))
+
+    # write (noisefree) projections as mrc stacks
+    filename_nf = os.path.join(save_path, 'noisefree_projections.mrc')
+    filename_pr = os.path.join(save_path, 'projections.mrc')
+
+    if streaming:
+        # each projection goes to disk as soon as it is finished, only the tasks in flight are kept in memory
+        failed = 0
+        shape = (image_size, image_size, len(angles))
+        with MRCStackWriter(filename_nf, shape) as noisefree_stack, MRCStackWriter(filename_pr, shape) as stack:
+            for i, result in enumerate(parallel_generator(tasks, nodes, verbose=verbosity)):
+                if result is None:
+                    failed += 1
+                    continue
+                noisefree_stack.write(i, result[0])
+                stack.write(i, result[1])
+    else:
+        results = Parallel(n_jobs=nodes, verbose=verbosity, prefer="threads")(tasks)
+        failed = results.count(None)
 
     sys.stdout.flush()
 
-    if results.count(None) == 0:
+    if failed == 0:
         print('All projection processes finished successfully')
     else:
-        print(f'{results.count(None)} rotation processes did not finish successfully')
+        print(f'{failed} rotation processes did not finish successfully')
 
-    # write (noisefree) projections as mrc stacks
-    filename_nf = os.path.join(save_path, 'noisefree_projections.mrc')
-    filename_pr = os.path.join(save_path, 'projections.mrc')
-    write(filename_nf, xp.stack([n for (n, p) in results], axis=2))
-    write(filename_pr, xp.stack([p for (n, p) in results], axis=2))
+    if not streaming:
+        write(filename_nf, xp.stack([n for (n, p) in results], axis=2))
+        write(filename_pr, xp.stack([p for (n, p) in results], axis=2))
 
     # todo create alignment and misalignment file, in reconstruction choice for alignment and misalignment
     # store alignment information
@@ -0,0 +1,266 @@
+'''
+Collision tests for random particle placement in the simulated sample (see
+L{pytom.simulation.MicrographModeller.generate_model}).
+
+A candidate location is first tested with a few probe voxels of the particle against the occupancy mask, which
+rejects most collisions in a crowded sample at the cost of a handful of lookups. Next, every placed object is
+stored as a pair of spheres around its center: a bounding sphere that contains all of its occupied voxels and a core
+sphere that only contains occupied voxels. The spheres are kept in a spatial hash, so a candidate location is
+compared to nearby objects only. Two objects whose bounding spheres are apart can not collide, two objects whose
+cores overlap certainly collide. Only candidates in between need the voxel exact test against the occupancy mask.
+'''
+from collections import defaultdict
+import numpy as np
+
+FREE, COLLISION, EXACT = 0, 1, 2
+
+
+def particle_spheres(occupancy):
+    """
+    Bounding and core sphere of a particle relative to its box center (index size // 2 along each dimension), which
+    is the voxel that ends up at the placement location.
+
+    @param occupancy: occupied voxels of the particle
+    @type  occupancy: L{np.ndarray}
+
+    @return: radius of the bounding sphere, radius of the core sphere
+    @rtype:  L{tuple} -> (L{float}, L{float})
+    """
+    from scipy.ndimage import distance_transform_edt
+
+    occupancy = np.asarray(occupancy, dtype=bool)
+    center = np.array([s // 2 for s in occupancy.shape])
+    coordinates = np.argwhere(occupancy)
+    if len(coordinates) == 0:
+        return 0., 0.
+    radius = np.sqrt(((coordinates - center) ** 2).sum(axis=1).max())
+
+    # pad so that the box border counts as unoccupied, edt gives the distance to the nearest unoccupied voxel
+    core = distance_transform_edt(np.pad(occupancy, 1))[tuple(center + 1)]
+    return float(radius), float(core)
+
+
+def probe_voxels(occupancy, number=32, seed=0):
+    """
+    Occupied voxels of a particle that are tested first, relative to the box center. The center (if occupied) and
+    the extremes along each axis are always included, the others are drawn at random.
+
+    @param occupancy: occupied voxels of the particle
+    @type  occupancy: L{np.ndarray}
+    @param number: number of probe voxels
+    @type  number: L{int}
+    @param seed: seed of the random selection, the global random state is not touched
+    @type  seed: L{int}
+
+    @return: probe coordinates (n, 3)
+    @rtype:  L{np.ndarray}
+    """
+    center = np.array([s // 2 for s in occupancy.shape])
+    coordinates = np.argwhere(occupancy) - center
+    if len(coordinates) <= number:
+        return coordinates
+
+    selection = [coordinates[:, d].argmin() for d in range(3)] + [coordinates[:, d].argmax() for d in range(3)]
+    if occupancy[tuple(center)]:
+        selection.append(np.flatnonzero((coordinates == 0).all(axis=1))[0])
+    rng = np.random.default_rng(seed)
+    selection += list(rng.choice(len(coordinates), number - len(selection), replace=False))
+    return coordinates[np.unique(selection)]
+
+
+def overlaps(occupancy_mask, bbox, occupancy):
+    """
+    Voxel exact collision test.
+
+    @param occupancy_mask: occupancy of the sample, nonzero where objects have been placed
+    @type  occupancy_mask: L{np.ndarray}
+    @param bbox: [[x_start, x_end], [y_start, y_end], [z_start, z_end]] of the particle box in the sample
+    @type  bbox: L{list}
+    @param occupancy: occupied voxels of the particle, same shape as bbox
+    @type  occupancy: L{np.ndarray}
+
+    @return: True if an occupied voxel of the particle is already occupied in the sample
+    @rtype:  L{bool}
+    """
+    region = occupancy_mask[bbox[0][0]:bbox[0][1], bbox[1][0]:bbox[1][1], bbox[2][0]:bbox[2][1]]
+    return bool(region[occupancy].any())
+
+
+class SphereIndex(object):
+    """
+    Spatial hash of the bounding and core spheres of the placed objects.
+    """
+    # margin for the core test, the cores of two objects share a voxel if they overlap by more than sqrt(3)
+    CORE_MARGIN = 2.
+
+    def __init__(self, cell_size):
+        """
+        @param cell_size: edge length of the hash cells in voxels, about the diameter of the typical object
+        @type  cell_size: L{float}
+        """
+        self._cell_size = float(max(cell_size, 1))
+        self._cells = defaultdict(list)
+        # objects that are larger than a cell (membranes) are compared to every candidate
+        self._large = []
+        self._max_radius = 0.
+        # center x, y, z, radius, core of all objects
+        self._spheres = np.zeros((64, 5))
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _cell(self, center):
+        return tuple(int(c // self._cell_size) for c in center)
+
+    def add(self, center, radius, core):
+        """
+        Add a placed object.
+
+        @param center: placement location
+        @type  center: L{tuple}
+        @param radius: bounding sphere radius
+        @type  radius: L{float}
+        @param core: core sphere radius
+        @type  core: L{float}
+        """
+        if self._size == len(self._spheres):
+            self._spheres = np.concatenate([self._spheres, np.zeros_like(self._spheres)])
+        self._spheres[self._size] = (*center, radius, core)
+
+        if radius > self._cell_size:
+            self._large.append(self._size)
+        else:
+            self._cells[self._cell(center)].append(self._size)
+            self._max_radius = max(self._max_radius, radius)
+        self._size += 1
+
+    def query(self, center, radius, core):
+        """
+        Test a candidate location.
+
+        @param center: candidate location
+        @type  center: L{tuple}
+        @param radius: bounding sphere radius of the candidate
+        @type  radius: L{float}
+        @param core: core sphere radius of the candidate
+        @type  core: L{float}
+
+        @return: FREE if no object can collide, COLLISION if an object certainly collides, otherwise EXACT
+        @rtype:  L{int}
+        """
+        reach = int(np.ceil((radius + self._max_radius) / self._cell_size))
+        x, y, z = self._cell(center)
+        cells = self._cells
+
+        indices = self._large + [i for dx in range(x - reach, x + reach + 1)
+                                 for dy in range(y - reach, y + reach + 1)
+                                 for dz in range(z - reach, z + reach + 1)
+                                 for i in cells.get((dx, dy, dz), ())]
+        if not indices:
+            return FREE
+
+        spheres = self._spheres[indices]
+        distance = np.sqrt(((spheres[:, :3] - center) ** 2).sum(axis=1))
+        # a core below the margin (e.g. 0 for hollow membranes) says nothing about occupied voxels
+        if core > self.CORE_MARGIN:
+            solid = spheres[:, 4] > self.CORE_MARGIN
+            if (distance[solid] < core + spheres[solid, 4] - self.CORE_MARGIN).any():
+                return COLLISION
+        if (distance <= radius + spheres[:, 3]).any():
+            return EXACT
+        return FREE
+
+
+def place(occupancy_mask, index, occupancy, spheres, draw_location, retries):
+    """
+    Find a random location where the particle does not collide with the placed objects. The bounding box of the
+    particle is [location - size // 2, location + size // 2 + size % 2] along each dimension.
+
+    @param occupancy_mask: occupancy of the sample, nonzero where objects have been placed
+    @type  occupancy_mask: L{np.ndarray}
+    @param index: spheres of the placed objects
+    @type  index: L{SphereIndex}
+    @param occupancy: occupied voxels of the particle
+    @type  occupancy: L{np.ndarray}
+    @param spheres: bounding and core radius of the particle (L{particle_spheres})
+    @type  spheres: L{tuple}
+    @param draw_location: function that returns a random candidate location (x, y, z)
+    @type  draw_location: L{function}
+    @param retries: number of candidates to try
+    @type  retries: L{int}
+
+    @return: location and bounding box of the particle, or None if no location was found
+    @rtype:  L{tuple}
+    """
+    probes = probe_voxels(occupancy).T
+
+    for _ in range(retries):
+        location = draw_location()
+        if occupancy_mask[tuple(probes + np.array(location)[:, np.newaxis])].any():
+            continue
+
+        status = index.query(location, *spheres)
+        if status == COLLISION:
+            continue
+
+        bbox = [[l - s // 2, l + s // 2 + s % 2] for l, s in zip(location, occupancy.shape)]
+        if status == EXACT and overlaps(occupancy_mask, bbox, occupancy):
+            continue
+        return location, bbox
+
+    return None
+
+
+def _benchmark(shape=(400, 400, 200), radius=25, fractions=(0.05, 0.15, 0.3), retries=1000, seed=0):
+    """
+    Particles placed per second with and without the sphere index, at different crowding levels given as the
+    fraction of the sample volume that the particles would occupy if all of them fit.
+    """
+    import time
+
+    size = 2 * radius + 5
+    grid = np.indices((size,) * 3) - size // 2
+    particle = ((grid[0] / 1.0) ** 2 + (grid[1] / 0.8) ** 2 + (grid[2] / 0.6) ** 2) <= radius ** 2
+    spheres = particle_spheres(particle)
+    number_of_particles = [int(f * np.prod(shape) / particle.sum()) for f in fractions]
+
+    print(f'{"crowding":>8} {"engine":>8} {"placed":>8} {"skipped":>8} {"particles/s":>12}')
+    for fraction, n in zip(fractions, number_of_particles):
+        for engine in ('exact', 'index'):
+            rng = np.random.default_rng(seed)
+            occupancy_mask = np.zeros(shape)
+            index = SphereIndex(size) if engine == 'index' else None
+
+            def draw_location():
+                return tuple(int(rng.integers(size // 2 + 1, s - size // 2 - 1)) for s in shape)
+
+            placed = 0
+            t = time.time()
+            for i in range(n):
+                if engine == 'index':
+                    result = place(occupancy_mask, index, particle, spheres, draw_location, retries)
+                else:
+                    result = None
+                    for _ in range(retries):
+                        location = draw_location()
+                        bbox = [[l - size // 2, l + size // 2 + size % 2] for l in location]
+                        # the test of generate_model before the index
+                        region = occupancy_mask[bbox[0][0]:bbox[0][1], bbox[1][0]:bbox[1][1], bbox[2][0]:bbox[2][1]]
+                        if (region * particle).sum() == 0:
+                            result = location, bbox
+                            break
+                if result is None:
+                    continue
+                location, bbox = result
+                occupancy_mask[bbox[0][0]:bbox[0][1], bbox[1][0]:bbox[1][1], bbox[2][0]:bbox[2][1]] += \
+                    particle * (i + 1)
+                if index is not None:
+                    index.add(location, *spheres)
+                placed += 1
+            elapsed = time.time() - t
+            print(f'{fraction:8.2f} {engine:>8} {placed:8d} {n - placed:8d} {placed / elapsed:12.1f}')
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -638,115 +638,208 @@ def split_data(data_length, cores):
         return indices
 
 
-def init(shared_data_, potential_shared_, solvent_shared_):
-    global shared_data
-    shared_data = shared_data_  # must be inherited, not passed as an argument to workers
-    global potential_shared
-    global solvent_shared
-    potential_shared = potential_shared_
-    solvent_shared = solvent_shared_
+def iasa_element_parameters(element):
+    """
+    Scattering parameters of an element for the IASA integration.
+
+    @param element: element symbol
+    @type  element: L{str}
+
+    @return: gaussian amplitudes a and widths b of the 5 gaussian scattering factor approximation, radius r_0 of the
+    displaced solvent and the truncation radius r of the atom potential
+    @rtype: L{tuple} -> (L{np.ndarray}, L{np.ndarray}, L{float}, L{float})
+    """
+    atom = element.upper()
+
+    sf = np.array(physics.scattering_factors[atom]['g'])
+    a = sf[0:5]
+    b = sf[5:10]
 
+    if atom in list(physics.volume_displaced):
+        r_0 = np.cbrt(physics.volume_displaced[atom] / (np.pi ** (3 / 2)))
+    else:  # If not H,C,O,N we assume the same volume displacement as for carbon
+        r_0 = np.cbrt(physics.volume_displaced['C'] / (np.pi ** (3 / 2)))
 
-def tonumpyarray(mp_arr, shape, dt):
-    return np.frombuffer(mp_arr.get_obj(), dtype=dt).reshape(shape)
+    # max radius over all gaussians (assuming symmetrical potential to 4.5 sigma truncation)
+    r2 = np.max(15 / (4 * np.pi ** 2 / b))
+    return a, b, r_0, np.sqrt(r2 / 3)
 
 
-def parallel_integrate(index, size, solvent_exclusion, voxel_size, dtype):
+def _iasa_boxes(centers, r, voxel_size):
+    """
+    Voxel boxes of a batch of atoms with the same truncation radius. Boxes all have the size of the largest box, the
+    voxels outside the box of an atom are marked invalid.
+
+    @return: first voxel index per atom and dimension (n, 3), voxel lower bounds relative to the atom centers
+    (n, 3, k), validity of the voxels (n, 3, k)
+    """
+    ind_min = ((centers - r) // voxel_size).astype(int)  # Smallest index to contain relevant potential x,y,z
+    ind_max = ((centers + r) // voxel_size).astype(int)  # Largest index to contain relevant potential x,y,z
+    k = (ind_max - ind_min).max() + 1
+    indices = ind_min[..., np.newaxis] + np.arange(k)
+    lower = indices * voxel_size - centers[..., np.newaxis]
+    return ind_min, lower, indices <= ind_max[..., np.newaxis]
+
+
+def _iasa_integrals(lower, valid, voxel_size, width):
+    """
+    Integral of a normalised 1d gaussian exp(-x^2 / width^2) over the voxels, i.e. difference of error functions.
+    """
     from scipy.special import erf
+    upper = lower + voxel_size
+    return np.sqrt(np.pi) * width / 2 * (erf(upper / width) - erf(lower / width)) * valid
 
-    # return np.ndarray view of mp.Array
-    potential = tonumpyarray(potential_shared, size, dtype)
-    solvent = tonumpyarray(solvent_shared, size, dtype)
 
-    print(f' --- process {mp.current_process().name} calculating {index[1]-index[0]} atoms')
+def _iasa_scatter(volume, x_start, ind_min, values):
+    """
+    Add the box values of a batch of atoms into the slab volume that starts at x index x_start. Voxels are binned with
+    a bincount over the (small) range of flat indices that the batch touches, atoms should be sorted along x.
+    """
+    n, k = values.shape[0], values.shape[1]
+    shape = volume.shape
+    indices = [ind_min[:, d, np.newaxis] + np.arange(k) for d in range(3)]
+    indices[0] = indices[0] - x_start
 
-    for i in range(index[0], index[1]):
-        # order = x y z e b o
-        x, y, z, element, b_factor, occupancy = shared_data[0][i], shared_data[1][i], shared_data[2][i], \
-                                                shared_data[3][i], shared_data[4][i], shared_data[5][i]
+    inside = [(i >= 0) & (i < s) for i, s in zip(indices, shape)]
+    weights = values * (inside[0][:, :, None, None] & inside[1][:, None, :, None] & inside[2][:, None, None, :])
+    indices = [np.clip(i, 0, s - 1) for i, s in zip(indices, shape)]
+    flat = (indices[0][:, :, None, None] * shape[1] + indices[1][:, None, :, None]) * shape[2] + \
+        indices[2][:, None, None, :]
 
-        # atom type
-        atom = element.upper()
-        # atom center
-        rc = [x, y, z]
+    start, stop = flat.min(), flat.max() + 1
+    volume.reshape(-1)[start:stop] += np.bincount((flat - start).ravel(), weights=weights.ravel(),
+                                                  minlength=stop - start).astype(volume.dtype)
 
-        sf = np.array(physics.scattering_factors[atom]['g'])
-        a = sf[0:5]
-        b = sf[5:10]
 
-        # b += (b_factor) # units in A
+def _iasa_slab(potential, solvent, x_start, centers, element_ids, element_names, voxel_size, batch_voxels=2**22):
+    """
+    Accumulate the potential (and solvent) of the atoms into a slab of the volume. The atoms are processed per
+    element in batches, so that the radial parameters are shared and all box integrals of a batch are computed at once.
+    """
+    for element_id, element in enumerate(element_names):
+        selection = np.flatnonzero(element_ids == element_id)
+        if len(selection) == 0:
+            continue
+        a, b, r_0, r = iasa_element_parameters(element)
+        coefficients = a / b ** (3 / 2)
+        # the gaussians exp(-4 pi^2 x^2 / b) have width sqrt(b) / (2 pi)
+        widths = np.sqrt(b) / (2 * np.pi)
+
+        k = int(2 * r / voxel_size) + 2
+        batch_size = max(1, batch_voxels // k ** 3)
+        for start in range(0, len(selection), batch_size):
+            ind_min, lower, valid = _iasa_boxes(centers[selection[start: start + batch_size]], r, voxel_size)
+
+            atom_potential = 0
+            for j in range(5):
+                integrals = _iasa_integrals(lower, valid, voxel_size, widths[j])
+                atom_potential = atom_potential + coefficients[j] * integrals[:, 0, :, None, None] * \
+                    integrals[:, 1, None, :, None] * integrals[:, 2, None, None, :]
+            _iasa_scatter(potential, x_start, ind_min, atom_potential)
+
+            if solvent is not None:
+                integrals = _iasa_integrals(lower, valid, voxel_size, r_0)
+                _iasa_scatter(solvent, x_start, ind_min, integrals[:, 0, :, None, None] *
+                              integrals[:, 1, None, :, None] * integrals[:, 2, None, None, :])
+
+
+def _iasa_slab_shared(x_range, shape, dtype, shared_names, centers, element_ids, element_names, voxel_size):
+    """
+    Process worker for L{iasa_accumulate}, writes its x range of the shared potential and solvent volumes.
+    """
+    from multiprocessing import shared_memory
 
-        if atom in list(physics.volume_displaced):
-            r_0 = np.cbrt(physics.volume_displaced[atom] / (np.pi ** (3 / 2)))
-        else:  # If not H,C,O,N we assume the same volume displacement as for carbon
-            r_0 = np.cbrt(physics.volume_displaced['C'] / (np.pi ** (3 / 2)))
+    buffers = [shared_memory.SharedMemory(name=name) if name is not None else None for name in shared_names]
+    volumes = [np.ndarray(shape, dtype=dtype, buffer=shm.buf)[x_range[0]:x_range[1]] if shm is not None else None
+               for shm in buffers]
+    _iasa_slab(volumes[0], volumes[1], x_range[0], centers, element_ids, element_names, voxel_size)
 
-        r2 = 0  # it was 15 / (1 / r_0 ** 2) before but this gives very high values for carbon
-        for j in range(5):
-            # Find the max radius over all gaussians (assuming symmetrical potential to 4.5 sigma truncation
-            # (corresponds to 10).
-            r2 = np.maximum(r2, 15 / (4 * np.pi ** 2 / b[j]))
-        # Radius of gaussian sphere
-        r = np.sqrt(r2 / 3)
+    del volumes
+    for shm in buffers:
+        if shm is not None:
+            shm.close()
 
-        ind_min = [int((c - r) // voxel_size) for c in rc]  # Smallest index to contain relevant potential x,y,z
-        ind_max = [int((c + r) // voxel_size) for c in rc]  # Largest index to contain relevant potential x,y,z
-        # Explicit real space coordinates for the max and min boundary of each voxel
-        x_min_bound = np.arange(ind_min[0], ind_max[0] + 1, 1) * voxel_size - rc[0]
-        x_max_bound = np.arange(ind_min[0] + 1, ind_max[0] + 2, 1) * voxel_size - rc[0]
-        y_min_bound = np.arange(ind_min[1], ind_max[1] + 1, 1) * voxel_size - rc[1]
-        y_max_bound = np.arange(ind_min[1] + 1, ind_max[1] + 2, 1) * voxel_size - rc[1]
-        z_min_bound = np.arange(ind_min[2], ind_max[2] + 1, 1) * voxel_size - rc[2]
-        z_max_bound = np.arange(ind_min[2] + 1, ind_max[2] + 2, 1) * voxel_size - rc[2]
 
-        # x_min_bound, y_min_bound, z_min_bound = np.meshgrid(x_min_bound, y_min_bound, z_min_bound, indexing='ij')
-        # x_max_bound, y_max_bound, z_max_bound = np.meshgrid(x_max_bound, y_max_bound, z_max_bound, indexing='ij')
+def iasa_accumulate(x_coordinates, y_coordinates, z_coordinates, elements, shape, voxel_size, solvent_exclusion=None,
+                    cores=1, dtype=np.float32):
+    """
+    Vectorized IASA integration of atoms into a volume. Atoms are grouped by element and their voxel integrals are
+    computed in batches. With multiple cores the volume is split into slabs along x that are filled by separate
+    processes directly in shared memory.
+
+    @param x_coordinates: x coordinates of the atoms in A
+    @type  x_coordinates: L{np.ndarray}
+    @param y_coordinates: y coordinates of the atoms in A
+    @type  y_coordinates: L{np.ndarray}
+    @param z_coordinates: z coordinates of the atoms in A
+    @type  z_coordinates: L{np.ndarray}
+    @param elements: element symbol of each atom
+    @type  elements: L{list}
+    @param shape: shape of the volume
+    @type  shape: L{tuple}
+    @param voxel_size: voxel size in A
+    @type  voxel_size: L{float}
+    @param solvent_exclusion: 'gaussian' to also integrate the displaced solvent volume
+    @type  solvent_exclusion: L{str}
+    @param cores: number of processes
+    @type  cores: L{int}
+    @param dtype: data type of the volumes
+    @type  dtype: L{np.dtype}
+
+    @return: integrated potential and displaced solvent (None if solvent_exclusion is not 'gaussian'), without unit
+    conversion
+    @rtype: L{tuple} -> (L{np.ndarray}, L{np.ndarray})
+    """
+    centers = np.stack([np.asarray(x_coordinates, dtype=np.float64), np.asarray(y_coordinates, dtype=np.float64),
+                        np.asarray(z_coordinates, dtype=np.float64)], axis=1)
+    element_names, element_ids = np.unique([e.upper() for e in elements], return_inverse=True)
+    element_ids = element_ids.reshape(-1)
+
+    # sorted along x, so that the batches touch a narrow range of the volume
+    order = np.argsort(centers[:, 0], kind='stable')
+    centers, element_ids = centers[order], element_ids[order]
+    shape = tuple(int(s) for s in shape)
+    gaussian = solvent_exclusion == 'gaussian'
+
+    if cores <= 1 or len(centers) < 2:
+        potential = np.zeros(shape, dtype=dtype)
+        solvent = np.zeros(shape, dtype=dtype) if gaussian else None
+        _iasa_slab(potential, solvent, 0, centers, element_ids, element_names, voxel_size)
+        return potential, solvent
+
+    from multiprocessing import shared_memory
+
+    # slabs with an equal number of atoms, every process gets the atoms whose box overlaps with its slab
+    radius = max(iasa_element_parameters(e)[3] for e in element_names)
+    bounds = [0] + [int(centers[int(i), 0] // voxel_size) for i in
+                    np.linspace(0, len(centers), cores + 1)[1:-1]] + [shape[0]]
+    bounds = sorted(set(min(max(b, 0), shape[0]) for b in bounds))
+    low = (centers[:, 0] - radius) // voxel_size
+    high = (centers[:, 0] + radius) // voxel_size
+
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    buffers = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(2 if gaussian else 1)]
+    try:
+        for shm in buffers:
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf)[:] = 0
+        names = [shm.name for shm in buffers] + [None] * (2 - len(buffers))
 
-        atom_potential = 0
+        arguments = []
+        for x0, x1 in zip(bounds[:-1], bounds[1:]):
+            selection = (high >= x0) & (low < x1)
+            arguments.append(((x0, x1), shape, dtype, names, centers[selection], element_ids[selection],
+                              element_names, voxel_size))
 
-        for j in range(5):
-            sqrt_b = np.sqrt(b[j])  # calculate only once
-            # Difference of error function == integrate over Gaussian
-            int_x = sqrt_b / (4 * np.sqrt(np.pi)) * (erf(x_max_bound * 2 * np.pi / sqrt_b) -
-                                                     erf(x_min_bound * 2 * np.pi / sqrt_b))
-            x_matrix = np.tile(int_x[:, np.newaxis, np.newaxis], [1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_y = sqrt_b / (4 * np.sqrt(np.pi)) * (erf(y_max_bound * 2 * np.pi / sqrt_b) -
-                                                     erf(y_min_bound * 2 * np.pi / sqrt_b))
-            y_matrix = np.tile(int_y[np.newaxis, :, np.newaxis], [ind_max[0] - ind_min[0] + 1,
-                                                                  1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_z = sqrt_b / (4 * np.sqrt(np.pi)) * (erf(z_max_bound * 2 * np.pi / sqrt_b) -
-                                                     erf(z_min_bound * 2 * np.pi / sqrt_b))
-            z_matrix = np.tile(int_z[np.newaxis, np.newaxis, :], [ind_max[0] - ind_min[0] + 1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  1])
-
-            atom_potential += a[j] / b[j] ** (3 / 2) * x_matrix * y_matrix * z_matrix
-
-        potential[ind_min[0]:ind_max[0] + 1, ind_min[1]:ind_max[1] + 1, ind_min[2]:ind_max[2] + 1] += \
-            atom_potential
+        with mp.Pool(min(cores, len(arguments))) as pool:
+            pool.starmap(_iasa_slab_shared, arguments)
 
-        if solvent_exclusion == 'gaussian':
-            # excluded solvent potential
-            int_x = np.sqrt(np.pi) * r_0 / 2 * (erf(x_max_bound / r_0) - erf(x_min_bound / r_0))
-            x_matrix = np.tile(int_x[:, np.newaxis, np.newaxis], [1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_y = np.sqrt(np.pi) * r_0 / 2 * (erf(y_max_bound / r_0) - erf(y_min_bound / r_0))
-            y_matrix = np.tile(int_y[np.newaxis, :, np.newaxis], [ind_max[0] - ind_min[0] + 1,
-                                                                  1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_z = np.sqrt(np.pi) * r_0 / 2 * (erf(z_max_bound / r_0) - erf(z_min_bound / r_0))
-            z_matrix = np.tile(int_z[np.newaxis, np.newaxis, :], [ind_max[0] - ind_min[0] + 1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  1])
-
-            solvent[ind_min[0]:ind_max[0] + 1, ind_min[1]:ind_max[1] + 1, ind_min[2]:ind_max[2] + 1] += (
-                    x_matrix * y_matrix * z_matrix)
-
-    print(f' --- process {mp.current_process().name} finished')
+        volumes = [np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy() for shm in buffers]
+    finally:
+        for shm in buffers:
+            shm.close()
+            shm.unlink()
+
+    return volumes[0], volumes[1] if gaussian else None
 
 
 def iasa_integration_parallel(filepath, voxel_size=1., oversampling=1, solvent_exclusion=None,
@@ -787,16 +880,9 @@ def iasa_integration_parallel(filepath, voxel_size=1., oversampling=1, solvent_e
     @rtype: L{tuple} -> (L{np.ndarray},) * 2 or L{np.ndarray}
 
     @author: Marten Chaillet
-
-    TODO: This function could be way more elegant using multiprocessing.shared_memory.SharedMemory. However this
-    TODO: functionality is only available from python3.8 onwards.
     """
     from pytom.agnostic.transform import resize
     from pytom.simulation.support import reduce_resolution_fourier
-    from functools import partial, reduce
-    from contextlib import closing
-    import operator
-    import ctypes
     import time
 
     assert (type(oversampling) is int) and (oversampling >= 1), print('oversampling parameter is not an integer')
@@ -835,43 +921,17 @@ def iasa_integration_parallel(filepath, voxel_size=1., oversampling=1, solvent_e
     sz_initial = tuple([int((d + 2 * extra_space) / voxel_size) for d in dimensions])
     difference = tuple([f - i for f, i in zip(sz_final, sz_initial)])
 
-    # split the data into fractions over the nodes
-    indices = split_data(len(x_coordinates), cores)  # adjust nodes in case n_atoms is smaller than n_cores
-
-    x_shared, y_shared, z_shared = mp.Array('d', x_coordinates, lock=False), \
-                                   mp.Array('d', y_coordinates, lock=False), \
-                                   mp.Array('d', z_coordinates, lock=False)
-    b_shared, o_shared = mp.Array('d', b_factors, lock=False), mp.Array('d', occupancies, lock=False)
-    e_shared = mp.Array(ctypes.c_wchar_p, elements, lock=False)
-    # element_to_id = {k: i for i, k in enumerate(physics.scattering_factors.keys())}
-    # e_shared = mp.Array('i', [element_to_id[e] for e in elements], lock=False)
-
-    print(f'Number of atoms to go over is {len(x_coordinates)} spread over {len(indices)} processes')
+    print(f'Number of atoms to go over is {len(x_coordinates)} spread over {cores} processes')
 
     start = time.time()
 
-    # create shared arrays
-    potential_shared = mp.Array(ctypes.c_float, reduce(operator.mul, sz_initial))
-    solvent_shared = mp.Array(ctypes.c_float, reduce(operator.mul, sz_initial))
-    # initialize them via numpy
-    dtype = np.float32
-    potential, solvent = tonumpyarray(potential_shared, sz_initial, dtype), \
-                                      tonumpyarray(solvent_shared, sz_initial, dtype)
-    potential[:], solvent[:] = np.zeros(sz_initial, dtype=dtype), \
-                                        np.zeros(sz_initial, dtype=dtype)
-
-    with closing(mp.Pool(len(indices), initializer=init, initargs=((x_shared, y_shared, z_shared,
-                                                                    e_shared, b_shared, o_shared),
-                                                                   potential_shared, solvent_shared))) as p:
-        p.map_async(partial(parallel_integrate,
-                                          size=sz_initial,
-                                          solvent_exclusion=solvent_exclusion,
-                                          voxel_size=voxel_size,
-                                          dtype=dtype), indices)
-    p.join()
+    # slabs of the volume are filled by the processes in shared memory
+    potential, solvent = iasa_accumulate(x_coordinates, y_coordinates, z_coordinates, elements, sz_initial,
+                                         voxel_size, solvent_exclusion=solvent_exclusion, cores=cores,
+                                         dtype=np.float32)
 
     end = time.time()
-    print(f'shared mp.Array elapsed {end - start}')
+    print(f'integration elapsed {end - start}')
 
     # convert potential to correct units and correct for solvent exclusion
     if solvent_exclusion == 'gaussian':
@@ -1198,7 +1258,6 @@ def iasa_integration(filepath, voxel_size=1., oversampling=1, solvent_exclusion=
     """
     from pytom.agnostic.transform import resize
     from pytom.simulation.support import reduce_resolution_fourier
-    from scipy.special import erf
 
     assert (type(oversampling) is int) and (oversampling >= 1), print('oversampling parameter is not an integer')
     if oversampling > 1:
@@ -1226,94 +1285,10 @@ def iasa_integration(filepath, voxel_size=1., oversampling=1, solvent_exclusion=
     # Define the volume of the protein
     sz = (int((largest_dimension + 2 * extra_space) / voxel_size), ) * 3
 
-    potential = np.zeros(sz)
-    if solvent_exclusion:
-        solvent = np.zeros(sz)
-
     print(f'Number of atoms to go over is {len(x_coordinates)}')
 
-    for i in range(len(elements)):
-        if np.mod(i, 5000) == 0:
-            print(f'Calculating atom {i}.')
-
-        atom = elements[i].upper()
-        b_factor = b_factors[i]
-        occupancy = occupancies[i]
-
-        sf = np.array(physics.scattering_factors[atom]['g'])
-        a = sf[0:5]
-        b = sf[5:10]
-
-        # b += (b_factor) # units in A
-
-        if atom in list(physics.volume_displaced):
-            r_0 = np.cbrt(physics.volume_displaced[atom] / (np.pi ** (3 / 2)))
-        else:  # If not H,C,O,N we assume the same volume displacement as for carbon
-            r_0 = np.cbrt(physics.volume_displaced['C'] / (np.pi ** (3 / 2)))
-
-        r2 = 0  # this was 15 / (1 / r_0 ** 2) before but this gives very high values for carbon
-        for j in range(5):
-            # Find the max radius over all gaussians (assuming symmetrical potential to 4.5 sigma truncation
-            # (corresponds to 10).
-            r2 = np.maximum(r2, 15 / (4 * np.pi ** 2 / b[j]))
-        # Radius of gaussian sphere
-        r = np.sqrt(r2 / 3)
-
-        rc = [x_coordinates[i], y_coordinates[i], z_coordinates[i]]  # atom center
-        ind_min = [int((c - r) // voxel_size) for c in rc]  # Smallest index to contain relevant potential x,y,z
-        ind_max = [int((c + r) // voxel_size) for c in rc]  # Largest index to contain relevant potential x,y,z
-        # Explicit real space coordinates for the max and min boundary of each voxel
-        x_min_bound = np.arange(ind_min[0], ind_max[0] + 1, 1) * voxel_size - rc[0]
-        x_max_bound = np.arange(ind_min[0] + 1, ind_max[0] + 2, 1) * voxel_size - rc[0]
-        y_min_bound = np.arange(ind_min[1], ind_max[1] + 1, 1) * voxel_size - rc[1]
-        y_max_bound = np.arange(ind_min[1] + 1, ind_max[1] + 2, 1) * voxel_size - rc[1]
-        z_min_bound = np.arange(ind_min[2], ind_max[2] + 1, 1) * voxel_size - rc[2]
-        z_max_bound = np.arange(ind_min[2] + 1, ind_max[2] + 2, 1) * voxel_size - rc[2]
-
-        atom_potential = 0
-
-        for j in range(5):
-            sqrt_b = np.sqrt(b[j])  # calculate only once
-            # Difference of error function == integrate over Gaussian
-            int_x = sqrt_b / (4 * np.sqrt(np.pi)) * (erf(x_max_bound * 2 * np.pi / sqrt_b) -
-                                                     erf(x_min_bound * 2 * np.pi / sqrt_b))
-            x_matrix = np.tile(int_x[:, np.newaxis, np.newaxis], [1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_y = sqrt_b / (4 * np.sqrt(np.pi)) * (erf(y_max_bound * 2 * np.pi / sqrt_b) -
-                                                     erf(y_min_bound * 2 * np.pi / sqrt_b))
-            y_matrix = np.tile(int_y[np.newaxis, :, np.newaxis], [ind_max[0] - ind_min[0] + 1,
-                                                                  1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_z = sqrt_b / (4 * np.sqrt(np.pi)) * (erf(z_max_bound * 2 * np.pi / sqrt_b) -
-                                                     erf(z_min_bound * 2 * np.pi / sqrt_b))
-            z_matrix = np.tile(int_z[np.newaxis, np.newaxis, :], [ind_max[0] - ind_min[0] + 1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  1])
-
-            atom_potential += a[j] / b[j] ** (3 / 2) * x_matrix * y_matrix * z_matrix
-
-        # scatter_add instead of +=
-        potential[ind_min[0]:ind_max[0] + 1, ind_min[1]:ind_max[1] + 1, ind_min[2]:ind_max[2] + 1] += atom_potential
-
-        if solvent_exclusion == 'gaussian':
-            # excluded solvent potential
-            int_x = np.sqrt(np.pi) * r_0 / 2 * (erf(x_max_bound / r_0) - erf(x_min_bound / r_0))
-            x_matrix = np.tile(int_x[:, np.newaxis, np.newaxis], [1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_y = np.sqrt(np.pi) * r_0 / 2 * (erf(y_max_bound / r_0) - erf(y_min_bound / r_0))
-            y_matrix = np.tile(int_y[np.newaxis, :, np.newaxis], [ind_max[0] - ind_min[0] + 1,
-                                                                  1,
-                                                                  ind_max[2] - ind_min[2] + 1])
-            int_z = np.sqrt(np.pi) * r_0 / 2 * (erf(z_max_bound / r_0) - erf(z_min_bound / r_0))
-            z_matrix = np.tile(int_z[np.newaxis, np.newaxis, :], [ind_max[0] - ind_min[0] + 1,
-                                                                  ind_max[1] - ind_min[1] + 1,
-                                                                  1])
-
-            solvent[ind_min[0]:ind_max[0] + 1, ind_min[1]:ind_max[1] + 1, ind_min[2]:ind_max[2] + 1] += (x_matrix *
-                                                                                                         y_matrix *
-                                                                                                         z_matrix)
+    potential, solvent = iasa_accumulate(x_coordinates, y_coordinates, z_coordinates, elements, sz, voxel_size,
+                                         solvent_exclusion=solvent_exclusion, dtype=np.float64)
 
     # Voxel volume
     dV = voxel_size ** 3
@@ -65,13 +65,12 @@ def printProcessStats():
     #print memory()
 
 def cleanUp():
-    from pytom.tools.memory import deleteWedgeStorage
-    deleteWedgeStorage()
+    volumeCache().clear()
 
 class Singleton(object):
     """
     Singleton: Abstract class used for singleton classes. Most children will be used for efficient memory management to speed up code.
-    @deprecated: Use python global class attribute instead such as for volume storage! 
+    @deprecated: Use a module level instance instead such as for the volume cache! 
     """
     
     def __new__(cls, *a, **k):
@@ -80,38 +79,227 @@ class Singleton(object):
             
         return cls._inst
 
-class VolumeStorage(object):
+class VolumeCache(object):
     """
-    VolumeStorage: volumes will store volume once read from disk in memory. 
-    This class is quite useful when reading and binning is repeated many times. Use for speed up! 
+    VolumeCache: Volumes read from disk, kept in memory up to a byte budget. When the budget is exceeded the least \
+    recently used (LRU) or the least frequently used (LFU) volumes are evicted. Entries are invalidated when the \
+    modification time or the size of their file changes. Volumes are copied into and out of the cache, so callers \
+    can modify the returned volumes. Use the process wide cache returned by L{volumeCache}.
     """
-    
-    _volumeList = {}
-    
-    def append(self,volume,key):
-        self._volumeList[key] = volume
-    
-    def get(self,key):
+
+    POLICIES = ('LRU', 'LFU')
+
+    def __init__(self, maxBytes=0, policy='LRU'):
         """
-        get: return a volume volume 
+        @param maxBytes: byte budget, 0 disables the cache
+        @type maxBytes: L{int}
+        @param policy: eviction policy, 'LRU' or 'LFU'
+        @type policy: L{str}
         """
-        
-        volume = self._volumeList[key]
-        
-        from pytom_volume import vol
-        
-        returnVolume = vol(volume.size_x(),volume.size_y(),volume.size_z())
-        
-        returnVolume.copyVolume(volume)
-        
-        return returnVolume
-    
-        
-        
+        from collections import OrderedDict
+        from threading import Lock
+
+        self._entries = OrderedDict()  # key -> [volume, bytes, file signature, hits], least recently used first
+        self._lock = Lock()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.configure(maxBytes, policy)
+
+    def configure(self, maxBytes, policy='LRU'):
+        """
+        configure: Change budget and policy, evicts volumes if the new budget is smaller
+        @param maxBytes: byte budget, 0 disables the cache
+        @type maxBytes: L{int}
+        @param policy: eviction policy, 'LRU' or 'LFU'
+        @type policy: L{str}
+        """
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown cache policy ' + str(policy) + ', use one of ' + str(self.POLICIES))
+
+        with self._lock:
+            self.maxBytes = int(maxBytes)
+            self.policy = policy
+            self._evict(0)
+
+    def isEnabled(self):
+        return self.maxBytes > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, numberBytes):
+        """
+        Evict volumes until numberBytes fit into the budget.
+        """
+        while self._entries and self._bytes + numberBytes > self.maxBytes:
+            if self.policy == 'LFU':
+                # fewest hits, the least recently used of those
+                key = min(self._entries, key=lambda k: self._entries[k][3])
+            else:
+                key = next(iter(self._entries))
+            self._bytes -= self._entries.pop(key)[1]
+            self.evictions += 1
+
+    def get(self, filename, key=None):
+        """
+        get: Copy of a cached volume
+        @param filename: file the volume was read from
+        @type filename: L{str}
+        @param key: further key of the volume, e.g. the binning
+        @return: the volume or None if it is not cached or its file changed
+        """
+        signature = _fileSignature(filename)
+        with self._lock:
+            entry = self._entries.get((filename, key))
+            if entry is not None and entry[2] != signature:
+                self._bytes -= self._entries.pop((filename, key))[1]
+                self.invalidations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end((filename, key))
+            entry[3] += 1
+            self.hits += 1
+            volume = entry[0]
+        return _copyVolume(volume)
+
+    def put(self, filename, volume, key=None, signature=None):
+        """
+        put: Store a copy of a volume, volumes larger than the budget are not stored
+        @param filename: file the volume was read from
+        @type filename: L{str}
+        @param volume: the volume
+        @type volume: L{pytom.lib.pytom_volume.vol} or L{numpy.ndarray}
+        @param key: further key of the volume, e.g. the binning
+        @param signature: signature of the file taken before the volume was read (see L{getVolume}), the current \
+        one if None
+        """
+        numberBytes = _volumeBytes(volume)
+        if numberBytes > self.maxBytes:
+            return
+
+        if signature is None:
+            signature = _fileSignature(filename)
+        volume = _copyVolume(volume)
+        with self._lock:
+            if (filename, key) in self._entries:
+                self._bytes -= self._entries.pop((filename, key))[1]
+            self._evict(numberBytes)
+            self._entries[(filename, key)] = [volume, numberBytes, signature, 0]
+            self._bytes += numberBytes
+
+    def getVolume(self, filename, loader, key=None):
+        """
+        getVolume: Cached volume of a file, read with loader on a miss. Calls loader directly if the cache is disabled.
+        @param filename: file the volume is read from
+        @type filename: L{str}
+        @param loader: function without arguments that returns the volume
+        @param key: further key of the volume, e.g. the binning
+        @return: the volume, owned by the caller
+        """
+        if not self.isEnabled():
+            return loader()
+
+        volume = self.get(filename, key)
+        if volume is None:
+            # a file that is rewritten while it is read is stored under its old signature and read again next time
+            signature = _fileSignature(filename)
+            volume = loader()
+            self.put(filename, volume, key, signature)
+        return volume
+
+    def clear(self):
+        """
+        clear: Remove all volumes, the counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        stats: Counters and usage of the cache
+        @rtype: L{dict}
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hitRate': self.hits / lookups if lookups else 0.,
+                'evictions': self.evictions, 'invalidations': self.invalidations, 'volumes': len(self._entries),
+                'bytes': self._bytes, 'maxBytes': self.maxBytes, 'policy': self.policy}
+
+
+def _fileSignature(filename):
+    try:
+        status = os.stat(filename)
+    except OSError:
+        return None
+    return status.st_mtime_ns, status.st_size
+
+
+def _volumeBytes(volume):
+    if hasattr(volume, 'nbytes'):
+        return volume.nbytes
+    # pytom volumes are single precision
+    return volume.size_x() * volume.size_y() * volume.size_z() * 4
+
+
+def _copyVolume(volume):
+    if hasattr(volume, 'copy'):
+        return volume.copy()
+
+    from pytom.lib.pytom_volume import vol
+    copy = vol(volume.size_x(), volume.size_y(), volume.size_z())
+    copy.copyVolume(volume)
+    return copy
+
+
+_volumeCache = None
+
+
+def volumeCache():
+    """
+    volumeCache: The volume cache of this process. It is disabled unless it is enabled with L{enableVolumeCache} or \
+    the environment variable PYTOM_VOLUME_CACHE is set to the budget in MB (optionally followed by ,LFU).
+    @rtype: L{VolumeCache}
+    """
+    global _volumeCache
+
+    if _volumeCache is None:
+        budget, policy = os.environ.get('PYTOM_VOLUME_CACHE', '0'), 'LRU'
+        if ',' in budget:
+            budget, policy = budget.split(',', 1)
+        _volumeCache = VolumeCache(int(float(budget) * 1024 ** 2), policy.strip().upper())
+    return _volumeCache
+
+
+def enableVolumeCache(maxBytes, policy='LRU'):
+    """
+    enableVolumeCache: Enable the volume cache of this process, which is used by the getVolume methods of \
+    L{pytom.basic.structures.Particle}, L{pytom.basic.structures.Reference} and L{pytom.basic.structures.Mask}
+    @param maxBytes: byte budget
+    @type maxBytes: L{int}
+    @param policy: eviction policy, 'LRU' or 'LFU'
+    @type policy: L{str}
+    @rtype: L{VolumeCache}
+    """
+    cache = volumeCache()
+    cache.configure(maxBytes, policy)
+    return cache
+
+
+def disableVolumeCache():
+    """
+    disableVolumeCache: Disable the volume cache of this process and free its volumes
+    """
+    volumeCache().configure(0)
+
 
 def read(filename,subregionX=0,subregionY=0,subregionZ=0,subregionXL=0,subregionYL=0,subregionZL=0,samplingX=0,samplingY=0,samplingZ=0,binningX=0,binningY=0,binningZ=0):
     """
-    read: Will read a file either from disk, or copy the identical volume if file has already been read from disk. -> no disk access for data. Saves a lot of time if binning is set! Consumes a lot of memory on the other hand!!!
+    read: Will read a file either from disk, or copy the identical volume from the volume cache (L{volumeCache}) if \
+    the file has already been read and the cache is enabled. Saves a lot of time if binning is set!
     @param filename: Filename of volume file. Will be used as key for later storing. 
     @param subregionX: Subregion start in X (default is 0)
     @param subregionY: Subregion start in Y (default is 0)
@@ -126,38 +314,9 @@ def read(filename,subregionX=0,subregionY=0,subregionZ=0,subregionXL=0,subregion
     @param binningY: Binning in Y (default is 0)
     @param binningZ: Binning in Z (default is 0)
     """
-    #import time
-    #print time.time()
-    volumeStorage = VolumeStorage()
-    key = filename + str(subregionX) + str(subregionY) + str(subregionZ) + str(subregionXL) + str(subregionYL) + str(subregionZL) + str(samplingX) + str(samplingY) + str(samplingZ) + str(binningX) + str(binningY) + str(binningZ)
-    
-    volume = None
-    
-    try:
-        volume = volumeStorage.get(key)
-    except:
-    
-        from pytom_volume import read as readFromDisk
-        
-        volume = readFromDisk(filename,int(subregionX),int(subregionY),int(subregionZ),
-                                       int(subregionXL),int(subregionYL),int(subregionZL),
-                                       int(samplingX),int(samplingY),int(samplingZ),
-                                       int(binningX),int(binningY),int(binningZ))
-        
-        volumeStorage.append(volume,key)
-    
-    return volume
-        
-        
-class WedgeStorage(VolumeStorage):
-    """
-    WedgeStorage: A storage used for wedge volumes only. Subclass of volume storage.
-    """
-    
-    
-class FilterStorage(VolumeStorage):
-    """
-    FilterStorage: A storage used for filters. 
-    """
-    
-    
+    from pytom.lib.pytom_volume import read as readFromDisk
+
+    arguments = tuple(int(a) for a in (subregionX, subregionY, subregionZ, subregionXL, subregionYL, subregionZL,
+                                       samplingX, samplingY, samplingZ, binningX, binningY, binningZ))
+
+    return volumeCache().getVolume(filename, lambda: readFromDisk(filename, *arguments), key=('read',) + arguments)
@@ -0,0 +1,182 @@
+'''
+CPU kernels of L{pytom.voltools.StaticVolume}.
+
+The volume is prefiltered once when the StaticVolume is created (filt_bspline interpolations), afterwards every
+transformation only evaluates the interpolant. The kernels take a stack of matrices and write into a preallocated
+stack of volumes, the parallel loop runs over matrices and x planes together so that small batches of large volumes
+and large batches of small volumes both use all threads.
+
+The results are the ones of scipy.ndimage.affine_transform with mode='constant': the matrices map output to input
+coordinates, coordinates outside the input volume give 0 and the spline coefficients are mirrored at the borders.
+Without numba the same transformations are computed with scipy, one matrix at a time.
+'''
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def prefilter(data: np.ndarray) -> np.ndarray:
+    """
+    prefilter: Cubic b-spline coefficients of a volume, the input of the filt_bspline interpolations
+    @param data: the volume
+    @type data: L{numpy.ndarray}
+    @rtype: L{numpy.ndarray} (float32)
+    """
+    from scipy.ndimage import spline_filter
+    return spline_filter(np.asarray(data, dtype=np.float32), order=3, output=np.float32, mode='mirror')
+
+
+def _order(interpolation: str) -> int:
+    return 1 if interpolation == 'linear' else 3
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(inline='always')
+    def _mirror(i, n):
+        # whole sample symmetric extension (d c b | a b c d | c b a), as scipy's mode='mirror'
+        if n == 1:
+            return 0
+        period = 2 * n - 2
+        i = abs(i) % period
+        return period - i if i >= n else i
+
+    @njit(inline='always')
+    def _inside(x, y, z, sx, sy, sz):
+        return 0. <= x <= sx - 1 and 0. <= y <= sy - 1 and 0. <= z <= sz - 1
+
+    @njit(inline='always')
+    def _bsplineWeights(t):
+        s = 1. - t
+        return s * s * s / 6., (4. - 6. * t * t + 3. * t * t * t) / 6., \
+            (1. + 3. * t + 3. * t * t - 3. * t * t * t) / 6., t * t * t / 6.
+
+    @njit(inline='always')
+    def _linear(src, x, y, z):
+        sx, sy, sz = src.shape
+        x0, y0, z0 = int(np.floor(x)), int(np.floor(y)), int(np.floor(z))
+        tx, ty, tz = x - x0, y - y0, z - z0
+        value = 0.
+        for i in range(2):
+            xi = min(max(x0 + i, 0), sx - 1)
+            wx = tx if i else 1. - tx
+            for j in range(2):
+                yj = min(max(y0 + j, 0), sy - 1)
+                wy = ty if j else 1. - ty
+                for k in range(2):
+                    zk = min(max(z0 + k, 0), sz - 1)
+                    value += wx * wy * (tz if k else 1. - tz) * src[xi, yj, zk]
+        return value
+
+    @njit(inline='always')
+    def _bspline(coefficients, x, y, z):
+        sx, sy, sz = coefficients.shape
+        x0, y0, z0 = int(np.floor(x)), int(np.floor(y)), int(np.floor(z))
+        wx = _bsplineWeights(x - x0)
+        wy = _bsplineWeights(y - y0)
+        wz = _bsplineWeights(z - z0)
+        z1, z2, z3, z4 = _mirror(z0 - 1, sz), _mirror(z0, sz), _mirror(z0 + 1, sz), _mirror(z0 + 2, sz)
+        value = 0.
+        for i in range(4):
+            xi = _mirror(x0 - 1 + i, sx)
+            for j in range(4):
+                c = coefficients[xi, _mirror(y0 - 1 + j, sy)]
+                value += wx[i] * wy[j] * (wz[0] * c[z1] + wz[1] * c[z2] + wz[2] * c[z3] + wz[3] * c[z4])
+        return value
+
+    @njit(parallel=True)
+    def _affine_many(src, matrices, dst, order):
+        sx, sy, sz = src.shape
+        n, dx, dy, dz = dst.shape
+        for index in prange(n * dx):
+            m = index // dx
+            ox = index % dx
+            mtx = matrices[m]
+            for oy in range(dy):
+                for oz in range(dz):
+                    # summed in the order of scipy, which decides on the same voxels at the borders
+                    x = mtx[0, 3] + mtx[0, 0] * ox + mtx[0, 1] * oy + mtx[0, 2] * oz
+                    y = mtx[1, 3] + mtx[1, 0] * ox + mtx[1, 1] * oy + mtx[1, 2] * oz
+                    z = mtx[2, 3] + mtx[2, 0] * ox + mtx[2, 1] * oy + mtx[2, 2] * oz
+                    if not _inside(x, y, z, sx, sy, sz):
+                        dst[m, ox, oy, oz] = 0.
+                    elif order == 1:
+                        dst[m, ox, oy, oz] = _linear(src, x, y, z)
+                    else:
+                        dst[m, ox, oy, oz] = _bspline(src, x, y, z)
+
+
+def affine_many(data: np.ndarray, matrices: np.ndarray, interpolation: str = 'linear',
+                output: np.ndarray = None) -> np.ndarray:
+    """
+    affine_many: Apply several affine transformations to one volume
+    @param data: the volume, already prefiltered (L{prefilter}) for the filt_bspline interpolations
+    @type data: L{numpy.ndarray}
+    @param matrices: (n, 4, 4) or (n, 3, 4) matrices, mapping output to input coordinates
+    @type matrices: L{numpy.ndarray}
+    @param interpolation: one of L{pytom.voltools.AVAILABLE_INTERPOLATIONS}
+    @type interpolation: L{str}
+    @param output: (n, *data.shape) float32 array for the results, allocated if None
+    @type output: L{numpy.ndarray}
+    @return: output
+    @rtype: L{numpy.ndarray}
+    """
+    matrices = np.asarray(matrices, dtype=np.float64)
+    if matrices.ndim != 3 or matrices.shape[1:] not in ((4, 4), (3, 4)):
+        raise ValueError('Expected a stack of (4, 4) or (3, 4) matrices')
+    if output is None:
+        output = np.empty((len(matrices),) + data.shape, dtype=np.float32)
+    elif output.shape != (len(matrices),) + data.shape:
+        raise ValueError(f'Output shape {output.shape} does not match {(len(matrices),) + data.shape}')
+
+    order = _order(interpolation)
+    if NUMBA_AVAILABLE and output.dtype == np.float32 and output.flags.c_contiguous:
+        _affine_many(np.ascontiguousarray(data, dtype=np.float32), matrices, output, order)
+    else:
+        from scipy.ndimage import affine_transform
+        for matrix, volume in zip(matrices, output):
+            affine_transform(data, matrix, output=volume, order=order, mode='constant', prefilter=False)
+    return output
+
+
+def _benchmark(size=64, batch=64, interpolation='filt_bspline'):
+    """
+    _benchmark: Time of rotating a volume with scipy (prefilter in every call, the former cpu StaticVolume) and with \
+    the batched kernel
+    @param size: edge length of the volume
+    @param batch: number of rotations
+    @param interpolation: interpolation
+    """
+    import time
+    from scipy.ndimage import affine_transform
+    from pytom.voltools.utils import transform_matrix
+
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((size,) * 3).astype(np.float32)
+    center = np.full(3, (size - 1) / 2., dtype=np.float32)
+    matrices = np.array([transform_matrix(rotation=tuple(angles), rotation_order='rzxz', center=center)
+                         for angles in rng.uniform(0, 360, (batch, 3))])
+
+    t = time.time()
+    reference = np.array([affine_transform(data, m, order=_order(interpolation),
+                                           prefilter=interpolation.startswith('filt_bspline')) for m in matrices])
+    scipyTime = time.time() - t
+
+    coefficients = prefilter(data) if interpolation.startswith('filt_bspline') else data
+    output = np.empty((batch,) + data.shape, dtype=np.float32)
+    affine_many(coefficients, matrices[:1], interpolation, output[:1])  # compile
+    t = time.time()
+    affine_many(coefficients, matrices, interpolation, output)
+    batchTime = time.time() - t
+
+    print(f'{batch} x {size}^3 {interpolation}: scipy {scipyTime:.2f} s, batched {batchTime:.2f} s '
+          f'(numba: {NUMBA_AVAILABLE}), max abs difference {np.abs(output - reference).max():.2e}')
+
+
+if __name__ == '__main__':
+    for interpolation in ('linear', 'filt_bspline'):
+        _benchmark(interpolation=interpolation)
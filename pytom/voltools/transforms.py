@@ -131,12 +131,10 @@ def affine(volume: np.ndarray,
 
             volume = np.atleast_3d(volume)
 
-            P = np.array(transform_m.flatten(),dtype=np.float32)
             dst = output if not output is None else np.zeros_like(volume,dtype=np.float32)
-            dim_src = np.array([volume.shape[0], volume.shape[1], volume.shape[2]], dtype=np.int32)
-            dim_dst = np.array([dst.shape[0], dst.shape[1], dst.shape[2]], dtype=np.int32)
 
-            fill_values_real_spline(volume, dst, P, dim_src, dim_dst)
+            # the kernel takes the matrix itself, the shapes come with the arrays
+            fill_values_real_spline(volume, dst, np.asarray(transform_m, dtype=np.float32))
 
             return dst
 
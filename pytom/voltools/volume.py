@@ -1,7 +1,9 @@
+import time
 import numpy as np
 import numpy as cp
 from typing import Tuple, Union
 from .transforms import _get_transform_kernel, _bspline_prefilter, affine
+from . import cpu
 from .utils import compute_elementwise_launch_dims, switch_to_device,\
     scale_matrix, shear_matrix, rotation_matrix, translation_matrix, transform_matrix, get_available_devices
 
@@ -59,6 +61,15 @@ class StaticVolume:
 
             del data
 
+        elif device == 'cpu' and self.is3D:
+            self.shape = data.shape
+            self.d_type = np.float32
+            # prefilter once instead of in every transformation
+            if interpolation.startswith('filt_bspline'):
+                self.data = cpu.prefilter(data)
+            else:
+                self.data = np.ascontiguousarray(data, dtype=np.float32)
+
         elif device == 'cpu':
             self.shape = data.shape
             self.data = data
@@ -100,9 +111,45 @@ class StaticVolume:
                 return None
         elif self.device.startswith('gpu') and not self.is3D:
             return affine(self.data, transform_m, self.interpolation, profile, output, self.device)
+        elif self.device == 'cpu' and self.is3D:
+            result = self.affine_many(np.asarray(transform_m)[np.newaxis], profile,
+                                      None if output is None else output[np.newaxis])
+            return output if output is not None else result[0]
         elif self.device == 'cpu':
             return affine(self.data, transform_m, self.interpolation, profile, output, self.device)
 
+    def affine_many(self, matrices: np.ndarray, profile: bool = False, output: cp.ndarray = None) -> cp.ndarray:
+        """
+        affine_many: Apply a stack of affine transformations, the results are written into one stack of volumes
+        @param matrices: (n, 4, 4) transformation matrices, see L{pytom.voltools.utils.transform_matrix}
+        @type matrices: L{numpy.ndarray}
+        @param profile: print the run time
+        @type profile: L{bool}
+        @param output: preallocated (n, *shape) float32 stack for the results, allocated if None
+        @type output: L{numpy.ndarray} or L{cupy.ndarray}
+        @return: output
+        """
+        if not self.is3D:
+            raise ValueError('affine_many requires a 3D volume')
+
+        n = len(matrices)
+        if output is None:
+            xp = np if self.device == 'cpu' else cp
+            output = xp.zeros((n,) + tuple(self.shape), dtype=self.d_type)
+
+        if self.device == 'cpu':
+            if profile:
+                t_start = time.time()
+
+            cpu.affine_many(self.data, matrices, self.interpolation, output)
+
+            if profile:
+                print(f'{n} transforms finished in {(time.time() - t_start) * 1000:.3f}ms')
+        else:
+            for matrix, volume in zip(matrices, output):
+                self.affine(matrix, profile, volume)
+        return output
+
     def transform(self, scale: Union[float, Tuple[float, float, float], np.ndarray] = None,
                   shear: Union[float, Tuple[float, float, float], np.ndarray] = None,
                   rotation: Union[Tuple[float, float, float], np.ndarray] = None,
@@ -22,6 +22,7 @@ else:
 # Remaining imports need to be done after setting GPU env variable:
 # * otherwise numpy/cupy backend and the device are globally set before the GPU env variable is specified
 from pytom.localization.extractPeaks import templateMatchingGPU, extractPeaks
+from pytom.localization.batched_template_matching import templateMatchingCPU
 from pytom.agnostic.io import read
 from pytom.basic.files import read_em
 from pytom.agnostic.structures import Wedge
@@ -72,6 +73,59 @@ class PytomTempMatchTest(unittest.TestCase):
         self.assertTrue(np.array(angle).sum() == .0,
                         msg='angle deviates too much from expected')
 
+    def test_localization_cpu_batched(self):
+        # template
+        template = read(self.testfilename, keepnumpy=True)
+
+        # make the mask the same as the template
+        mask = create_sphere(template.shape, template.shape[0] // 4)
+
+        # create a mock tomogram
+        sx, sy, sz = template.shape
+        volume = np.zeros((int(sx * 1.5), int(sy * 2), sz), dtype=np.float32)
+        volume[0:sx, 0:sy, :] = template.copy()
+
+        # set missing wedge
+        wedge = Wedge([30., 30.])
+
+        # load angles for orientational search
+        rotations = GlobalSampling('angles_90_26.em')
+
+        # batch size that does not divide the number of rotations
+        scores, angles, _, _ = templateMatchingCPU(volume, template, rotations, mask=mask, maskIsSphere=True,
+                                                   wedgeInfo=wedge, batchSize=3, numThreads=2, verboseMode=False)
+
+        ind = np.unravel_index(scores.argmax(), scores.shape)
+        angle = rotations[int(angles[ind])]
+
+        self.assertTrue(np.array(angle).sum() == .0,
+                        msg='angle deviates too much from expected')
+        self.assertTrue(scores.max() > 0.9, msg='peak of the batched template matching is too low')
+
+        # template rotated by a known angle of the list, rotated like the batched plan does
+        from scipy.ndimage import affine_transform
+        from pytom.voltools.utils import transform_matrix
+
+        expected = 5
+        phi, psi, theta = rotations[expected]
+        matrix = transform_matrix(rotation=(phi, theta, psi), rotation_order='rzxz',
+                                  center=tuple(s // 2 + s % 2 for s in template.shape))
+        volume[0:sx, 0:sy, :] = affine_transform(template, matrix, order=3, mode='constant')
+
+        scores, angles, _, _ = templateMatchingCPU(volume, template, rotations, mask=mask, maskIsSphere=True,
+                                                   wedgeInfo=wedge, batchSize=3, numThreads=2, verboseMode=False)
+        unbatchedScores, unbatchedAngles, _, _ = templateMatchingCPU(volume, template, rotations, mask=mask,
+                                                                     maskIsSphere=True, wedgeInfo=wedge,
+                                                                     batchSize=1, numThreads=1, verboseMode=False)
+
+        ind = np.unravel_index(scores.argmax(), scores.shape)
+        self.assertTrue(int(angles[ind]) == expected,
+                        msg=f'found angle {rotations[int(angles[ind])]} instead of {rotations[expected]}')
+        self.assertTrue(np.allclose(scores, unbatchedScores, atol=1e-5),
+                        msg='batched scores differ from the unbatched ones')
+        self.assertTrue((angles[scores > 0.5] == unbatchedAngles[scores > 0.5]).all(),
+                        msg='batched angles differ from the unbatched ones')
+
     @unittest.skipIf(only_run_cpu,
                      "The test below uses a GPU and cannot be executed in a docker environment")
     def test_localization_gpu(self):
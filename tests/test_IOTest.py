@@ -99,12 +99,81 @@ class pytom_IOTest(unittest.TestCase):
         self.assertTrue(len([data4]) == 1,
                         f'Error reading data from {fname}: epected { 1} lines, found {len([data4])} lines')
 
+    def read_subregion_mmap(self):
+        from pytom.agnostic.io import write, read
+
+        data = np.random.random((self.sx, self.sy, self.sz)).astype(np.float32)
+        for extension in ('em', 'mrc'):
+            fname = f'{self.outfolder}/dummy_subregion.{extension}'
+            write(fname, data)
+
+            view = read(fname, mmap=True, keepnumpy=True)
+            self.assertTrue(isinstance(view, np.memmap), 'mmap reading did not return a memory map')
+            self.assertTrue(np.abs(view - data).sum() < self.epsilon, f'mmap reading {fname} failed')
+
+            sub = read(fname, subregion=[1, 2, 3, 4, 5, 6], keepnumpy=True)
+            self.assertTrue(sub.shape == (4, 5, 6), f'subregion of {fname} has wrong shape {sub.shape}')
+            self.assertTrue(np.abs(sub - data[1:5, 2:7, 3:9]).sum() < self.epsilon,
+                            f'subregion reading {fname} failed')
+
+            full = read(fname, subregion=[0, 0, 0, 0, 0, 0], keepnumpy=True)
+            self.assertTrue(full.shape == data.shape, 'empty subregion should return the full volume')
+
+            with self.assertRaises(ValueError):
+                read(fname, subregion=[self.sx - 1, 0, 0, 2, 1, 1])
+
+    def read_subtomogram_stack(self):
+        from pytom.agnostic.io import read, read_size
+        from pytom.agnostic.subtomogram_stack import SubtomogramStackWriter, stack_path, particle_exists
+
+        data = [np.random.random((self.sx, self.sy, self.sz)).astype(np.float32) for _ in range(3)]
+        fnames = [f'{self.outfolder}/particle_{i}.em' for i in range(3)]
+        # two processes writing their own chunk
+        with SubtomogramStackWriter(stack_path(fnames[0]), 0) as stack:
+            stack.write(fnames[0], data[0])
+            stack.write(fnames[2], data[2])
+        with SubtomogramStackWriter(stack_path(fnames[1]), 1) as stack:
+            stack.write(fnames[1], data[1])
+
+        for fname, d in zip(fnames, data):
+            self.assertFalse(os.path.exists(fname))
+            self.assertTrue(particle_exists(fname))
+            self.assertEqual(list(read_size(fname)), list(d.shape))
+            self.assertTrue(np.abs(read(fname, keepnumpy=True) - d).sum() < self.epsilon,
+                            f'reading {fname} from the stack failed')
+        self.assertFalse(particle_exists(f'{self.outfolder}/particle_3.em'))
+
+        # appended to an existing chunk after the stack has been opened
+        extra = np.random.random((self.sx, self.sy, self.sz)).astype(np.float32)
+        with SubtomogramStackWriter(stack_path(fnames[0]), 0) as stack:
+            stack.write(f'{self.outfolder}/particle_3.em', extra)
+        self.assertTrue(np.abs(read(f'{self.outfolder}/particle_3.em', keepnumpy=True) - extra).sum() < self.epsilon,
+                        'reading an appended particle from the stack failed')
+        sub = read(fnames[2], subregion=[1, 2, 3, 4, 5, 6], keepnumpy=True)
+        self.assertTrue(np.abs(sub - data[2][1:5, 2:7, 3:9]).sum() < self.epsilon, 'subregion from the stack failed')
+
     def write_read_REC(self):
         self.data_write_read('rec')
 
     def write_read_ST(self):
         self.data_write_read('st')
 
+    def write_MRC_stack(self):
+        from pytom.agnostic.io import MRCStackWriter, read, read_header
+
+        fname = f'{self.outfolder}/stack.mrc'
+        data = np.random.random((self.sx, self.sy, self.sz)).astype(np.float32)
+
+        # sections can arrive in any order
+        with MRCStackWriter(fname, data.shape) as stack:
+            for i in np.random.permutation(self.sz):
+                stack.write(i, data[:, :, i])
+
+        data2 = read(fname, keepnumpy=True)
+        self.assertTrue(np.abs(data - data2).sum() < self.epsilon, f'reading {fname} failed')
+        header = read_header(fname)
+        self.assertTrue(abs(header[21] - data.mean()) < self.epsilon, 'mean in header is not correct')
+
     def read_LOG(self):
         from pytom.agnostic.io import read
         fname = f'testData/taSolution.log'
@@ -128,6 +197,21 @@ class pytom_IOTest(unittest.TestCase):
         data = read(fname, dtype=DATATYPE_METAFILE)
         self.assertTrue(data['TiltAngle'][9] == 10, f'reading {fname} failed')
 
+    def write_read_ParticleListXML(self):
+        from pytom.basic.structures import ParticleList, PyTomClass
+        from pytom.basic.particle_list_io import _syntheticParticleList
+
+        pl = _syntheticParticleList(25)
+        fname, reference = f'{self.outfolder}/particleList.xml', f'{self.outfolder}/particleList_tree.xml'
+        pl.toXMLFile(fname)
+        PyTomClass.toXMLFile(pl, reference)
+        self.assertTrue(open(fname).read() == open(reference).read(), 'streaming writer changed the xml file')
+
+        streamed, tree = ParticleList(), ParticleList()
+        streamed.fromXMLFile(fname)
+        PyTomClass.fromXMLFile(tree, fname)
+        self.assertTrue(len(streamed) == 25 and str(streamed) == str(tree), f'reading {fname} failed')
+
     def read_size(self):
         from pytom.agnostic.io import read_size
 
@@ -182,11 +266,15 @@ class pytom_IOTest(unittest.TestCase):
         self.readem()
         self.write_read_EM()
         self.write_read_MRC()
+        self.write_MRC_stack()
+        self.read_subregion_mmap()
+        self.read_subtomogram_stack()
         self.write_read_REC()
         self.write_read_ST()
         self.write_read_TXT()
         self.read_LOG()
         self.write_read_STAR()
+        self.write_read_ParticleListXML()
         self.read_size()
         self.read_tilt_angle()
         self.read_header()
@@ -175,6 +175,30 @@ class pytom_LocalTest(unittest.TestCase):
         self.assertTrue( b.getRecipient() == a.getRecipient(),
             msg='')
         
+    # Module ExtractionPeakResult------------------------------------
+    def test_find_particles_nms(self):
+        import numpy as np
+        from pytom.lib.pytom_numpy import npy2vol
+        from pytom.localization.extraction_peak_result import ExPeakResult
+
+        # three peaks, the third lies within the radius of the first
+        grid = np.mgrid[0:40, 0:40, 0:40]
+        scores = np.zeros((40, 40, 40), dtype=np.float32)
+        for center, height in (([10, 12, 14], 1.), ([28, 25, 20], .8), ([13, 12, 14], .9)):
+            distance = ((grid - np.array(center).reshape(3, 1, 1, 1)) ** 2).sum(axis=0)
+            scores = np.maximum(scores, height * np.exp(-distance / 2.)).astype(np.float32)
+
+        res = ExPeakResult()
+        res.result = npy2vol(np.asfortranarray(scores), 3)
+        res.orient = npy2vol(np.zeros((40, 40, 40), dtype=np.float32, order='F'), 3)
+        res.angleList = [[0, 0, 0]]
+
+        for method in ('nms', 'greedy'):
+            particles = res.findParticles(5, 10, minScore=.5, method=method)
+            self.assertTrue(len(particles) == 2, msg=f'{method}: expected 2 particles, found {len(particles)}')
+            self.assertTrue(particles[0].getPos() == [10, 12, 14] and particles[1].getPos() == [28, 25, 20],
+                            msg=f'{method}: particles picked at the wrong position')
+
     def test_call_template_matching(self):
         """
         This runs the unittest for template matching, which are located in template_match_test.py.
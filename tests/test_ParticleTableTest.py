@@ -0,0 +1,93 @@
+import unittest
+import numpy as np
+
+
+class pytom_ParticleTableTest(unittest.TestCase):
+
+    def setUp(self):
+        from pytom.basic.structures import Particle, ParticleList, Rotation, Shift, PickPosition, SingleTiltWedge
+        from pytom.basic.score import FLCFScore
+
+        self.pl = ParticleList('./')
+        wedge = SingleTiltWedge(30)
+        for i in range(40):
+            score = FLCFScore()
+            score.setValue(i / 40.)
+            p = Particle(f'particle_{i}.em', rotation=Rotation(i, 2 * i, 3 * i), shift=Shift(i, -i, 0.5),
+                         wedge=wedge, className=i % 3, score=score,
+                         pickPosition=PickPosition(i, i, i, originFilename=f'tomogram_{i % 4}.mrc'))
+            self.pl.append(p)
+
+    def test_splitByClass(self):
+        # reference: the XML queries that were used before
+        classes = sorted(set(str(c) for c in self.pl.xpath('/ParticleList/Particle/Class/@Name')))
+        # splitByClass sorts the list in place
+        splits = self.pl[:].splitByClass()
+        self.assertEqual(len(splits), len(classes))
+        for className, split in zip(classes, splits):
+            expected = [p.get('Filename') for p in
+                        self.pl.xpath('/ParticleList/Particle[Class/@Name="' + className + '"]')]
+            self.assertEqual([p.getFilename() for p in split], expected)
+            self.assertTrue(all(p.getClass() == className for p in split))
+
+    def test_independentWedges(self):
+        splits = self.pl[:].splitByClass()
+        wedges = [p.getWedge() for split in splits for p in split]
+        # one copy per split, not shared with the source list or the other splits
+        self.assertEqual(len(set(map(id, wedges))), len(splits))
+        self.assertFalse(set(map(id, wedges)) & set(id(p.getWedge()) for p in self.pl))
+        self.assertEqual(str(wedges[0]), str(self.pl[0].getWedge()))
+
+    def test_particlesFromTomoName(self):
+        pl = self.pl.particlesFromTomoName('tomogram_1.mrc')
+        self.assertEqual([p.getFilename() for p in pl], [f'particle_{i}.em' for i in range(1, 40, 4)])
+        self.assertEqual(pl['particle_5.em'].getShift().toVector(), [5., -5., 0.5])
+
+    def test_table(self):
+        table = self.pl.toTable()
+        self.assertEqual(table.row('particle_7.em'), 7)
+        selection = table.select(table['score'] > 0.5)
+        self.assertEqual(len(selection), 19)
+        best = selection.sort('score', descending=True).particle(0)
+        self.assertEqual(best.getFilename(), 'particle_39.em')
+        self.assertAlmostEqual(best.getScore().getValue(), 39 / 40.)
+        self.assertEqual(best.getRotation().toList(), [39., 78., 117.])
+        self.assertEqual(str(best.toXML().find('Class').get('Name')), '0')
+
+    def test_binary(self):
+        import io
+        import os
+        import tempfile
+        from pytom.basic.structures import ParticleList
+        from pytom.basic.particle_table import ParticleTable
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename, xmlFilename = os.path.join(directory, 'particles.plb'), os.path.join(directory, 'particles.xml')
+            self.pl.toBinaryFile(filename)
+            self.pl.toXMLFile(xmlFilename)
+            pl, reference = ParticleList(), ParticleList()
+            # recognizes the binary format
+            pl.fromXMLFile(filename)
+            reference.fromXMLFile(xmlFilename)
+            self.assertEqual(str(pl), str(reference))
+
+            table = ParticleTable.fromBinaryFile(filename)
+            self.assertEqual(table.particle(table.row('particle_11.em')).getRotation().toList(), [11., 22., 33.])
+
+        buffer = io.BytesIO()
+        self.pl.toTable().select(np.arange(10, 20)).toBinaryFile(buffer)
+        buffer.seek(0)
+        table = ParticleTable.fromBinaryFile(buffer)
+        self.assertEqual(len(table.tables['filename'].values), 10)
+        self.assertEqual([p.getFilename() for p in table.particles()], [f'particle_{i}.em' for i in range(10, 20)])
+
+    def runTest(self):
+        self.test_splitByClass()
+        self.test_independentWedges()
+        self.test_particlesFromTomoName()
+        self.test_table()
+        self.test_binary()
+
+
+if __name__ == '__main__':
+    unittest.main()
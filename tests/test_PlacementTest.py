@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+
+
+class pytom_PlacementTest(unittest.TestCase):
+
+    def setUp(self):
+        size = 81
+        grid = np.indices((size,) * 3) - size // 2
+        distance = np.sqrt((grid ** 2).sum(axis=0))
+        # hollow vesicle with a 6 voxel wall, its core sphere is 0
+        self.vesicle = (distance <= 35) & (distance > 29)
+        grid = np.indices((21,) * 3) - 10
+        self.particle = np.sqrt((grid ** 2).sum(axis=0)) <= 9
+
+        self.shape = (160, 160, 160)
+        self.center = (80, 80, 80)
+
+    def sample(self):
+        from pytom.simulation.placement import SphereIndex, particle_spheres
+
+        occupancy_mask = np.zeros(self.shape, dtype=np.int32)
+        index = SphereIndex(self.particle.shape[0])
+        bbox = [[c - s // 2, c + s // 2 + s % 2] for c, s in zip(self.center, self.vesicle.shape)]
+        occupancy_mask[bbox[0][0]:bbox[0][1], bbox[1][0]:bbox[1][1], bbox[2][0]:bbox[2][1]] += self.vesicle
+        index.add(self.center, *particle_spheres(self.vesicle))
+        # a solid particle next to the vesicle
+        location = (80, 80, 130)
+        bbox = [[c - s // 2, c + s // 2 + s % 2] for c, s in zip(location, self.particle.shape)]
+        occupancy_mask[bbox[0][0]:bbox[0][1], bbox[1][0]:bbox[1][1], bbox[2][0]:bbox[2][1]] += self.particle
+        index.add(location, *particle_spheres(self.particle))
+        return occupancy_mask, index
+
+    def test_query(self):
+        from pytom.simulation.placement import particle_spheres, overlaps, COLLISION, FREE
+
+        occupancy_mask, index = self.sample()
+        spheres = particle_spheres(self.particle)
+        self.assertEqual(particle_spheres(self.vesicle)[1], 0.)
+
+        # inside the lumen, in the wall, across the solid particle and outside
+        locations = [(82, 80, 80), (80, 80, 112), (80, 80, 128), (80, 80, 145), (80, 112, 80), (60, 60, 60)]
+        locations += [tuple(int(v) for v in l) for l in np.random.default_rng(0).integers(15, 145, (200, 3))]
+        for location in locations:
+            bbox = [[c - s // 2, c + s // 2 + s % 2] for c, s in zip(location, self.particle.shape)]
+            exact = overlaps(occupancy_mask, bbox, self.particle)
+            status = index.query(location, *spheres)
+            if status == COLLISION:
+                self.assertTrue(exact, location)
+            elif status == FREE:
+                self.assertFalse(exact, location)
+        self.assertFalse(overlaps(occupancy_mask, [[72, 93], [70, 91], [70, 91]], self.particle))
+        self.assertNotEqual(index.query((82, 80, 80), *spheres), COLLISION)
+
+    def test_place(self):
+        from pytom.simulation.placement import particle_spheres, overlaps, place
+
+        occupancy_mask, index = self.sample()
+        rng = np.random.default_rng(1)
+
+        def draw_location():
+            return tuple(int(v) for v in rng.integers(15, 145, 3))
+
+        for _ in range(20):
+            result = place(occupancy_mask, index, self.particle, particle_spheres(self.particle), draw_location,
+                           100)
+            self.assertIsNotNone(result)
+            location, bbox = result
+            self.assertFalse(overlaps(occupancy_mask, bbox, self.particle))
+            occupancy_mask[bbox[0][0]:bbox[0][1], bbox[1][0]:bbox[1][1], bbox[2][0]:bbox[2][1]] += self.particle
+            index.add(location, *particle_spheres(self.particle))
+
+    def runTest(self):
+        self.test_query()
+        self.test_place()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+import os
+
+
+class pytom_PolishingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outfolder = 'PolishingTest'
+        if not os.path.exists(self.outfolder):
+            os.mkdir(self.outfolder)
+
+    def tearDown(self):
+        from helper_functions import remove_tree
+        remove_tree(self.outfolder)
+
+    def test_cut_prefiltered(self):
+        from pytom.agnostic.io import write
+        from pytom.agnostic.transform import cut_from_projection
+        from pytom.polishing.reconstruct_local_alignment import load_projection, _polish_cache
+
+        fname = f'{self.outfolder}/projection.mrc'
+        write(fname, np.random.random((64, 60, 1)).astype(np.float32))
+        _polish_cache['projection'] = (None, None, None)
+        projection, coefficients = load_projection(fname)
+
+        # patches inside the projection, at its border and at subpixel positions
+        for center, size in (([32, 30], [20, 20]), ([5, 7], [16, 16]), ([60.3, 55.8], [12, 12]),
+                             ([31.5, 20.25], [21, 15])):
+            patch = cut_from_projection(coefficients, center, size, prefiltered=True)
+            expected = cut_from_projection(projection.squeeze(), center, size)
+            self.assertTrue(np.abs(patch - expected).max() < 1e-5,
+                            f'prefiltered patch at {center} differs from the unprefiltered one')
+
+        # the cached coefficients are reused for the same projection
+        self.assertTrue(load_projection(fname)[1] is coefficients)
+
+    def test_group_tasks(self):
+        from pytom.polishing.reconstruct_local_alignment import group_tasks_by_projection
+
+        # the projection filename is the 10th argument of a task
+        projections = [f'sorted_{i:02d}.mrc' for i in np.random.randint(0, 7, 101)]
+        tasks = [[None] * 9 + [projection, False, '', 0, 10] for projection in projections]
+
+        for workers in (1, 3, 64):
+            groups = group_tasks_by_projection(tasks, workers)
+            indices = sorted(i for group in groups for i in group)
+            self.assertEqual(indices, list(range(len(tasks))), 'a task is missing or appears more than once')
+            for group in groups:
+                self.assertTrue(len(group) > 0)
+                self.assertEqual(len(set(projections[i] for i in group)), 1,
+                                 'a group mixes tasks of different projections')
+
+    def runTest(self):
+        self.test_cut_prefiltered()
+        self.test_group_tasks()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+
+
+def per_atom_iasa(x_coordinates, y_coordinates, z_coordinates, elements, shape, voxel_size, solvent_exclusion=None):
+    """
+    The atom by atom integration of iasa_integration before it was vectorized.
+    """
+    from scipy.special import erf
+    import pytom.simulation.physics as physics
+
+    potential = np.zeros(shape)
+    solvent = np.zeros(shape) if solvent_exclusion == 'gaussian' else None
+
+    for i in range(len(elements)):
+        atom = elements[i].upper()
+        sf = np.array(physics.scattering_factors[atom]['g'])
+        a, b = sf[0:5], sf[5:10]
+        if atom in list(physics.volume_displaced):
+            r_0 = np.cbrt(physics.volume_displaced[atom] / (np.pi ** (3 / 2)))
+        else:
+            r_0 = np.cbrt(physics.volume_displaced['C'] / (np.pi ** (3 / 2)))
+        r = np.sqrt(np.max(15 / (4 * np.pi ** 2 / b)) / 3)
+
+        rc = [x_coordinates[i], y_coordinates[i], z_coordinates[i]]
+        ind_min = [int((c - r) // voxel_size) for c in rc]
+        ind_max = [int((c + r) // voxel_size) for c in rc]
+        lower = [np.arange(ind_min[d], ind_max[d] + 1) * voxel_size - rc[d] for d in range(3)]
+        upper = [l + voxel_size for l in lower]
+        box = tuple(slice(ind_min[d], ind_max[d] + 1) for d in range(3))
+
+        for j in range(5):
+            sqrt_b = np.sqrt(b[j])
+            x, y, z = [sqrt_b / (4 * np.sqrt(np.pi)) * (erf(u * 2 * np.pi / sqrt_b) - erf(l * 2 * np.pi / sqrt_b))
+                       for l, u in zip(lower, upper)]
+            potential[box] += a[j] / b[j] ** (3 / 2) * x[:, None, None] * y[None, :, None] * z[None, None, :]
+
+        if solvent is not None:
+            x, y, z = [np.sqrt(np.pi) * r_0 / 2 * (erf(u / r_0) - erf(l / r_0)) for l, u in zip(lower, upper)]
+            solvent[box] += x[:, None, None] * y[None, :, None] * z[None, None, :]
+
+    return potential, solvent
+
+
+class pytom_PotentialTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # S and P are not in the displaced volumes and fall back to carbon, close atoms share voxels
+        self.elements = ['C', 'N', 'O', 'S', 'C', 'H', 'N', 'C', 'O', 'C', 'P', 'H']
+        self.coordinates = rng.uniform(8, 22, (3, len(self.elements)))
+        self.shape = (32, 30, 28)
+        self.voxel_size = 1.
+
+    def compare(self, solvent_exclusion, cores):
+        from pytom.simulation.potential import iasa_accumulate
+
+        reference = per_atom_iasa(*self.coordinates, self.elements, self.shape, self.voxel_size, solvent_exclusion)
+        result = iasa_accumulate(*self.coordinates, self.elements, self.shape, self.voxel_size,
+                                 solvent_exclusion=solvent_exclusion, cores=cores)
+
+        for volume, expected in zip(result, reference):
+            if expected is None:
+                self.assertIsNone(volume)
+                continue
+            self.assertEqual(volume.shape, expected.shape)
+            self.assertTrue(np.abs(volume - expected).max() < 1e-6 * np.abs(expected).max(),
+                            f'iasa_accumulate differs from the per atom integration '
+                            f'(solvent_exclusion={solvent_exclusion}, cores={cores})')
+
+    def test_accumulate(self):
+        for cores in (1, 3):
+            self.compare(None, cores)
+            self.compare('gaussian', cores)
+
+    def runTest(self):
+        self.test_accumulate()
+
+
+if __name__ == '__main__':
+    unittest.main()
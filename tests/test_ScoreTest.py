@@ -114,6 +114,71 @@ class pytom_ScoreTest(unittest.TestCase):
         self.assertAlmostEqual( first=c, second=cf.getV(p[0],p[1],p[2]), places=1, 
             msg='Scoring coefficient and scoring function SOC inconsistent')
     
+    def test_bestAlignmentBatch(self):
+        """
+        batched alignment of several particles gives the peaks of the particle by particle alignment
+        """
+        from pytom.basic.structures import WedgeInfo
+        from pytom.angles.angleList import EulerAngleList
+        from pytom.simulation.SimpleSubtomogram import simpleSimulation
+
+        wedges = [self.wi, WedgeInfo(wedge_angle=30., cutoffRadius=0.0)]
+        particles = [self.s, simpleSimulation(volume=self.v, rotation=[10, 0, 10], shiftV=[1, 0, -2],
+                                              wedgeInfo=wedges[1], SNR=10.)]
+        rotations = EulerAngleList(0, 0, 0, 10, 10, 10, 30, 10, 30)
+
+        self.compareBatchAlignment(particles, wedges, 'False', rotations)
+
+    def test_bestAlignmentBatchWeighting(self):
+        """
+        batched alignment with a reference weighting gives the peaks of the particle by particle alignment
+        """
+        from pytom.basic.structures import WedgeInfo
+        from pytom.angles.angleList import EulerAngleList
+        from pytom.simulation.SimpleSubtomogram import simpleSimulation
+
+        wedges = [self.wi, WedgeInfo(wedge_angle=30., cutoffRadius=0.0)]
+        particles = [self.s, simpleSimulation(volume=self.v, rotation=[10, 0, 10], shiftV=[1, 0, -2],
+                                              wedgeInfo=wedges[1], SNR=10.)]
+        # reduced complex weighting, e.g. a wedge sum
+        weighting = WedgeInfo(wedge_angle=20., cutoffRadius=0.0).returnWedgeVolume(32, 32, 32, False)
+        self.compareBatchAlignment(particles, wedges, weighting, EulerAngleList(0, 0, 0, 10, 10, 10, 30, 10, 30))
+
+    def test_bestAlignmentBatchCTF(self):
+        """
+        batched alignment of particles with 3d ctf wedges, given as reduced and as full centered volumes
+        """
+        import os
+        import tempfile
+        from pytom.basic.structures import WedgeInfo, Wedge3dCTF
+        from pytom.angles.angleList import EulerAngleList
+        from pytom.simulation.SimpleSubtomogram import simpleSimulation
+
+        wedge = WedgeInfo(wedge_angle=30., cutoffRadius=0.0)
+        with tempfile.TemporaryDirectory() as directory:
+            reduced, full = os.path.join(directory, 'reduced.em'), os.path.join(directory, 'full.em')
+            wedge.returnWedgeVolume(32, 32, 32, False).write(reduced)
+            wedge.returnWedgeVolume(32, 32, 32, True).write(full)
+
+            wedges = [Wedge3dCTF(reduced), Wedge3dCTF(full)]
+            particles = [simpleSimulation(volume=self.v, rotation=[10, 0, 10], shiftV=[1, 0, -2], wedgeInfo=wedge,
+                                          SNR=10.), self.s]
+            self.compareBatchAlignment(particles, wedges, 'False', EulerAngleList(0, 0, 0, 10, 10, 10, 30, 10, 30))
+
+    def compareBatchAlignment(self, particles, wedges, weighting, rotations):
+        from pytom.basic.score import FLCFScore, xcfScore
+        from pytom.alignment.alignmentFunctions import bestAlignment, bestAlignmentBatch
+
+        for score in (FLCFScore, xcfScore):
+            peaks = bestAlignmentBatch(particles, self.v, weighting, wedges, rotations.getAllRotations()[:-1],
+                                       scoreObject=score())
+            for particle, wedge, batchPeak in zip(particles, wedges, peaks):
+                peak = bestAlignment(particle, self.v, weighting, wedge, rotations, scoreObject=score())
+                self.assertEqual(peak.getRotation().toVector(), batchPeak.getRotation().toVector())
+                self.assertAlmostEqual(peak.getScoreValue(), batchPeak.getScoreValue(), places=4)
+                for a, b in zip(peak.getShift().toVector(), batchPeak.getShift().toVector()):
+                    self.assertAlmostEqual(a, b, places=3)
+
     def RScore_Test(self):
         """
         """
@@ -122,6 +187,9 @@ class pytom_ScoreTest(unittest.TestCase):
         self.test_xcfScore()
         self.test_nxcfScore()
         self.test_flcfScore()
+        self.test_bestAlignmentBatch()
+        self.test_bestAlignmentBatchWeighting()
+        self.test_bestAlignmentBatchCTF()
         #self.test_socScore()
 
 if __name__ == '__main__':
@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+
+
+class pytom_StaticVolumeCPUTest(unittest.TestCase):
+
+    def setUp(self):
+        from pytom.voltools.utils import transform_matrix
+
+        rng = np.random.default_rng(0)
+        self.volume = rng.standard_normal((20, 22, 24)).astype(np.float32)
+        center = np.divide(np.subtract(self.volume.shape, 1), 2)
+        self.matrices = np.array([transform_matrix(rotation=tuple(angles), rotation_order='rzxz',
+                                                   translation=(1., -2., .5), center=center)
+                                  for angles in rng.uniform(0, 360, (5, 3))])
+
+    def test_affine_many(self):
+        from scipy.ndimage import affine_transform
+        from pytom.voltools import StaticVolume
+
+        for interpolation, order in (('linear', 1), ('bspline', 3), ('filt_bspline', 3)):
+            texture = StaticVolume(self.volume, interpolation=interpolation, device='cpu')
+            output = np.zeros((len(self.matrices),) + self.volume.shape, dtype=np.float32)
+            self.assertIs(texture.affine_many(self.matrices, output=output), output)
+
+            for matrix, result in zip(self.matrices, output):
+                # the former cpu implementation
+                expected = affine_transform(self.volume, matrix, order=order,
+                                            prefilter=interpolation.startswith('filt_bspline'))
+                self.assertLess(np.abs(result - expected).max(), 1e-4, interpolation)
+                self.assertLess(np.abs(texture.affine(matrix) - result).max(), 1e-6, interpolation)
+
+    def runTest(self):
+        self.test_affine_many()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+
+class pytom_VolumeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(4):
+            filename = os.path.join(self.directory.name, f'volume_{i}.npy')
+            np.save(filename, np.full((8, 8, 8), i, dtype=np.float32))
+            self.files.append(filename)
+        # 8 ** 3 float32 = 2048 bytes, the budget fits two volumes
+        self.volumeBytes = 8 ** 3 * 4
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, cache, filename):
+        return cache.getVolume(filename, lambda: np.load(filename))
+
+    def test_LRU(self):
+        from pytom.tools.memory import VolumeCache
+
+        cache = VolumeCache(2 * self.volumeBytes, 'LRU')
+        for filename in self.files[:2] + self.files[:1] + self.files[2:3]:
+            self.load(cache, filename)
+        # volume 1 is the least recently used
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 3, 1))
+        self.assertIsNone(cache.get(self.files[1]))
+        self.assertEqual(float(cache.get(self.files[0])[0, 0, 0]), 0.)
+
+        # returned volumes are copies
+        volume = self.load(cache, self.files[2])
+        volume[:] = -1
+        self.assertEqual(float(self.load(cache, self.files[2])[0, 0, 0]), 2.)
+        self.assertLessEqual(cache.stats()['bytes'], cache.maxBytes)
+
+    def test_LFU(self):
+        from pytom.tools.memory import VolumeCache
+
+        cache = VolumeCache(2 * self.volumeBytes, 'LFU')
+        for filename in self.files[:1] * 3 + self.files[1:3]:
+            self.load(cache, filename)
+        # volume 1 has fewer hits than volume 0, although it was used more recently
+        self.assertIsNotNone(cache.get(self.files[0]))
+        self.assertIsNone(cache.get(self.files[1]))
+
+    def test_invalidation(self):
+        from pytom.tools.memory import VolumeCache
+
+        cache = VolumeCache(4 * self.volumeBytes)
+        self.load(cache, self.files[0])
+        np.save(self.files[0], np.full((8, 8, 8), 7, dtype=np.float32))
+        status = os.stat(self.files[0])
+        os.utime(self.files[0], ns=(status.st_atime_ns, status.st_mtime_ns + 10 ** 9))
+        self.assertEqual(float(self.load(cache, self.files[0])[0, 0, 0]), 7.)
+        self.assertEqual(cache.invalidations, 1)
+
+    def test_rewriteDuringRead(self):
+        from pytom.tools.memory import VolumeCache
+
+        cache = VolumeCache(4 * self.volumeBytes)
+        filename = self.files[0]
+
+        def rewritingLoader():
+            volume = np.load(filename)
+            np.save(filename, np.full((8, 8, 8), 7, dtype=np.float32))
+            status = os.stat(filename)
+            os.utime(filename, ns=(status.st_atime_ns, status.st_mtime_ns + 10 ** 9))
+            return volume
+
+        self.assertEqual(float(cache.getVolume(filename, rewritingLoader)[0, 0, 0]), 0.)
+        # the stale volume must not be returned for the rewritten file
+        self.assertEqual(float(self.load(cache, filename)[0, 0, 0]), 7.)
+
+    def test_disabled(self):
+        from pytom.tools.memory import VolumeCache
+
+        cache = VolumeCache(0)
+        self.load(cache, self.files[0])
+        self.assertEqual(len(cache), 0)
+
+    def runTest(self):
+        self.test_LRU()
+        self.test_LFU()
+        self.test_invalidation()
+        self.test_rewriteDuringRead()
+        self.test_disabled()
+
+
+if __name__ == '__main__':
+    unittest.main()